@@ -0,0 +1,426 @@
+# Benchmarks for the Python hot paths, run on the fixture logs in benchmarks/fixtures
+#
+# Every benchmark runs its body a fixed number of times per repeat, on inputs derived only from the fixture logs,
+# so two runs on the same commit measure the same work. Results are written as JSON and two result files can be
+# compared to catch regressions. Result files hold "meta" (commit, python, shanten_calcs backend...) and "results",
+# the timings of every benchmark, compared on their min time per operation.
+#
+# Usage:
+#   python benchmarks/bench.py run [--out results.json] [--repeat N] [--filter NAME]
+#   python benchmarks/bench.py compare old.json new.json [--threshold 0.1]
+import argparse
+import bz2
+import datetime
+import glob
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FIXTURE_DIR = os.path.join(REPO_ROOT, "benchmarks", "fixtures")
+
+sys.path.insert(0, REPO_ROOT)
+
+import shanten_calcs  # noqa: E402
+from event_extractor import array_game_state, db_writer, tenhou_decision_extractor, tenhou_decoder, tenhou_game_state  # noqa: E402
+from haipai_extractor import extract  # noqa: E402
+
+
+def load_fixture_logs() -> dict[str, bytes]:
+    """
+    Loads the fixture logs, stored as hex strings of the bz2 compressed mjlog xml (same as tenhou_decoder.extract_bz2)
+    :return: {fixture name: compressed log}
+    """
+    logs = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.hex"))):
+        with open(path) as f:
+            logs[os.path.basename(path)[:-4]] = bytes.fromhex(f.read().strip())
+    return logs
+
+
+def replay(game_data: tenhou_decoder.GameData, update_winning: bool = False, on_event=None):
+    """
+    Replays a whole game
+    :param game_data: Decoded game
+    :param update_winning: Passed to GameState
+    :param on_event: Called with the game state after every event
+    :return: N/A
+    """
+    state = tenhou_game_state.GameState(game_data, update_winning=update_winning)
+    state.next_round()
+    while state.current_round is not None:
+        while state.get_next_event():
+            state.process_event()
+            if on_event is not None:
+                on_event(state)
+        state.next_round()
+
+
+def replay_array(game_data: tenhou_decoder.GameData, on_event=None):
+    """
+    Same as replay, on array_game_state
+    :param game_data: Decoded game
+    :param on_event: Called with the game state after every event
+    :return: N/A
+    """
+    state = array_game_state.ArrayGameState(game_data)
+    state.next_round()
+    while state.current_round is not None:
+        while state.get_next_event():
+            state.process_event()
+            if on_event is not None:
+                on_event(state)
+        state.next_round()
+
+
+class Fixtures:
+    """
+    Inputs of every benchmark, all derived from the fixture logs
+    """
+
+    def __init__(self):
+        self.compressed_logs = load_fixture_logs()
+        if not self.compressed_logs:
+            raise Exception(f"No fixture logs in {FIXTURE_DIR}")
+        self.logs = {name: bz2.decompress(log).decode() for name, log in self.compressed_logs.items()}
+
+        self.games = [tenhou_decoder.GameData(log) for log in self.logs.values()]
+
+        # Every 7th position of every game, shuffled with a fixed seed, for seek
+        self.positions = []
+        for game_no, game in enumerate(self.games):
+            for round_no, r in enumerate(game.rounds):
+                self.positions += [(game_no, round_no, event_no) for event_no in range(0, len(r.events) + 1, 7)]
+        random.Random(0).shuffle(self.positions)
+
+        # Every closed hand seen during the replays, 13 tile hands for waits, 14 tile hands for calc_all
+        self.hands = []
+
+        def collect(state: tenhou_game_state.GameState):
+            for player in state.current_round.players:
+                self.hands.append(shanten_calcs.convert_t14_to_full([i.tile for i in player.closed_hand]))
+
+        for game in self.games:
+            replay(game, on_event=collect)
+
+        self.hands_13 = [i for i in self.hands if sum(i) == 13]
+
+        # Compressed haipai rows of every game, for write_haipai_db
+        self.haipai_rows = [[extract.compress_arr(i) for i in extract.extract_game_haipais_v1(game)]
+                            for game in self.games]
+        self.hands_14 = [i for i in self.hands if sum(i) == 14]
+        self.hands_14_array = np.array(self.hands_14, dtype=np.int64)
+
+        # 13 tile hands with a triple, with the fourth copy drawn
+        self.ankan = []
+        for hand in self.hands_13:
+            for tile in range(34):
+                if hand[tile] == 3:
+                    hand = hand[:]
+                    hand[tile] += 1
+                    self.ankan.append((hand, tile))
+                    break
+
+
+def bench_calc_all(fx: Fixtures):
+    for hand in fx.hands_14:
+        shanten_calcs.calc_all(hand)
+    return len(fx.hands_14)
+
+
+def bench_ukeire_batch(fx: Fixtures):
+    shanten_calcs.ukeire_batch(fx.hands_14_array)
+    return len(fx.hands_14)
+
+
+def bench_get_hand_waits(fx: Fixtures):
+    shanten_calcs.wait_cache_clear()
+    for hand in fx.hands_13:
+        shanten_calcs.get_hand_waits(hand)
+    return len(fx.hands_13)
+
+
+def bench_check_ankan_after_riichi(fx: Fixtures):
+    shanten_calcs.wait_cache_clear()
+    for hand, tile in fx.ankan:
+        shanten_calcs.check_ankan_after_riichi(hand, tile)
+    return len(fx.ankan)
+
+
+def bench_decode(fx: Fixtures):
+    for log in fx.logs.values():
+        tenhou_decoder.GameData(log)
+    return len(fx.logs)
+
+
+def bench_decode_bz2(fx: Fixtures):
+    for log in fx.compressed_logs.values():
+        tenhou_decoder.GameData.from_bz2(log)
+    return len(fx.compressed_logs)
+
+
+def bench_replay(fx: Fixtures):
+    for game in fx.games:
+        replay(game)
+    return len(fx.games)
+
+
+def bench_replay_update_winning(fx: Fixtures):
+    shanten_calcs.wait_cache_clear()
+    for game in fx.games:
+        replay(game, update_winning=True)
+    return len(fx.games)
+
+
+def bench_dump_compressed(fx: Fixtures):
+    count = 0
+
+    def dump(state: tenhou_game_state.GameState):
+        nonlocal count
+        for pov in range(4):
+            state.dump_compressed(pov)
+        count += 4
+
+    for game in fx.games:
+        replay(game, on_event=dump)
+    return count
+
+
+def bench_replay_array(fx: Fixtures):
+    for game in fx.games:
+        replay_array(game)
+    return len(fx.games)
+
+
+def bench_dump_compressed_array(fx: Fixtures):
+    count = 0
+    out = np.zeros(array_game_state.DUMP_WIDTH, dtype=np.int16)
+
+    def dump(state: array_game_state.ArrayGameState):
+        nonlocal count
+        for pov in range(4):
+            state.dump_compressed(pov, out)
+        count += 4
+
+    for game in fx.games:
+        replay_array(game, on_event=dump)
+    return count
+
+
+def bench_dump_timeline(fx: Fixtures):
+    count = 0
+    for game in fx.games:
+        count += len(array_game_state.dump_timeline(game)[0])
+    return count
+
+
+def bench_seek(fx: Fixtures):
+    states = [tenhou_game_state.GameState(game) for game in fx.games]
+    for game_no, round_no, event_no in fx.positions:
+        states[game_no].seek(round_no, event_no)
+    return len(fx.positions)
+
+
+def bench_seek_array(fx: Fixtures):
+    states = [array_game_state.ArrayGameState(game) for game in fx.games]
+    for game_no, round_no, event_no in fx.positions:
+        states[game_no].seek(round_no, event_no)
+    return len(fx.positions)
+
+
+def bench_extract_decisions(fx: Fixtures):
+    count = 0
+    for game in fx.games:
+        count += len(tenhou_decision_extractor.extract_game(game)["label"])
+    return count
+
+
+def bench_dump_json(fx: Fixtures):
+    count = 0
+
+    def dump(state: tenhou_game_state.GameState):
+        nonlocal count
+        state.current_round.to_json_bytes(readable=True)
+        count += 1
+
+    for game in fx.games:
+        replay(game, on_event=dump)
+    return count
+
+
+def bench_extract_game_haipais_v1(fx: Fixtures):
+    count = 0
+    for game in fx.games:
+        for _ in extract.extract_game_haipais_v1(game):
+            count += 1
+    return count
+
+
+def bench_write_haipai_db(fx: Fixtures):
+    # 10 copies of the haipai rows of every game into a new db
+    count = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        with db_writer.BatchWriter(os.path.join(tmp, "haipai.db"), {"haipai": "log_id INT, board_state BLOB"},
+                                   report=False) as writer:
+            for copy in range(10):
+                for game_no, rows in enumerate(fx.haipai_rows):
+                    row_id = writer.add_game(f"{copy}-{game_no}")
+                    writer.add_rows("haipai", [(row_id, i) for i in rows])
+                    count += len(rows)
+    return count
+
+
+# name: (function, number of calls per repeat)
+# Each function returns how many operations (hands, games, dumps...) it did, for the per operation times
+BENCHMARKS = {
+    "calc_all": (bench_calc_all, 5),
+    "ukeire_batch": (bench_ukeire_batch, 20),
+    "get_hand_waits": (bench_get_hand_waits, 5),
+    "check_ankan_after_riichi": (bench_check_ankan_after_riichi, 5),
+    "decode": (bench_decode, 20),
+    "decode_bz2": (bench_decode_bz2, 20),
+    "replay": (bench_replay, 20),
+    "replay_update_winning": (bench_replay_update_winning, 5),
+    "dump_compressed": (bench_dump_compressed, 5),
+    "replay_array": (bench_replay_array, 20),
+    "dump_compressed_array": (bench_dump_compressed_array, 5),
+    "dump_timeline": (bench_dump_timeline, 5),
+    "seek": (bench_seek, 5),
+    "seek_array": (bench_seek_array, 5),
+    "extract_decisions": (bench_extract_decisions, 5),
+    "dump_json": (bench_dump_json, 5),
+    "extract_game_haipais_v1": (bench_extract_game_haipais_v1, 20),
+    "write_haipai_db": (bench_write_haipai_db, 5),
+}
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, check=True, capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def run(repeat: int, name_filter: str = None) -> dict:
+    """
+    Runs the benchmarks
+    :param repeat: Number of times each benchmark is timed
+    :param name_filter: Only run benchmarks whose name contains this
+    :return: Results, see the top of this file
+    """
+    shanten_calcs.preload()
+    fx = Fixtures()
+
+    results = {}
+    for name, (func, number) in BENCHMARKS.items():
+        if name_filter and name_filter not in name:
+            continue
+
+        func(fx)  # Warm up
+
+        times = []
+        ops = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ops = 0
+            for _ in range(number):
+                ops += func(fx)
+            times.append(time.perf_counter() - start)
+
+        results[name] = {
+            "repeat": repeat,
+            "number": number,
+            "ops": ops,
+            "min": min(times),
+            "median": statistics.median(times),
+            "min_per_op_us": min(times) / ops * 1e6,
+        }
+        print(f"{name:<28} min {min(times) * 1000:9.2f} ms, median {statistics.median(times) * 1000:9.2f} ms, "
+              f"{min(times) / ops * 1e6:9.2f} us/op ({ops} ops)")
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "time": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "shanten_backend": shanten_calcs.get_backend(),
+            "fixtures": sorted(fx.logs),
+        },
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict, threshold: float) -> bool:
+    """
+    Prints the change of every benchmark between two runs, using the min time per op
+    :param old: Results of the baseline run
+    :param new: Results of the new run
+    :param threshold: Relative slow down that counts as a regression, ex: 0.1 for 10%
+    :return: Whether there was no regression
+    """
+    print(f"old: {old['meta'].get('commit')} ({old['meta'].get('shanten_backend')})")
+    print(f"new: {new['meta'].get('commit')} ({new['meta'].get('shanten_backend')})")
+
+    ok = True
+    for name in sorted(set(old["results"]) | set(new["results"])):
+        if name not in old["results"] or name not in new["results"]:
+            print(f"{name:<28} only in {'new' if name in new['results'] else 'old'}")
+            continue
+
+        before = old["results"][name]["min_per_op_us"]
+        after = new["results"][name]["min_per_op_us"]
+        change = after / before - 1
+
+        flag = ""
+        if change > threshold:
+            flag = "REGRESSION"
+            ok = False
+        elif change < -threshold:
+            flag = "faster"
+
+        print(f"{name:<28} {before:10.2f} us -> {after:10.2f} us {change * 100:+8.1f}% {flag}")
+
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the Python hot paths")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Runs the benchmarks")
+    run_parser.add_argument("--out", help="Writes the results to this JSON file")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--filter", help="Only runs benchmarks whose name contains this")
+
+    compare_parser = sub.add_parser("compare", help="Compares two result files, exits with 1 on a regression")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run(args.repeat, args.filter)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(results, f, indent=2)
+    else:
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        sys.exit(0 if compare(old, new, args.threshold) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# Measures how long importing the table-backed modules takes in a fresh interpreter
+#
+# "import" is what every tool pays now that the tables are loaded on first use,
+# "import + preload" adds opening the flat shanten tables and loading the agari table, which the first calculation
+# pays otherwise. Neither is the cost of the old eager import (unpickling the shanten table and building the agari
+# dict), that code built its table paths as __file__ + "/../data/..." and cannot be imported on POSIX to be timed.
+#
+# Usage: python benchmarks/import_time.py [--runs N]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+CASES = {
+    "import shanten_calcs": "import shanten_calcs",
+    "import shanten_calcs + preload": "import shanten_calcs; shanten_calcs.preload()",
+    "import tenhou_game_state": "import event_extractor.tenhou_game_state",
+}
+
+
+def time_statement(statement: str, runs: int) -> list[float]:
+    """
+    Times a statement in fresh interpreters
+    :param statement: Python statement to time
+    :param runs: Number of interpreters to start
+    :return: Time taken by the statement in each run, in seconds
+    """
+    script = (f"import time\n"
+              f"start = time.perf_counter()\n"
+              f"{statement}\n"
+              f"print(time.perf_counter() - start)")
+
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", script], cwd=REPO_ROOT, check=True, capture_output=True, text=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times importing the table-backed modules")
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    # Make sure the flat shanten tables exist so the first run does not pay for building them
+    time_statement(CASES["import shanten_calcs + preload"], 1)
+
+    for name, statement in CASES.items():
+        times = time_statement(statement, args.runs)
+        print(f"{name:<32} median {statistics.median(times) * 1000:8.2f} ms, "
+              f"min {min(times) * 1000:8.2f} ms ({args.runs} runs)")
+
+
+if __name__ == "__main__":
+    main()
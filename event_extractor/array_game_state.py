@@ -0,0 +1,445 @@
+# Replay core backed by flat count buffers, an alternative to tenhou_game_state for bulk processing
+#
+# Every player's closed hand is kept as 34 / 37 counts and a bitmask of its tile ids, all updated in O(1) per event,
+# with the tiles visible to everyone (dora indicators, discards and called tiles) counted alongside. The 34 counts
+# live in a shanten_calcs.IncrementalShanten, which also keeps the hand key, so shanten and waits are read from it
+# instead of being recalculated from the counts. Melds and discards are kept in the layout of dump_compressed, and
+# the sorted closed hand is only built from the bitmask when it is dumped.
+#
+# Differences with tenhou_game_state.GameState:
+#   Closed hands are dumped sorted by tile id with the drawn tile(s) last, GameState sorts by tile type only so the
+#   order of copies of a same tile depends on the history of the hand
+#   A discard is tsumogiri only when it is the last drawn tile, GameState also counts discarding the last tile of the
+#   sorted hand after a call
+import copy
+
+import numpy as np
+
+import event_extractor.tenhou_decoder as tenhou_decoder
+import event_extractor.tenhou_game_state as tenhou_game_state
+import shanten_calcs
+
+# Number of columns of dump_compressed
+DUMP_WIDTH = 308
+
+# Offsets in a dump_compressed row
+_DORA_OFFSET = 14
+_PLAYER_OFFSET = 28
+_PLAYER_WIDTH = 70
+_HAND_OFFSET = 0
+_MELD_OFFSET = 14
+_DISCARD_OFFSET = 42
+
+_MAX_DISCARDS = 28
+
+_TILE_34 = [i >> 2 for i in range(136)]
+_TILE_37 = [tenhou_decoder.Tile(i).get_t37_idx() for i in range(136)]
+_TILE_BIT = [1 << i for i in range(136)]
+
+_MELD_TYPES = {
+    tenhou_decoder.CallTypes.CHII: 1,
+    tenhou_decoder.CallTypes.PON: 2,
+    tenhou_decoder.CallTypes.SHOUMINKAN: 3,
+    tenhou_decoder.CallTypes.DAIMINKAN: 3,
+    tenhou_decoder.CallTypes.ANKAN: 3,
+}
+
+
+def encode_discard(tile: int, called: bool, riichi_tile: bool) -> int:
+    """
+    Encodes a discard the same way as GameState.dump_compressed, operator precedence included
+    :param tile: Tile id (0-135)
+    :param called: Whether the discard was called
+    :param riichi_tile: Whether the discard declared riichi
+    :return: Encoded discard
+    """
+    return ((tile << 3) + (called << 2) + riichi_tile) << (1 + called)
+
+
+class ArrayRoundState:
+    def __init__(self, round_data: tenhou_decoder.Round, global_scores: list[int]):
+        self.round_no = round_data.round_no.round_no
+        self.honba_count = round_data.honba_count
+        self.rii_sticks = round_data.rii_sticks
+        self.oya = round_data.oya
+        self.global_scores = global_scores
+
+        self.tiles_left = 70
+
+        # Closed hands, hand34[player] is the count list of the player's IncrementalShanten
+        self._shanten = [shanten_calcs.IncrementalShanten() for _ in range(4)]
+        self.hand34 = [i.tiles for i in self._shanten]
+        self.hand37 = [[0 for _ in range(37)] for _ in range(4)]
+        self._held = [0, 0, 0, 0]  # Bit i set when tile id i is in the hand
+
+        # Tiles every player can see: dora indicators, discards and the tiles revealed by calls
+        self.visible34 = [0 for _ in range(34)]
+
+        self.dora = np.zeros(14, dtype=np.int16)
+        self.num_dora = 0
+
+        # Same layout as dump_compressed: (meld type, 4 tile ids) per meld
+        self.melds = np.zeros((4, 28), dtype=np.int16)
+        self.num_melds = [0, 0, 0, 0]
+        self.hand_is_open = [False, False, False, False]
+
+        # Encoded discards, see encode_discard, with the tile id and flags of every discard
+        self.discards = np.zeros((4, _MAX_DISCARDS), dtype=np.int16)
+        self.discard_tiles = [[], [], [], []]
+        self.discard_called = [[], [], [], []]
+        self.discard_riichi = [[], [], [], []]
+        self.discard_tsumogiri = [[], [], [], []]
+        self.num_discards = [0, 0, 0, 0]
+
+        self.is_rii = [False, False, False, False]
+
+        # Tiles drawn since the last discard that are still in the hand, and the sorted closed hands built by
+        # closed_hand, None when the hand changed since
+        self._drawn = [[], [], [], []]
+        self._closed = [None, None, None, None]
+        self._last_drawn = [-1, -1, -1, -1]
+        self._riichi_declared = [False, False, False, False]
+        self._last_discard = None  # (player, discard index)
+        self._tiles_called = False
+
+        for player, hand in enumerate(round_data.starting_hands):
+            for tile in hand:
+                self._add(player, tile.i)
+
+    def _add(self, player: int, tile: int):
+        self._shanten[player].add(_TILE_34[tile])
+        self.hand37[player][_TILE_37[tile]] += 1
+        self._held[player] |= _TILE_BIT[tile]
+        self._closed[player] = None
+
+    def _remove(self, player: int, tile: int):
+        self._shanten[player].remove(_TILE_34[tile])
+        self.hand37[player][_TILE_37[tile]] -= 1
+        self._held[player] &= ~_TILE_BIT[tile]
+        self._closed[player] = None
+
+    def draw_tile(self, ev: tenhou_decoder.DrawTileEvent):
+        self._add(ev.player, ev.tile.i)
+        self._drawn[ev.player].append(ev.tile.i)
+        self._last_drawn[ev.player] = ev.tile.i
+        self.tiles_left -= 1
+
+    def discard_tile(self, ev: tenhou_decoder.DiscardTileEvent):
+        player = ev.player
+        tile = ev.tile.i
+        idx = self.num_discards[player]
+        if idx == _MAX_DISCARDS:
+            raise Exception(f"Player {player} made more than {_MAX_DISCARDS} discards")
+
+        riichi_tile = self._riichi_declared[player]
+
+        self._remove(player, tile)
+        self.visible34[_TILE_34[tile]] += 1
+
+        self.discards[player, idx] = encode_discard(tile, False, riichi_tile)
+        self.discard_tiles[player].append(tile)
+        self.discard_called[player].append(False)
+        self.discard_riichi[player].append(riichi_tile)
+        self.discard_tsumogiri[player].append(self._last_drawn[player] == tile)
+        self.num_discards[player] = idx + 1
+
+        # The drawn tiles left are sorted into the hand
+        self._drawn[player] = []
+        self._last_drawn[player] = -1
+        self._riichi_declared[player] = False
+        self._last_discard = (player, idx)
+
+    def riichi(self, ev: tenhou_decoder.RiichiEvent):
+        self.is_rii[ev.player] = True
+        self._riichi_declared[ev.player] = True
+
+    def dora(self, ev: tenhou_decoder.DoraIndicatorEvent):
+        self.dora[self.num_dora] = ev.tile.i
+        self.num_dora += 1
+        self.visible34[ev.tile.tile] += 1
+
+    def call(self, ev: tenhou_decoder.CallTileEvent):
+        player = ev.player
+        meld = ev.meld
+
+        for t in meld.tiles:
+            tile = t.i
+            if self._held[player] & _TILE_BIT[tile]:
+                self._remove(player, tile)
+                self.visible34[_TILE_34[tile]] += 1
+                if tile in self._drawn[player]:
+                    self._drawn[player].remove(tile)
+                if tile == self._last_drawn[player]:
+                    self._last_drawn[player] = -1
+
+        row = self.melds[player]
+        tiles = [t.i for t in meld.tiles]
+        if meld.call_type == tenhou_decoder.CallTypes.SHOUMINKAN:
+            # Upgrades the pon in place
+            for i in range(self.num_melds[player]):
+                if row[5 * i + 1] >> 2 == tiles[0] >> 2:
+                    row[5 * i:5 * i + 5] = [3] + tiles
+                    break
+            else:
+                raise Exception(f"Could not find shouminkan call group: {meld.serialize(readable=True)}")
+        else:
+            i = self.num_melds[player]
+            row[5 * i:5 * i + 5] = [_MELD_TYPES[meld.call_type]] + tiles + [0 for _ in range(4 - len(tiles))]
+            self.num_melds[player] = i + 1
+
+        if meld.call_type != tenhou_decoder.CallTypes.ANKAN:
+            self.hand_is_open[player] = True
+            discarder, idx = self._last_discard
+            self.discard_called[discarder][idx] = True
+            self.discards[discarder, idx] = encode_discard(self.discard_tiles[discarder][idx], True,
+                                                           self.discard_riichi[discarder][idx])
+        self._tiles_called = True
+
+    def did_someone_call(self):
+        return self._tiles_called
+
+    def copy(self) -> 'ArrayRoundState':
+        """
+        :return: Independent copy of the round state, a few KB of arrays
+        """
+        ret = copy.copy(self)
+        for name in ("dora", "melds", "discards"):
+            setattr(ret, name, getattr(self, name).copy())
+        for name in ("visible34", "_held", "_closed", "num_melds", "hand_is_open", "num_discards", "is_rii",
+                     "_last_drawn", "_riichi_declared"):
+            setattr(ret, name, getattr(self, name)[:])
+        for name in ("hand37", "_drawn", "discard_tiles", "discard_called", "discard_riichi", "discard_tsumogiri"):
+            setattr(ret, name, [i[:] for i in getattr(self, name)])
+        ret._shanten = [i.copy() for i in self._shanten]
+        ret.hand34 = [i.tiles for i in ret._shanten]
+        return ret
+
+    def _closed_hand(self, player: int) -> list[int]:
+        closed = self._closed[player]
+        if closed is None:
+            drawn = self._drawn[player]
+            held = self._held[player]
+            for tile in drawn:
+                held &= ~_TILE_BIT[tile]
+
+            closed = []
+            while held:
+                low = held & -held
+                closed.append(low.bit_length() - 1)
+                held ^= low
+            closed += drawn
+            self._closed[player] = closed
+        return closed
+
+    def closed_hand(self, player: int) -> list[int]:
+        """
+        :param player: Player
+        :return: Tile ids of the closed hand, sorted with the tiles drawn since the last discard at the end
+        """
+        return self._closed_hand(player)[:]
+
+    def hand_key(self, player: int) -> tuple[int, int, int, int]:
+        """
+        :param player: Player
+        :return: Key of the closed hand, same as shanten_calcs.hand_key on hand34[player], kept up to date per tile
+        """
+        return self._shanten[player].key()
+
+    def unseen34(self, player: int) -> np.ndarray:
+        """
+        :param player: Point of view
+        :return: Count of every tile the player cannot see, in the wall or in the other players' hands
+        """
+        return 4 - np.array(self.visible34, dtype=np.int8) - np.array(self.hand34[player], dtype=np.int8)
+
+    def get_shanten(self, player: int) -> int:
+        return self._shanten[player].shanten()
+
+    def get_waits(self, player: int) -> list[int]:
+        """
+        :param player: Player with a 13 tile (or 10, 7...) hand
+        :return: Tiles (0-33) that complete the hand
+        """
+        return shanten_calcs.get_hand_waits_from_key(self.hand_key(player))
+
+
+class ArrayGameState:
+    """
+    Same stepping as tenhou_game_state.GameState, see the top of this file for the differences
+    """
+
+    # Events between two checkpoints of a round, see seek
+    CHECKPOINT_INTERVAL = 16
+
+    def __init__(self, data: tenhou_decoder.GameData):
+        self.data = data
+        self.rounds = data.rounds
+        self.current_round: ArrayRoundState | None = None
+
+        # Everyone starts off with 25k
+        self.scores = [250 for _ in range(4)]
+
+        self.round_no = -1
+        self.event_no = 0
+
+        # Scores at the start of every round, and {round_no: {event_no: round state}} taken while replaying
+        self._round_scores = None
+        self._checkpoints: dict[int, dict[int, ArrayRoundState]] = {}
+
+    def next_round(self):
+        if self.current_round is not None:
+            self.scores = [self.rounds[self.round_no].score_changes[i] + j for i, j in enumerate(self.scores)]
+
+        self.round_no += 1
+        if self.round_no >= len(self.data.rounds):
+            self.current_round = None
+            return
+
+        self.current_round = ArrayRoundState(self.data.rounds[self.round_no], self.scores)
+        self.event_no = 0
+
+    def get_next_event(self):
+        if self.current_round is None or self.event_no >= len(self.rounds[self.round_no].events):
+            return None
+        return self.rounds[self.round_no].events[self.event_no]
+
+    def process_event(self):
+        ev = self.get_next_event()
+        if ev is not None:
+            handler = _EVENT_HANDLERS.get(type(ev))
+            if handler is None:
+                raise Exception(f"Event {ev.event_name} is not handled")
+            elif handler is not _ignore_event:
+                handler(self.current_round, ev)
+
+        self.event_no += 1
+
+    def seek(self, round_no: int, event_no: int):
+        """
+        Moves to a position of the game, as if next_round and process_event had been called up to it
+        Restores the closest checkpoint before the position (or keeps going from the current position when closer),
+        then replays the remaining events. Checkpoints are taken every CHECKPOINT_INTERVAL events of the rounds
+        replayed by seek, so seeking around the same rounds gets cheaper
+        :param round_no: Index of the round
+        :param event_no: Number of events of the round already processed, get_next_event then returns this event
+        :return: N/A
+        """
+        if not 0 <= round_no < len(self.rounds) or not 0 <= event_no <= len(self.rounds[round_no].events):
+            raise ValueError(f"Invalid position: round {round_no}, event {event_no}")
+
+        checkpoints = self._checkpoints.get(round_no)
+        if checkpoints is None:
+            if self._round_scores is None:
+                self._round_scores = tenhou_game_state.get_round_scores(self.data)
+            checkpoints = self._checkpoints[round_no] = {
+                0: ArrayRoundState(self.rounds[round_no], self._round_scores[round_no])}
+
+        checkpoint_no = event_no - event_no % self.CHECKPOINT_INTERVAL
+        while checkpoint_no not in checkpoints:
+            checkpoint_no -= self.CHECKPOINT_INTERVAL
+
+        if self.current_round is None or round_no != self.round_no or not checkpoint_no <= self.event_no <= event_no:
+            self.round_no = round_no
+            self.scores = self._round_scores[round_no]
+            self.current_round = checkpoints[checkpoint_no].copy()
+            self.event_no = checkpoint_no
+
+        while self.event_no < event_no:
+            self.process_event()
+            if self.event_no % self.CHECKPOINT_INTERVAL == 0 and self.event_no not in checkpoints:
+                checkpoints[self.event_no] = self.current_round.copy()
+
+    def dump_compressed(self, player_pov: int, out: np.ndarray = None) -> np.ndarray | None:
+        """
+        Same layout and values as GameState.dump_compressed, apart from the order of the closed hands
+        :param player_pov: Which player is doing the action
+        :param out: Contiguous int16 row of at least DUMP_WIDTH to write into, defaults to a new array
+        :return: The row, None after the last round
+        """
+        r = self.current_round
+        if r is None:
+            return None
+
+        if out is None:
+            out = np.zeros(DUMP_WIDTH, dtype=np.int16)
+
+        # Metadata
+        out[:_DORA_OFFSET] = [r.round_no // 4, r.round_no % 4, player_pov, r.rii_sticks, r.honba_count, r.tiles_left,
+                              *self.scores, *r.is_rii]
+
+        out[_DORA_OFFSET:_PLAYER_OFFSET] = r.dora
+
+        players = out[_PLAYER_OFFSET:DUMP_WIDTH].reshape(4, _PLAYER_WIDTH)
+        players[:, _MELD_OFFSET:_DISCARD_OFFSET] = r.melds
+        players[:, _DISCARD_OFFSET:] = r.discards
+
+        hands = players[:, _HAND_OFFSET:_MELD_OFFSET]
+        hands[:] = 0
+        for i in range(4):
+            closed = r._closed_hand(i)
+            hands[i, :len(closed)] = closed
+
+        return out
+
+
+def timeline_length(data: tenhou_decoder.GameData, num_povs: int = 4) -> int:
+    """
+    :param data: Decoded game
+    :param num_povs: Number of povs dumped per event
+    :return: Number of rows of dump_timeline
+    """
+    return sum(len(r.events) for r in data.rounds) * num_povs
+
+
+def dump_timeline(data: tenhou_decoder.GameData, povs: tuple[int, ...] = (0, 1, 2, 3),
+                  out: np.ndarray = None, index_out: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Dumps the state after every event of a game, for every pov, in one contiguous array
+    Same rows as calling dump_compressed after every process_event of a replay
+    :param data: Decoded game
+    :param povs: Players to dump the state of
+    :param out: (N, DUMP_WIDTH) int16 array to write into, N >= timeline_length, defaults to a new array
+    :param index_out: (N, 3) int32 array to write the index into, defaults to a new array
+    :return: Dumped states, and the (round_no, event_no, pov) of every row, event_no being the last processed event
+    """
+    num_rows = timeline_length(data, len(povs))
+    out = np.zeros((num_rows, DUMP_WIDTH), dtype=np.int16) if out is None else out[:num_rows]
+    index = np.zeros((num_rows, 3), dtype=np.int32) if index_out is None else index_out[:num_rows]
+
+    state = ArrayGameState(data)
+    row = 0
+    state.next_round()
+    while state.current_round is not None:
+        start = row
+        while state.get_next_event():
+            state.process_event()
+
+            # Only the pov column differs between the povs
+            rows = out[row:row + len(povs)]
+            state.dump_compressed(povs[0], rows[0])
+            rows[1:] = rows[0]
+            rows[:, 2] = povs
+            row += len(povs)
+
+        index[start:row, 0] = state.round_no
+        index[start:row, 1] = np.repeat(np.arange(state.event_no, dtype=np.int32), len(povs))
+        index[start:row, 2] = np.tile(np.asarray(povs, dtype=np.int32), state.event_no)
+        state.next_round()
+
+    return out, index
+
+
+def _ignore_event(*_):
+    pass
+
+
+_EVENT_HANDLERS = {
+    tenhou_decoder.CallTileEvent: ArrayRoundState.call,
+    tenhou_decoder.DoraIndicatorEvent: ArrayRoundState.dora,
+    tenhou_decoder.DrawTileEvent: ArrayRoundState.draw_tile,
+    tenhou_decoder.DiscardTileEvent: ArrayRoundState.discard_tile,
+    tenhou_decoder.RiichiEvent: ArrayRoundState.riichi,
+    tenhou_decoder.RyuuyokuEvent: _ignore_event,
+    tenhou_decoder.RonEvent: _ignore_event,
+    tenhou_decoder.TsumoEvent: _ignore_event,
+}
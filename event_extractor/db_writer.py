@@ -0,0 +1,130 @@
+# Batched writer for the sqlite dbs of the extractors
+#
+# An extractor db has an `indexed` table with one row per processed log, whose rowid is the log_id of the rows the
+# log produced in the data tables (ex: haipai, riichi). Runs resume by skipping the logs already in `indexed`.
+# BatchWriter buffers the rows of whole games and writes them with executemany, one transaction per batch, so a
+# game's `indexed` row and its data rows are always committed together and a crash loses at most one batch.
+# Rowids are given explicitly (max + 1, like sqlite does) since executemany has no lastrowid.
+# The db is in WAL mode, and the indexes of the data tables are dropped during the bulk load and created on close.
+import sqlite3
+import time
+
+# Only applies when the db is created, sqlite can't change the page size of a db in WAL mode
+PAGE_SIZE = 16384
+
+PRAGMAS = (
+    "PRAGMA main.journal_mode = WAL",
+    "PRAGMA main.synchronous = NORMAL",  # Durable up to the last checkpoint, never corrupt, in WAL mode
+    "PRAGMA main.cache_size = -262144",  # 256 MB
+    "PRAGMA temp_store = MEMORY",  # Sorts of the index builds
+)
+
+
+class BatchWriter:
+    """
+    Writes the rows of an extractor db in large transactions, see the top of the file
+    """
+
+    def __init__(self, db_loc: str, tables: dict[str, str], indexes: dict[str, str] = None, batch_rows: int = 1 << 16,
+                 report: bool = True):
+        """
+        :param db_loc: Path to the db, created with the tables when it does not exist
+        :param tables: {name: column definitions} of the data tables, ex: {"haipai": "log_id INT, board_state BLOB"}
+        :param indexes: {name: "table(columns)"} created on close
+        :param batch_rows: Rows (of every table) buffered before a commit, only checked between games
+        :param report: Prints the progress on every commit
+        """
+        self.tables = tables
+        self.indexes = indexes or {}
+        self.batch_rows = batch_rows
+        self.report = report
+
+        self.conn = sqlite3.connect(db_loc)
+        if self.conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'indexed'").fetchone()[0] == 0:
+            self.conn.execute(f"PRAGMA main.page_size = {PAGE_SIZE}")
+            self.conn.execute("CREATE TABLE indexed(log_id TEXT primary key)")
+            for name, columns in tables.items():
+                self.conn.execute(f"CREATE TABLE {name}({columns})")
+        for pragma in PRAGMAS:
+            self.conn.execute(pragma)
+        for name in self.indexes:
+            self.conn.execute(f"DROP INDEX IF EXISTS main.{name}")
+        self.conn.commit()
+
+        self._next_rowid = self.conn.execute("SELECT COALESCE(MAX(rowid), 0) + 1 FROM indexed").fetchone()[0]
+        self._indexed = []
+        self._rows = {name: [] for name in tables}
+        self._num_rows = 0
+
+        self.games = 0
+        self.rows = 0
+        self._start = time.time()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # The current game may be partially buffered, everything since the last commit is dropped
+            self.conn.rollback()
+            self.conn.close()
+
+    def add_game(self, log_id: str) -> int:
+        """
+        Starts the rows of a game, commits the buffered games first when there are enough of them
+        :param log_id: Id of the log, added to the indexed table
+        :return: Rowid of the log in the indexed table, the log_id of its rows in the data tables
+        """
+        if self._num_rows >= self.batch_rows:
+            self.flush()
+
+        row_id = self._next_rowid
+        self._next_rowid += 1
+        self._indexed.append((row_id, log_id))
+        self._num_rows += 1
+        return row_id
+
+    def add_rows(self, table: str, rows: list[tuple]):
+        """
+        Adds rows of the current game
+        :param table: Name of the data table
+        :param rows: Rows, with every column of the table
+        :return: N/A
+        """
+        self._rows[table].extend(rows)
+        self._num_rows += len(rows)
+
+    def flush(self):
+        """
+        Writes and commits the buffered games
+        :return: N/A
+        """
+        cur = self.conn.cursor()
+        cur.executemany("INSERT INTO indexed(rowid, log_id) VALUES(?, ?)", self._indexed)
+        for name, rows in self._rows.items():
+            if rows:
+                cur.executemany(f"INSERT INTO {name} VALUES({', '.join('?' * len(rows[0]))})", rows)
+        self.conn.commit()
+
+        self.games += len(self._indexed)
+        self.rows += self._num_rows - len(self._indexed)
+        self._indexed = []
+        self._rows = {name: [] for name in self.tables}
+        self._num_rows = 0
+
+        if self.report:
+            elapsed = time.time() - self._start
+            print(f"Games: {self.games}, Rows: {self.rows}, {self.rows / max(elapsed, 1e-9):.0f} rows/s")
+
+    def close(self):
+        """
+        Commits the buffered games, then creates the indexes
+        :return: N/A
+        """
+        self.flush()
+        for name, columns in self.indexes.items():
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS main.{name} ON {columns}")
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,592 @@
+# Columnar binary cache of decoded games
+#
+# Decoding a log means decompressing it and parsing its xml, which dominates every pass over the corpus.
+# The cache stores every decoded game once as fixed width numpy arrays that can be memory mapped, in shards of games
+# (one .npy file per column per shard, ranges are relative to the shard):
+#   <shard>_events_*  one row per event (type, player, tile, data), in order, for every round of every game
+#   <shard>_rounds_*  one row per round (header, starting hands, results...) with the range of its events
+#   <shard>_games_*   one row per game with the range of its rounds
+#   index.db          sqlite: the shard and position of every log id with the few variable length fields of the game
+#                     (game type, lobby, players, results), the recorded shards, and the ryuukyoku strings
+# GameCache rebuilds GameData objects from the arrays, or hands out the raw arrays, without touching xml.
+# A build can be stopped and rerun, it resumes after the last recorded shard, see GameCacheWriter.
+#
+# Usage: python -m event_extractor.game_cache <games db> <cache dir> [workers]
+import collections
+import json
+import os
+import sqlite3
+import sys
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from event_extractor import tenhou_decoder
+
+VERSION = 2
+
+INDEX_DB = "index.db"
+
+# Event types
+EV_DORA = 0
+EV_DRAW = 1
+EV_DISCARD = 2
+EV_CALL = 3
+EV_RIICHI = 4
+EV_RON = 5
+EV_TSUMO = 6
+EV_RYUUKYOKU = 7
+
+_EVENT_TYPES = {
+    tenhou_decoder.DoraIndicatorEvent: EV_DORA,
+    tenhou_decoder.DrawTileEvent: EV_DRAW,
+    tenhou_decoder.DiscardTileEvent: EV_DISCARD,
+    tenhou_decoder.CallTileEvent: EV_CALL,
+    tenhou_decoder.RiichiEvent: EV_RIICHI,
+    tenhou_decoder.RonEvent: EV_RON,
+    tenhou_decoder.TsumoEvent: EV_TSUMO,
+    tenhou_decoder.RyuuyokuEvent: EV_RYUUKYOKU,
+}
+
+# Up to this many entries are kept for the variable length fields of a round
+_MAX_HAND = 14
+_MAX_AGARI = 3
+_MAX_RIICHI = 4
+
+# name: (dtype, shape of a row)
+EVENT_COLUMNS = {
+    "type": (np.uint8, ()),
+    "player": (np.int8, ()),  # -1 when the event has no player, from_player for ron
+    "tile": (np.int16, ()),  # Tile id (0-135), -1 when the event has no tile
+    "data": (np.int32, ()),  # Meld bits for calls, packed winners for ron, see _pack_players
+}
+
+ROUND_COLUMNS = {
+    "event_start": (np.int64, ()),
+    "event_count": (np.int32, ()),
+    "oya": (np.int8, ()),
+    "round_no": (np.int8, ()),
+    "honba": (np.int16, ()),
+    "rii_sticks": (np.int16, ()),
+    "hand_len": (np.int8, (4,)),  # -1 when the hand is missing from the log
+    "hands": (np.int16, (4, _MAX_HAND)),
+    "ryuukyoku": (np.int16, ()),  # 0 = False, 1 = True, 2 + i = string i of index.db
+    "ryuukyoku_tenpai": (np.int8, ()),  # Bitmask of players, -1 when not set
+    "riichi_count": (np.int8, ()),
+    "riichi_players": (np.int8, (_MAX_RIICHI,)),
+    "riichi_turns": (np.int16, (_MAX_RIICHI,)),
+    "turns": (np.int16, (4,)),
+    "score_count": (np.int8, ()),
+    "score_changes": (np.int32, (4,)),
+    "agari_count": (np.int8, ()),
+    "agari_tsumo": (np.bool_, (_MAX_AGARI,)),
+    "agari_player": (np.int8, (_MAX_AGARI,)),
+    "agari_points": (np.int32, (_MAX_AGARI,)),
+    "agari_from": (np.int8, (_MAX_AGARI,)),  # -1 for tsumo
+}
+
+GAME_COLUMNS = {
+    "round_start": (np.int64, ()),
+    "round_count": (np.int32, ()),
+}
+
+
+def _pack_players(players: list[int]) -> int:
+    """
+    Packs an ordered list of up to 3 players: count in the low 2 bits, then 2 bits per player
+    """
+    ret = len(players)
+    for i, player in enumerate(players):
+        ret |= player << (2 + 2 * i)
+    return ret
+
+
+def _unpack_players(packed: int) -> list[int]:
+    return [(packed >> (2 + 2 * i)) & 0x3 for i in range(packed & 0x3)]
+
+
+def _add_round(r: tenhou_decoder.Round, rows: dict[str, list], events: dict[str, list], strings: list[str]):
+    """
+    Appends a round to the round and event columns of a game
+    :param r: Round
+    :param rows: Round columns
+    :param events: Event columns
+    :param strings: Strings of the game, ryuukyoku types that are not booleans are added to it
+    :return: N/A
+    """
+    rows["event_start"].append(len(events["type"]))
+    rows["event_count"].append(len(r.events))
+    rows["oya"].append(r.oya)
+    rows["round_no"].append(r.round_no.round_no)
+    rows["honba"].append(r.honba_count)
+    rows["rii_sticks"].append(r.rii_sticks)
+
+    hand_len = [-1 for _ in range(4)]
+    hands = [[0 for _ in range(_MAX_HAND)] for _ in range(4)]
+    for i, hand in enumerate(r.starting_hands):
+        hand_len[i] = len(hand)
+        hands[i][:len(hand)] = [t.i for t in hand]
+    rows["hand_len"].append(hand_len)
+    rows["hands"].append(hands)
+
+    if r.ryuukyoku is False or r.ryuukyoku is True:
+        rows["ryuukyoku"].append(int(r.ryuukyoku))
+    else:
+        if r.ryuukyoku not in strings:
+            strings.append(r.ryuukyoku)
+        rows["ryuukyoku"].append(2 + strings.index(r.ryuukyoku))
+
+    tenpai = getattr(r, "ryuukyoku_tenpai", None)
+    rows["ryuukyoku_tenpai"].append(-1 if tenpai is None else sum(1 << i for i in tenpai))
+
+    rows["riichi_count"].append(len(r.riichi_players))
+    rows["riichi_players"].append((r.riichi_players + [-1 for _ in range(_MAX_RIICHI)])[:_MAX_RIICHI])
+    rows["riichi_turns"].append((r.riichi_turns + [-1 for _ in range(_MAX_RIICHI)])[:_MAX_RIICHI])
+    rows["turns"].append(r.turns)
+    rows["score_count"].append(len(r.score_changes))
+    rows["score_changes"].append((r.score_changes + [0 for _ in range(4)])[:4])
+
+    agari = r.agari + [None for _ in range(_MAX_AGARI)]
+    rows["agari_count"].append(len(r.agari))
+    rows["agari_tsumo"].append([a is not None and a.win_type == "TSUMO" for a in agari[:_MAX_AGARI]])
+    rows["agari_player"].append([-1 if a is None else a.winning_player for a in agari[:_MAX_AGARI]])
+    rows["agari_points"].append([0 if a is None else a.points for a in agari[:_MAX_AGARI]])
+    rows["agari_from"].append([-1 if a is None or a.from_player is None else a.from_player
+                               for a in agari[:_MAX_AGARI]])
+
+    for ev in r.events:
+        ev_type = _EVENT_TYPES[type(ev)]
+        player = -1
+        tile = -1
+        data = 0
+
+        if ev_type == EV_DORA:
+            tile = ev.tile.i
+        elif ev_type == EV_DRAW or ev_type == EV_DISCARD:
+            player = ev.player
+            tile = ev.tile.i
+        elif ev_type == EV_CALL:
+            player = ev.player
+            data = ev._call_data
+        elif ev_type == EV_RIICHI or ev_type == EV_TSUMO:
+            player = ev.player
+        elif ev_type == EV_RON:
+            player = ev.from_player
+            data = _pack_players(ev.winning_players)
+
+        events["type"].append(ev_type)
+        events["player"].append(player)
+        events["tile"].append(tile)
+        events["data"].append(data)
+
+
+def _to_arrays(rows: dict[str, list], columns: dict[str, tuple]) -> dict[str, np.ndarray]:
+    return {name: np.array(rows[name], dtype=dtype).reshape((-1,) + shape) for name, (dtype, shape) in columns.items()}
+
+
+def game_columns(game: tenhou_decoder.GameData) -> dict:
+    """
+    Converts a decoded game to the columns stored in the cache
+    A lot smaller than the GameData and cheap to pickle, ex: as the transform of tenhou_decoder.decode_many
+    :param game: Decoded game
+    :return: {"meta": players, results..., "strings": strings referenced by the ryuukyoku column,
+        "rounds": round columns, "events": event columns}, event_start is relative to the game
+    """
+    rows = {name: [] for name in ROUND_COLUMNS}
+    events = {name: [] for name in EVENT_COLUMNS}
+    strings = []
+    for r in game.rounds:
+        _add_round(r, rows, events, strings)
+
+    return {
+        "meta": {
+            "game_type": game.game_type,
+            "lobby": game.lobby,
+            "players": [[p.name, p.rank, p.sex, p.rate, p.connected] for p in game.players],
+            "results": [list(i) for i in game.results],
+        },
+        "strings": strings,
+        "rounds": _to_arrays(rows, ROUND_COLUMNS),
+        "events": _to_arrays(events, EVENT_COLUMNS),
+    }
+
+
+# index.db tables, see the top of the file
+_INDEX_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meta(key TEXT primary key, value)",
+    "CREATE TABLE IF NOT EXISTS shards(shard INT primary key, num_games INT, num_rounds INT, num_events INT)",
+    "CREATE TABLE IF NOT EXISTS strings(id INT primary key, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS games(log_id TEXT primary key, shard INT, game INT, game_type TEXT, lobby TEXT, "
+    "players TEXT, results TEXT)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS games_position ON games(shard, game)",
+)
+
+
+def _check_version(conn: sqlite3.Connection, cache_dir: str):
+    version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    if version is None or version[0] != VERSION:
+        raise Exception(f"Game cache version {version and version[0]} at {cache_dir} is not supported")
+
+
+def _shard_loc(cache_dir: str, shard: int, prefix: str, name: str) -> str:
+    return os.path.join(cache_dir, f"{shard:05d}_{prefix}_{name}.npy")
+
+
+class GameCacheWriter:
+    """
+    Converts decoded games into a cache directory, in shards of shard_size games saved as soon as they are full,
+    so memory stays bounded whatever the number of games
+    A shard is recorded in index.db only once its arrays are saved, so a crash loses at most the shard being filled.
+    Opening an existing cache appends to it, the games already in it can be skipped with `in`
+    """
+
+    def __init__(self, cache_dir: str, shard_size: int = 1 << 14):
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.cache_dir = cache_dir
+        self.shard_size = shard_size
+
+        self.conn = sqlite3.connect(os.path.join(cache_dir, INDEX_DB))
+        for statement in _INDEX_SCHEMA:
+            self.conn.execute(statement)
+        self.conn.execute("INSERT OR IGNORE INTO meta VALUES('version', ?)", (VERSION,))
+        self.conn.commit()
+        _check_version(self.conn, cache_dir)
+
+        self.strings = [value for value, in self.conn.execute("SELECT value FROM strings ORDER BY id")]
+        self._num_strings = len(self.strings)
+        # Files of a shard that was not recorded are overwritten
+        self._shard = self.conn.execute("SELECT COALESCE(MAX(shard), -1) + 1 FROM shards").fetchone()[0]
+        self._reset()
+
+    def _reset(self):
+        # Games of the shard being filled, concatenated when it is saved
+        self._games = []
+        self._events = {name: [] for name in EVENT_COLUMNS}
+        self._rounds = {name: [] for name in ROUND_COLUMNS}
+        self._game_rows = {name: [] for name in GAME_COLUMNS}
+        self._num_events = 0
+        self._num_rounds = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # The shard being filled is dropped, the recorded shards are kept for the next run
+            self.conn.close()
+
+    def __contains__(self, log_id: str):
+        """
+        :return: Whether the game is in a recorded shard
+        """
+        return self.conn.execute("SELECT 1 FROM games WHERE log_id = ?", (log_id,)).fetchone() is not None
+
+    def _string(self, s: str) -> int:
+        if s not in self.strings:
+            self.strings.append(s)
+        return self.strings.index(s)
+
+    def add(self, log_id: str, game: tenhou_decoder.GameData):
+        """
+        Adds a decoded game
+        :param log_id: Id of the log, used to look the game up
+        :param game: Decoded game
+        :return: N/A
+        """
+        self.add_columns(log_id, game_columns(game))
+
+    def add_columns(self, log_id: str, columns: dict):
+        """
+        Adds a game already converted by game_columns, saves the shard when it is full
+        :param log_id: Id of the log, used to look the game up
+        :param columns: Columns of the game
+        :return: N/A
+        """
+        rounds = dict(columns["rounds"])
+        events = columns["events"]
+        meta = columns["meta"]
+        num_rounds = len(rounds["oya"])
+
+        self._games.append((log_id, self._shard, len(self._games), meta["game_type"], meta["lobby"],
+                            json.dumps(meta["players"]), json.dumps(meta["results"])))
+        self._game_rows["round_start"].append(self._num_rounds)
+        self._game_rows["round_count"].append(num_rounds)
+
+        rounds["event_start"] = rounds["event_start"] + self._num_events
+        if columns["strings"]:
+            # Strings of the game to strings of the cache
+            remap = np.array([0, 1] + [2 + self._string(s) for s in columns["strings"]],
+                             dtype=ROUND_COLUMNS["ryuukyoku"][0])
+            rounds["ryuukyoku"] = remap[rounds["ryuukyoku"]]
+
+        for name in ROUND_COLUMNS:
+            self._rounds[name].append(rounds[name])
+        for name in EVENT_COLUMNS:
+            self._events[name].append(events[name])
+
+        self._num_events += len(events["type"])
+        self._num_rounds += num_rounds
+
+        if len(self._games) == self.shard_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Saves the shard being filled, then records it and its games in index.db
+        :return: N/A
+        """
+        if not self._games:
+            return
+
+        for prefix, columns, parts in (("events", EVENT_COLUMNS, self._events),
+                                       ("rounds", ROUND_COLUMNS, self._rounds)):
+            for name, (dtype, shape) in columns.items():
+                arr = np.concatenate(parts[name]) if parts[name] else np.zeros((0,) + shape, dtype=dtype)
+                np.save(_shard_loc(self.cache_dir, self._shard, prefix, name), arr.astype(dtype, copy=False))
+
+        for name, arr in _to_arrays(self._game_rows, GAME_COLUMNS).items():
+            np.save(_shard_loc(self.cache_dir, self._shard, "games", name), arr)
+
+        # One transaction, a shard is either fully recorded or not at all
+        cur = self.conn.cursor()
+        cur.executemany("INSERT INTO strings VALUES(?, ?)",
+                        list(enumerate(self.strings))[self._num_strings:])
+        cur.executemany("INSERT INTO games VALUES(?, ?, ?, ?, ?, ?, ?)", self._games)
+        cur.execute("INSERT INTO shards VALUES(?, ?, ?, ?)",
+                    (self._shard, len(self._games), self._num_rounds, self._num_events))
+        self.conn.commit()
+
+        self._num_strings = len(self.strings)
+        self._shard += 1
+        self._reset()
+
+    def close(self):
+        """
+        Saves the last shard
+        :return: N/A
+        """
+        self.flush()
+        self.conn.close()
+
+
+class GameCache:
+    """
+    Reads a cache directory written by GameCacheWriter
+    Games are looked up in index.db and the arrays of a shard are memory mapped on first use, so opening a cache
+    loads nothing but the ryuukyoku strings
+    """
+
+    def __init__(self, cache_dir: str):
+        index_loc = os.path.join(cache_dir, INDEX_DB)
+        if not os.path.exists(index_loc):
+            raise Exception(f"No game cache at {cache_dir}")
+
+        self.cache_dir = cache_dir
+        self.conn = sqlite3.connect(f"file:{index_loc}?mode=ro", uri=True)
+        _check_version(self.conn, cache_dir)
+
+        self._strings = [value for value, in self.conn.execute("SELECT value FROM strings ORDER BY id")]
+        self._shards = {}
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    def __contains__(self, log_id: str):
+        return self.conn.execute("SELECT 1 FROM games WHERE log_id = ?", (log_id,)).fetchone() is not None
+
+    def shard(self, shard: int) -> tuple[dict[str, np.ndarray], dict[str, np.ndarray], dict[str, np.ndarray]]:
+        """
+        :param shard: Number of the shard
+        :return: Memory mapped event, round and game columns of the shard
+        """
+        if shard not in self._shards:
+            self._shards[shard] = tuple(
+                {name: np.load(_shard_loc(self.cache_dir, shard, prefix, name), mmap_mode="r") for name in columns}
+                for prefix, columns in (("events", EVENT_COLUMNS), ("rounds", ROUND_COLUMNS), ("games", GAME_COLUMNS))
+            )
+        return self._shards[shard]
+
+    def _lookup(self, log_id: str) -> tuple:
+        row = self.conn.execute("SELECT shard, game, game_type, lobby, players, results FROM games WHERE log_id = ?",
+                                (log_id,)).fetchone()
+        if row is None:
+            raise KeyError(log_id)
+        return row
+
+    def raw(self, log_id: str) -> tuple[dict[str, np.ndarray], dict[str, np.ndarray]]:
+        """
+        Gets the arrays of a game without building any objects
+        :param log_id: Id of the log
+        :return: Round columns of the game's rounds, event columns of the game's events
+            rounds["event_start"] stays relative to the game's shard
+        """
+        shard, game = self._lookup(log_id)[:2]
+        return self._raw(shard, game)
+
+    def _raw(self, shard: int, game: int) -> tuple[dict[str, np.ndarray], dict[str, np.ndarray]]:
+        shard_events, shard_rounds, shard_games = self.shard(shard)
+        round_start = int(shard_games["round_start"][game])
+        round_stop = round_start + int(shard_games["round_count"][game])
+
+        rounds = {name: arr[round_start:round_stop] for name, arr in shard_rounds.items()}
+        if round_stop == round_start:
+            event_start = event_stop = 0
+        else:
+            event_start = int(rounds["event_start"][0])
+            event_stop = int(rounds["event_start"][-1]) + int(rounds["event_count"][-1])
+        events = {name: arr[event_start:event_stop] for name, arr in shard_events.items()}
+        return rounds, events
+
+    def get(self, log_id: str) -> tenhou_decoder.GameData:
+        """
+        Rebuilds a decoded game
+        :param log_id: Id of the log
+        :return: Same GameData as decoding the log
+        """
+        return self._get(*self._lookup(log_id))
+
+    def _get(self, shard: int, game: int, game_type: str, lobby: str | None, players: str,
+             results: str) -> tenhou_decoder.GameData:
+        game_data = tenhou_decoder.GameData(None)
+        game_data.game_type = game_type
+        game_data.lobby = lobby
+        game_data.players = [tenhou_decoder.Player(*p) for p in json.loads(players)]
+        game_data.results = [tuple(i) for i in json.loads(results)]
+
+        rounds, events = self._raw(shard, game)
+        # Plain lists are a lot faster to index than memory mapped arrays
+        rounds = {name: arr.tolist() for name, arr in rounds.items()}
+        events = {name: arr.tolist() for name, arr in events.items()}
+
+        offset = rounds["event_start"][0] if rounds["event_start"] else 0
+        for i in range(len(rounds["oya"])):
+            start = rounds["event_start"][i] - offset
+            game_data.rounds.append(self._build_round(rounds, i, events, start, start + rounds["event_count"][i]))
+
+        return game_data
+
+    def _build_round(self, rounds: dict[str, list], i: int, events: dict[str, list], start: int, stop: int):
+        Tile = tenhou_decoder.Tile
+
+        hands = [tuple(Tile(t) for t in rounds["hands"][i][p][:n]) for p, n in enumerate(rounds["hand_len"][i])
+                 if n >= 0]
+        r = tenhou_decoder.Round(rounds["oya"][i], hands, rounds["round_no"][i], rounds["honba"][i],
+                                 rounds["rii_sticks"][i])
+
+        ryuukyoku = rounds["ryuukyoku"][i]
+        r.ryuukyoku = bool(ryuukyoku) if ryuukyoku < 2 else self._strings[ryuukyoku - 2]
+        if rounds["ryuukyoku_tenpai"][i] >= 0:
+            r.ryuukyoku_tenpai = [p for p in range(4) if rounds["ryuukyoku_tenpai"][i] >> p & 1]
+
+        r.riichi_players = rounds["riichi_players"][i][:rounds["riichi_count"][i]]
+        r.riichi_turns = rounds["riichi_turns"][i][:rounds["riichi_count"][i]]
+        r.turns = rounds["turns"][i]
+        r.score_changes = rounds["score_changes"][i][:rounds["score_count"][i]]
+
+        for a in range(rounds["agari_count"][i]):
+            tsumo = rounds["agari_tsumo"][i][a]
+            r.agari.append(tenhou_decoder.Agari("TSUMO" if tsumo else "RON", rounds["agari_player"][i][a],
+                                                rounds["agari_points"][i][a],
+                                                None if tsumo else rounds["agari_from"][i][a]))
+
+        types = events["type"]
+        players = events["player"]
+        tiles = events["tile"]
+        data = events["data"]
+        for e in range(start, stop):
+            ev_type = types[e]
+            if ev_type == EV_DRAW:
+                r.events.append(tenhou_decoder.DrawTileEvent(players[e], Tile(tiles[e])))
+            elif ev_type == EV_DISCARD:
+                r.events.append(tenhou_decoder.DiscardTileEvent(players[e], Tile(tiles[e])))
+            elif ev_type == EV_CALL:
+                r.events.append(tenhou_decoder.CallTileEvent(players[e], data[e]))
+            elif ev_type == EV_DORA:
+                r.events.append(tenhou_decoder.DoraIndicatorEvent(Tile(tiles[e])))
+            elif ev_type == EV_RIICHI:
+                r.events.append(tenhou_decoder.RiichiEvent(players[e]))
+            elif ev_type == EV_TSUMO:
+                r.events.append(tenhou_decoder.TsumoEvent(players[e]))
+            elif ev_type == EV_RON:
+                r.events.append(tenhou_decoder.RonEvent(_unpack_players(data[e]), players[e]))
+            elif ev_type == EV_RYUUKYOKU:
+                r.events.append(tenhou_decoder.RyuuyokuEvent(r.ryuukyoku))
+            else:
+                raise Exception(f"Unknown event type {ev_type}")
+
+        return r
+
+    def iter_games(self, log_ids: Iterable[str] = None) -> Iterator[tuple[str, tenhou_decoder.GameData]]:
+        """
+        :param log_ids: Logs to read, defaults to every log in cache order
+        :return: (log_id, GameData) of every log
+        """
+        if log_ids is not None:
+            for log_id in log_ids:
+                yield log_id, self.get(log_id)
+            return
+
+        cur = self.conn.execute("SELECT log_id, shard, game, game_type, lobby, players, results FROM games "
+                                "ORDER BY shard, game")
+        for log_id, *row in cur:
+            yield log_id, self._get(*row)
+
+
+def get_game(cache: GameCache | None, conn: sqlite3.Connection, log_id: str, content: bytes | None,
+             logs_table: str = "gamedb.logs") -> tenhou_decoder.GameData:
+    """
+    Gets a game from the cache, decoding its log when it is not cached
+    :param cache: Game cache, None to always decode
+    :param conn: Connection to the games db, only used when the game is not cached and content is None
+    :param log_id: Id of the log
+    :param content: The bz2 compressed log if it was already read
+    :param logs_table: Name of the logs table in conn
+    :return: Decoded game
+    """
+    if cache is not None and log_id in cache:
+        return cache.get(log_id)
+    if content is None:
+        content = conn.execute(f"SELECT log_content FROM {logs_table} WHERE log_id = ?", (log_id,)).fetchone()[0]
+    return tenhou_decoder.GameData.from_bz2(content)
+
+
+def build_from_db(games_loc: str, cache_dir: str, query: str = None, workers: int = None) -> int:
+    """
+    Decodes every log of a games db into a cache, logs that fail to decode are skipped
+    The logs already in the cache are not decoded again, so an interrupted build is resumed by running it again
+    :param games_loc: Path to the games db (logs table with log_id and bz2 compressed log_content)
+    :param cache_dir: Directory of the cache, created when it does not exist
+    :param query: Query returning (log_id, log_content), defaults to every 4 player hanchan like the extractors
+    :param workers: Number of decoding processes, see tenhou_decoder.decode_many
+    :return: Number of games written
+    """
+    query = query or "SELECT log_id, log_content FROM logs WHERE NOT is_sanma AND NOT is_tonpuu"
+
+    # Results come back in order, so the ids of the logs in flight are kept on the side
+    log_ids = collections.deque()
+
+    def contents():
+        for log_id, content in conn.execute(query):
+            if log_id in writer:
+                continue
+            log_ids.append(log_id)
+            yield content
+
+    count = 0
+    with sqlite3.connect(games_loc) as conn, GameCacheWriter(cache_dir) as writer:
+        for columns, error in tenhou_decoder.decode_many(contents(), workers, transform=game_columns):
+            log_id = log_ids.popleft()
+            if error is not None:
+                print(f"Skipping {log_id}: {error}", file=sys.stderr)
+                continue
+            writer.add_columns(log_id, columns)
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    num_workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    print(f"Wrote {build_from_db(sys.argv[1], sys.argv[2], workers=num_workers)} games")
@@ -1,6 +1,81 @@
+# Decision point extraction: every choice a player made in a game, with the actions that were legal at that point
+#
+# Decision kinds:
+#   DECISION_SELF     after a draw: tsumo, riichi, kan, kyuushu kyuuhai or pass (go on to discard), only extracted
+#                     when one of them is legal
+#   DECISION_DISCARD  which tile to discard
+#   DECISION_CALL     on another player's discard: ron, chii, pon, daiminkan or pass
+#   DECISION_KAN      which tile to ankan / shouminkan, when there was more than one
+#   DECISION_CHANKAN  ron on a shouminkan (or on an ankan for kokushi) or pass
+# Masks use the ActionSpace.dump layout, the state is ArrayGameState.dump_compressed of the deciding player before the
+# decision is applied. Decisions with a single legal action are skipped (ex: discards in riichi), as are the call
+# decisions the log cannot tell (ex: whether a player wanted to chii when another player ponned the same tile).
+#
+# Decisions are written in shards of preallocated arrays, see DecisionWriter, one .npy file per column per shard:
+#   <shard>_state     (N, DUMP_WIDTH) int16
+#   <shard>_mask      (N, MASK_WIDTH) bool
+#   <shard>_label     (N,) int8, slot of the action taken
+#   <shard>_kind      (N,) int8, DECISION_*
+#   <shard>_position  (N, 3) int32, round_no, event_no (the event the decision was made before) and pov
+#   <shard>_game      (N,) int32, index into meta.json's log ids
+#
+# Usage: python -m event_extractor.tenhou_decision_extractor <games db> <out dir> [workers]
+import collections
+import functools
+import json
+import os
+import sqlite3
+import sys
+from typing import Iterator
+
+import numpy as np
+
 import shanten_calcs
-from tenhou_game_state import GameState, PlayerState
-import tenhou_decoder
+from event_extractor import array_game_state, tenhou_decoder
+
+VERSION = 1
+
+# Action slots, see ActionSpace.dump
+MASK_WIDTH = 46
+SLOT_RIICHI = 37
+SLOT_CHII = 38  # 38-40, the called tile being the lowest, middle or highest of the sequence
+SLOT_PON = 41
+SLOT_KAN = 42
+SLOT_AGARI = 43
+SLOT_DRAW = 44
+SLOT_PASS = 45
+
+# Decision kinds
+DECISION_SELF = 0
+DECISION_DISCARD = 1
+DECISION_CALL = 2
+DECISION_KAN = 3
+DECISION_CHANKAN = 4
+
+# name: (dtype, shape of a row)
+DECISION_COLUMNS = {
+    "state": (np.int16, (array_game_state.DUMP_WIDTH,)),
+    "mask": (np.bool_, (MASK_WIDTH,)),
+    "label": (np.int8, ()),
+    "kind": (np.int8, ()),
+    "position": (np.int32, (3,)),
+}
+SHARD_COLUMNS = dict(DECISION_COLUMNS, game=(np.int32, ()))
+
+# Meld shapes, see _RoundInfo.sets
+_SET_CHII = 0
+_SET_PON = 1
+_SET_KAN = 2
+
+_YAOCHUU = [i >= 27 or i % 9 == 0 or i % 9 == 8 for i in range(34)]
+_YAOCHUU_TILES = [i for i in range(34) if _YAOCHUU[i]]
+_KOKUSHI_MASK = sum(1 << i for i in _YAOCHUU_TILES)
+
+# Tile type (0-33) of every discard slot (0-36), and the slot of a tile type when choosing a kan (the non aka copy)
+_SLOT_TILE = [0 for _ in range(37)]
+for _i in range(136):
+    _SLOT_TILE[tenhou_decoder.Tile(_i).get_t37_idx()] = _i >> 2
+_KAN_SLOTS = [tenhou_decoder.Tile(4 * i + 1).get_t37_idx() for i in range(34)]
 
 
 class ActionSpace:
@@ -34,84 +109,730 @@ class ActionSpace:
 
 
 def get_rii_tiles(tiles: list[int], return_early=False):
-    if sum(tiles) != 14:
+    if sum(tiles) % 3 != 2:
+        return False
+
+    # Discards that leave the hand tenpai, in one pass over the hand
+    discard_tiles = shanten_calcs.tenpai_discards(tiles)
+
+    if return_early:
+        return bool(discard_tiles)
+    return list(discard_tiles)
+
+
+def _kokushi_wait_mask(tiles: list[int]) -> int:
+    """
+    :param tiles: Full Array of a 13 tile hand
+    :return: Bitmask of the tiles that complete kokushi, 0 if the hand is not tenpai for it
+    """
+    held = 0
+    count = 0
+    for i in _YAOCHUU_TILES:
+        if tiles[i]:
+            held |= 1 << i
+            count += tiles[i]
+    if count != 13:
+        return 0
+    kinds = held.bit_count()
+    if kinds == 13:
+        return _KOKUSHI_MASK
+    elif kinds == 12:
+        return _KOKUSHI_MASK ^ held
+    return 0
+
+
+class HandMasks:
+    """
+    Everything the masks need from a closed hand, worked out once per hand shape and shared by every action slot
+    3n+2 hands (after a draw): shanten after each discard, discards that leave the hand tenpai, complete
+    decompositions, quads and the ones that keep the waits in riichi, number of terminal and honor kinds
+    3n+1 hands (waiting for a tile): waits, kokushi included, and kokushi waits alone
+    """
+    __slots__ = ("tiles", "discard_shanten", "tenpai_mask", "complete", "kokushi", "tile14", "decompositions",
+                 "quads", "riichi_ankan_mask", "yaochuu_kinds", "wait_mask", "kokushi_wait_mask")
+
+    def __init__(self, key: tuple[int, int, int, int]):
+        tiles = shanten_calcs.hand_from_key(key)
+        self.tiles = tuple(tiles)
+        self.yaochuu_kinds = sum(bool(tiles[i]) for i in _YAOCHUU_TILES)
+
+        self.discard_shanten = {}
+        self.tenpai_mask = 0
+        self.complete = self.kokushi = False
+        self.tile14 = self.decompositions = None
+        self.quads = ()
+        self.riichi_ankan_mask = 0
+        self.wait_mask = self.kokushi_wait_mask = 0
+
+        num_tiles = sum(tiles)
+        if num_tiles % 3 == 2:
+            for discard, (shanten, waits) in shanten_calcs.discard_shanten(tiles).items():
+                self.discard_shanten[discard] = shanten
+                if waits is not None:
+                    self.tenpai_mask |= 1 << discard
+
+            self.kokushi = num_tiles == 14 and self.yaochuu_kinds == 13 and sum(
+                tiles[i] for i in _YAOCHUU_TILES) == 14
+            self.tile14, agari_key = shanten_calcs.get_tile14_and_key(tiles)
+            self.decompositions = shanten_calcs.get_agari_data(agari_key)
+            self.complete = self.kokushi or self.decompositions is not None
+
+            self.quads = tuple(i for i in range(34) if tiles[i] == 4)
+            for i in self.quads:
+                if shanten_calcs.check_ankan_after_riichi(tiles, i):
+                    self.riichi_ankan_mask |= 1 << i
+        elif num_tiles % 3 == 1:
+            self.wait_mask = shanten_calcs.get_hand_wait_mask_from_key(key)
+            if num_tiles == 13:
+                self.kokushi_wait_mask = _kokushi_wait_mask(tiles)
+                self.wait_mask |= self.kokushi_wait_mask
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def hand_masks(key: tuple[int, int, int, int]) -> HandMasks:
+    """
+    Cached, see hand_masks_cache_info
+    :param key: Hand key of the closed hand, see shanten_calcs.hand_key
+    :return: Analysis of the hand
+    """
+    return HandMasks(key)
+
+
+def hand_masks_cache_info():
+    """
+    :return: Hits, misses, max size and current size of the hand_masks cache
+    """
+    return hand_masks.cache_info()
+
+
+def get_wait_mask(tiles: list[int]) -> int:
+    """
+    :param tiles: Full Array of a 3n+1 tile closed hand
+    :return: Bitmask of the tiles (0-33) that complete the hand, kokushi included
+    """
+    return hand_masks(shanten_calcs.hand_key(tiles)).wait_mask
+
+
+def can_hand_win(tiles: list[int], win_tile: int, sets: list[tuple[int, int, bool]], is_tsumo: bool,
+                 value_tiles: tuple[int, ...], riichi: bool = False, situational: bool = False) -> bool:
+    """
+    Checks whether a hand is complete and has at least one yaku
+    Only the yaku that can be the only yaku of a hand are checked, the others always come with one of them
+    (ex: daisangen with yakuhai, chinroutou with toitoi)
+    :param tiles: Full Array of the closed hand, winning tile included
+    :param win_tile: Winning tile (0-33)
+    :param sets: (_SET_*, first tile, concealed) of every meld
+    :param is_tsumo: Whether the tile was drawn
+    :param value_tiles: Tiles whose triplets are yakuhai: dragons, seat wind and round wind
+    :param riichi: Whether the player is in riichi
+    :param situational: Whether a yaku that does not depend on the hand applies: haitei, houtei, rinshan or chankan
+    :return: Whether the hand can win
+    """
+    if sum(tiles) % 3 != 2:
         return False
+    return _can_win(hand_masks(shanten_calcs.hand_key(tiles)), win_tile, sets, is_tsumo, value_tiles, riichi,
+                    situational)
 
-    discard_tiles = []
 
-    for i in range(34):
-        if not tiles[i]: continue
+def _can_win(hand: HandMasks, win_tile: int, sets: list[tuple[int, int, bool]], is_tsumo: bool,
+             value_tiles: tuple[int, ...], riichi: bool, situational: bool) -> bool:
+    """
+    Same as can_hand_win, on the analysis of the 3n+2 tile hand
+    """
+    if not hand.complete:
+        return False
+    elif hand.kokushi and not sets:
+        return True
+
+    tiles = hand.tiles
+    tile14 = hand.tile14
+    decompositions = hand.decompositions
+    if decompositions is None:
+        return False
+
+    closed = all(concealed for _, _, concealed in sets)
+    if riichi or situational or (closed and is_tsumo):
+        return True
+
+    # Yakuhai
+    for i in value_tiles:
+        if tiles[i] >= 3 or any(t != _SET_CHII and first == i for t, first, _ in sets):
+            return True
+
+    # Tanyao
+    if (not any(tiles[i] for i in _YAOCHUU_TILES) and
+            all(first % 9 != 0 and (first % 9 != 6 if t == _SET_CHII else not _YAOCHUU[first])
+                for t, first, _ in sets)):
+        return True
+
+    # Honitsu, chinitsu, tsuuiisou
+    suits = {i // 9 for i in range(27) if tiles[i]} | {first // 9 for _, first, _ in sets if first < 27}
+    if len(suits) <= 1:
+        return True
+
+    if sum(t == _SET_KAN for t, _, _ in sets) >= 3:
+        return True  # Sankantsu
 
-        tiles[i] -= 1
-        shanten = shanten_calcs.calc_all(tiles)
-        tiles[i] += 1
+    open_sequences = [first for t, first, _ in sets if t == _SET_CHII]
+    open_triplets = [first for t, first, _ in sets if t != _SET_CHII]
+    ankans = sum(t == _SET_KAN and concealed for t, _, concealed in sets)
 
-        if shanten <= 0:
-            discard_tiles.append(i)
-            if return_early:
-                return True
+    for d in decompositions:
+        if d.has_chitoi or (closed and (d.has_ipeikou or d.has_ryanpeikou)):
+            return True  # Chiitoi, iipeikou, ryanpeikou
 
-    return discard_tiles
+        pair = tile14[d.pair_idx]
+        triplets = [tile14[i] for i in d.kotsu_idxs]
+        sequences = [tile14[i] for i in d.shuntsu_idxs]
+        all_sequences = sequences + open_sequences
+        all_triplets = triplets + open_triplets
 
+        if len(all_triplets) == 4:
+            return True  # Toitoi
+
+        # Sanankou, a triplet completed by ron is not concealed unless the tile can be read as part of a sequence
+        concealed = len(triplets) + ankans
+        if not is_tsumo and win_tile in triplets and not any(s <= win_tile <= s + 2 for s in sequences):
+            concealed -= 1
+        if concealed >= 3:
+            return True
+
+        # Chanta, junchan
+        if (_YAOCHUU[pair] and all(_YAOCHUU[i] for i in all_triplets) and
+                all(s % 9 == 0 or s % 9 == 6 for s in all_sequences)):
+            return True
+
+        # Ittsuu, sanshoku doujun, sanshoku doukou
+        if any(s in all_sequences and s + 3 in all_sequences and s + 6 in all_sequences for s in (0, 9, 18)):
+            return True
+        if any(s in all_sequences and s + 9 in all_sequences and s + 18 in all_sequences for s in range(7)):
+            return True
+        if any(s in all_triplets and s + 9 in all_triplets and s + 18 in all_triplets for s in range(9)):
+            return True
+
+        # Pinfu, four sequences, a pair that is not yakuhai and a two sided wait
+        if (not sets and len(sequences) == 4 and pair not in value_tiles and
+                any((s == win_tile and s % 9 != 6) or (s + 2 == win_tile and s % 9 != 0) for s in sequences)):
+            return True
 
-def can_hand_win(player: PlayerState):
-    # todo
     return False
 
 
-def extract_events(game_data: GameState):
-    game_data.next_round()
-    while game_data.current_round is not None:
-        while (ev := game_data.get_next_event()):
-            if isinstance(ev, tenhou_decoder.DrawTileEvent):
-                # POV player makes decision on calls: abortive draw, kan, tsumo, riichi
-                game_data.process_event()
-                curr_player = game_data.current_round.players[ev.player]
+class _RoundInfo:
+    """
+    What the masks need on top of ArrayRoundState: meld shapes, kans, furiten and kuikae
+    """
+
+    def __init__(self, r: array_game_state.ArrayRoundState):
+        round_wind = 27 + r.round_no // 4
+        # Dragons, seat wind and round wind of every player
+        self.value_tiles = [(31, 32, 33, round_wind, 27 + (p - r.oya) % 4) for p in range(4)]
+
+        self.sets = [[], [], [], []]  # (_SET_*, first tile, concealed) of every meld
+        self.num_kans = 0
+        self.discard_mask = [0, 0, 0, 0]  # Bit t set when the player discarded tile t (0-33)
+        self.temp_furiten = [False, False, False, False]
+        self.riichi_furiten = [False, False, False, False]
+        self.kuikae = [(), (), (), ()]  # Tiles the player cannot discard right after a chii or pon
+        self.rinshan = [False, False, False, False]  # Drew from the dead wall and did not discard yet
+
+    def is_furiten(self, player: int, wait_mask: int) -> bool:
+        return self.temp_furiten[player] or self.riichi_furiten[player] or bool(wait_mask & self.discard_mask[player])
+
+    def pass_tile(self, r: array_game_state.ArrayRoundState, player: int):
+        # Letting a winning tile go
+        self.temp_furiten[player] = True
+        if r.is_rii[player]:
+            self.riichi_furiten[player] = True
+
+    def discard(self, player: int, tile: int):
+        self.discard_mask[player] |= 1 << tile
+        self.temp_furiten[player] = False
+        self.kuikae[player] = ()
+        self.rinshan[player] = False
+
+    def call(self, player: int, meld, called_tile: int | None):
+        sets = self.sets[player]
+        first = meld.tiles[0].tile
+        match meld.call_type:
+            case tenhou_decoder.CallTypes.CHII:
+                sets.append((_SET_CHII, first, False))
+                # Kuikae, the called tile and the other end of the sequence it was called into
+                forbidden = [called_tile]
+                if called_tile == first and first % 9 < 6:
+                    forbidden.append(first + 3)
+                elif called_tile == first + 2 and first % 9 > 0:
+                    forbidden.append(first - 1)
+                self.kuikae[player] = tuple(forbidden)
+            case tenhou_decoder.CallTypes.PON:
+                sets.append((_SET_PON, first, False))
+                self.kuikae[player] = (first,)
+            case tenhou_decoder.CallTypes.SHOUMINKAN:
+                sets[sets.index((_SET_PON, first, False))] = (_SET_KAN, first, False)
+            case _:
+                sets.append((_SET_KAN, first, meld.call_type == tenhou_decoder.CallTypes.ANKAN))
+
+        if meld.call_type in (tenhou_decoder.CallTypes.ANKAN, tenhou_decoder.CallTypes.DAIMINKAN,
+                              tenhou_decoder.CallTypes.SHOUMINKAN):
+            self.num_kans += 1
+            self.rinshan[player] = True
+
+
+def _next_action(events: list, event_no: int):
+    """
+    :return: First event after event_no that is not a dora indicator, None at the end of the round
+    """
+    for i in range(event_no + 1, len(events)):
+        if type(events[i]) is not tenhou_decoder.DoraIndicatorEvent:
+            return events[i]
+    return None
+
+
+def _kan_tiles(r: array_game_state.ArrayRoundState, info: _RoundInfo, player: int, hand: HandMasks,
+               drawn: int) -> list[int]:
+    """
+    :return: Tiles the player can ankan or shouminkan after drawing
+    """
+    if r.tiles_left == 0 or info.num_kans >= 4:
+        return []
+    elif r.is_rii[player]:
+        return [drawn] if hand.riichi_ankan_mask >> drawn & 1 else []
+    return list(hand.quads) + [first for t, first, _ in info.sets[player] if t == _SET_PON and hand.tiles[first]]
+
+
+def _has_discard_after_call(tiles: tuple[int, ...], used: tuple[int, ...], forbidden: tuple[int, ...]) -> bool:
+    """
+    Tenhou does not allow a call that leaves nothing to discard but kuikae tiles
+    """
+    left = list(tiles)
+    for i in used:
+        left[i] -= 1
+    return any(left[i] for i in range(34) if i not in forbidden)
+
+
+def _self_mask(state: array_game_state.ArrayGameState, info: _RoundInfo, ev: tenhou_decoder.DrawTileEvent,
+               mask: np.ndarray) -> bool:
+    """
+    Fills the mask of the decision after a draw
+    :return: Whether the player had anything to decide
+    """
+    r = state.current_round
+    player = ev.player
+    hand = hand_masks(r.hand_key(player))
+    drawn = ev.tile.tile
+
+    agari = _can_win(hand, drawn, info.sets[player], True, info.value_tiles[player], r.is_rii[player],
+                     info.rinshan[player] or r.tiles_left == 0)
+    riichi = (hand.tenpai_mask != 0 and not r.is_rii[player] and not r.hand_is_open[player] and
+              r.tiles_left >= 4 and state.scores[player] >= 10)
+    kan = bool(_kan_tiles(r, info, player, hand, drawn))
+    kyuushu = hand.yaochuu_kinds >= 9 and r.num_discards[player] == 0 and not r.did_someone_call()
+
+    mask[:] = False
+    if not (agari or riichi or kan or kyuushu):
+        return False
+    mask[SLOT_RIICHI] = riichi
+    mask[SLOT_KAN] = kan
+    mask[SLOT_AGARI] = agari
+    mask[SLOT_DRAW] = kyuushu
+    mask[SLOT_PASS] = True
+    return True
+
+
+def _self_label(player: int, action) -> int:
+    match type(action):
+        case tenhou_decoder.RiichiEvent:
+            return SLOT_RIICHI
+        case tenhou_decoder.TsumoEvent:
+            return SLOT_AGARI
+        case tenhou_decoder.CallTileEvent if action.player == player:
+            return SLOT_KAN
+        case tenhou_decoder.RyuuyokuEvent if action.rk_type == "yao9":
+            return SLOT_DRAW
+    return SLOT_PASS
+
+
+def _discard_mask(state: array_game_state.ArrayGameState, info: _RoundInfo, player: int, riichi_declared: bool,
+                  mask: np.ndarray) -> bool:
+    """
+    Fills the mask of a discard
+    :return: Whether the player had more than one tile to choose from
+    """
+    r = state.current_round
+    if r.is_rii[player] and not riichi_declared:
+        return False  # Tsumogiri
+
+    held = r.hand37[player][:]
+    if riichi_declared:
+        tenpai_mask = hand_masks(r.hand_key(player)).tenpai_mask
+        allowed = [bool(held[i]) and bool(tenpai_mask >> _SLOT_TILE[i] & 1) for i in range(37)]
+    else:
+        forbidden = info.kuikae[player]
+        allowed = [bool(held[i]) and _SLOT_TILE[i] not in forbidden for i in range(37)]
+
+    mask[:37] = allowed
+    mask[37:] = False
+    return sum(allowed) > 1
+
+
+def _call_options(state: array_game_state.ArrayGameState, info: _RoundInfo, discarder: int, player: int,
+                  tile: int, mask: np.ndarray) -> tuple[bool, bool]:
+    """
+    Fills the mask of a player's decision on a discard
+    :return: Whether the player had anything to decide, whether the discard was one of the player's winning tiles
+    """
+    r = state.current_round
+    key = r.hand_key(player)
+    hand = hand_masks(key)
+    tiles = hand.tiles
+    in_waits = bool(hand.wait_mask >> tile & 1)
+
+    agari = False
+    if in_waits and not info.is_furiten(player, hand.wait_mask):
+        agari = _can_win(hand_masks(shanten_calcs.hand_key_add(key, tile)), tile, info.sets[player], False,
+                         info.value_tiles[player], r.is_rii[player], r.tiles_left == 0)
+
+    chii = [False, False, False]
+    pon = kan = False
+    if not r.is_rii[player] and r.tiles_left > 0:
+        count = tiles[tile]
+        if count >= 2:
+            pon = _has_discard_after_call(tiles, (tile, tile), (tile,))
+            kan = count == 3 and info.num_kans < 4
+        if player == (discarder + 1) % 4 and tile < 27:
+            num = tile % 9
+            for pos, used, forbidden in ((0, (tile + 1, tile + 2), (tile, tile + 3) if num < 6 else (tile,)),
+                                         (1, (tile - 1, tile + 1), (tile,)),
+                                         (2, (tile - 2, tile - 1), (tile, tile - 3) if num > 2 else (tile,))):
+                if 0 <= num - pos <= 6 and tiles[used[0]] and tiles[used[1]]:
+                    chii[pos] = _has_discard_after_call(tiles, used, forbidden)
+
+    mask[:] = False
+    if not (agari or pon or kan or any(chii)):
+        return False, in_waits
+    mask[SLOT_CHII:SLOT_CHII + 3] = chii
+    mask[SLOT_PON] = pon
+    mask[SLOT_KAN] = kan
+    mask[SLOT_AGARI] = agari
+    mask[SLOT_PASS] = True
+    return True, in_waits
+
+
+# Who goes first when several players want the same discard
+_PRIORITY_NONE = -1
+_PRIORITY_CHII = 0
+_PRIORITY_PON = 1
+_PRIORITY_RON = 2
+
 
-                action_space = ActionSpace()
-                flag = False
+def _call_label(player: int, discard: int, action, mask: np.ndarray) -> int | None:
+    """
+    :param player: Player deciding on the discard
+    :param discard: Discarded tile (0-33)
+    :param action: What happened after the discard, see _next_action
+    :param mask: Options of the player
+    :return: Slot of the player's decision, None when the log cannot tell
+    """
+    if type(action) is tenhou_decoder.RonEvent:
+        if player in action.winning_players:
+            return SLOT_AGARI
+        priority = _PRIORITY_RON
+    elif type(action) is tenhou_decoder.RyuuyokuEvent and action.rk_type == "ron3":
+        if mask[SLOT_AGARI]:
+            return SLOT_AGARI
+        priority = _PRIORITY_RON
+    elif type(action) is tenhou_decoder.CallTileEvent:
+        meld = action.meld
+        if action.player == player:
+            if meld.call_type == tenhou_decoder.CallTypes.CHII:
+                return SLOT_CHII + discard - meld.tiles[0].tile
+            return SLOT_PON if meld.call_type == tenhou_decoder.CallTypes.PON else SLOT_KAN
+        priority = _PRIORITY_CHII if meld.call_type == tenhou_decoder.CallTypes.CHII else _PRIORITY_PON
+    else:
+        return SLOT_PASS
 
-                action_space.allowed_draw = (not game_data.current_round.did_someone_call() and
-                                             game_data.current_round.tiles_left >= 66 and sum(
-                            map(lambda t: (t % 9 == 0 or t % 9 == 8) or t >= 7,
-                                curr_player.closed_hand)) >= 9)
+    # The player passed only if every option would have gone before what happened
+    if mask[SLOT_CHII:SLOT_CHII + 3].any() and priority >= _PRIORITY_CHII:
+        return None
+    if (mask[SLOT_PON] or mask[SLOT_KAN]) and priority >= _PRIORITY_PON:
+        return None
+    if mask[SLOT_AGARI] and priority > _PRIORITY_RON:
+        return None
+    return SLOT_PASS
 
-                t34 = shanten_calcs.convert_t14_to_full([i.tile for i in curr_player.closed_hand])
-                if curr_player.is_rii:
-                    action_space.allowed_kan = shanten_calcs.check_ankan_after_riichi(t34, ev.tile.tile)
+
+def _check_label(state: array_game_state.ArrayGameState, player: int, mask: np.ndarray, label: int):
+    if not mask[label]:
+        raise Exception(f"Round {state.round_no} event {state.event_no}: player {player} took action {label} which "
+                        f"is not allowed by {np.flatnonzero(mask).tolist()}")
+
+
+def extract_events(game_data: tenhou_decoder.GameData) -> Iterator[tuple]:
+    """
+    Replays a game and yields every decision point, before the decision is applied
+    :param game_data: Decoded game
+    :return: (state, pov, kind, mask, label) per decision, state is the ArrayGameState positioned at the decision
+        (dump it with state.dump_compressed(pov)) and mask a (MASK_WIDTH,) bool array, both are reused by the
+        next decision
+    """
+    state = array_game_state.ArrayGameState(game_data)
+    mask = np.zeros(MASK_WIDTH, dtype=np.bool_)
+
+    state.next_round()
+    while state.current_round is not None:
+        r = state.current_round
+        events = state.rounds[state.round_no].events
+        info = _RoundInfo(r)
+
+        while (ev := state.get_next_event()) is not None:
+            ev_type = type(ev)
+            if ev_type is tenhou_decoder.DrawTileEvent:
+                # Drawing player: tsumo, riichi, kan, kyuushu kyuuhai
+                state.process_event()
+                label = _self_label(ev.player, _next_action(events, state.event_no - 1))
+                if _self_mask(state, info, ev, mask):
+                    _check_label(state, ev.player, mask, label)
+                    yield state, ev.player, DECISION_SELF, mask, label
+                elif label != SLOT_PASS:
+                    _check_label(state, ev.player, mask, label)
+
+            elif ev_type is tenhou_decoder.DiscardTileEvent:
+                # Discarding player: which tile, then every other player: ron, chii, pon, kan
+                player = ev.player
+                tile = ev.tile.tile
+                riichi_declared = state.event_no > 0 and type(events[state.event_no - 1]) is tenhou_decoder.RiichiEvent
+                if _discard_mask(state, info, player, riichi_declared, mask):
+                    label = ev.tile.get_t37_idx()
+                    _check_label(state, player, mask, label)
+                    yield state, player, DECISION_DISCARD, mask, label
+
+                state.process_event()
+                info.discard(player, tile)
+
+                action = _next_action(events, state.event_no - 1)
+                for i in range(1, 4):
+                    other = (player + i) % 4
+                    has_options, in_waits = _call_options(state, info, player, other, tile, mask)
+                    if has_options:
+                        label = _call_label(other, tile, action, mask)
+                        if label is not None:
+                            _check_label(state, other, mask, label)
+                            yield state, other, DECISION_CALL, mask, label
+                    if in_waits and not (type(action) is tenhou_decoder.RonEvent and
+                                         other in action.winning_players):
+                        info.pass_tile(r, other)
+
+            elif ev_type is tenhou_decoder.CallTileEvent:
+                player = ev.player
+                meld = ev.meld
+                call_type = meld.call_type
+                called_tile = None
+                if call_type in (tenhou_decoder.CallTypes.ANKAN, tenhou_decoder.CallTypes.SHOUMINKAN):
+                    # Which tile to kan
+                    prev = events[state.event_no - 1]
+                    drawn = prev.tile.tile if type(prev) is tenhou_decoder.DrawTileEvent else -1
+                    kan_tiles = _kan_tiles(r, info, player, hand_masks(r.hand_key(player)), drawn)
+                    label = _KAN_SLOTS[meld.tiles[0].tile]
+                    mask[:] = False
+                    for i in kan_tiles:
+                        mask[_KAN_SLOTS[i]] = True
+                    _check_label(state, player, mask, label)
+                    if len(kan_tiles) > 1:
+                        yield state, player, DECISION_KAN, mask, label
                 else:
-                    # todo
-                    pass
-                action_space.allowed_win = can_hand_win(curr_player)
-                action_space.allowed_riichi = get_rii_tiles(t34, True)
-
-                if flag:
-                    match type(game_data.get_next_event()):
-                        case tenhou_decoder.RiichiEvent:
-                            assert action_space.allowed_riichi
-                            correct_decision = 37
-                        case tenhou_decoder.TsumoEvent:
-                            assert action_space.allowed_win
-                            correct_decision = 43
-                        case tenhou_decoder.CallTileEvent:
-                            assert action_space.allowed_kan
-                            correct_decision = 42
-                        case tenhou_decoder.RyuuyokuEvent:
-                            correct_decision = 44 if action_space.allowed_draw else 45
-                        case _:
-                            correct_decision = 45
-
-                    yield game_data.dump_compressed(ev.player), action_space, correct_decision
-            elif isinstance(ev, tenhou_decoder.DiscardTileEvent):
-                # Pre Discard: POV player makes decision on what to discard
-                # Post Discard: Other players make decision on calling tiles (ron, pon/kan, chii)
-                pass
-            elif isinstance(ev, tenhou_decoder.CallTileEvent):
-                # Kan which tile
-                # If kan type is shouminkan, check chankans
-                # If kan type is ankan, check kokushi
-                pass
+                    called_tile = events[state.event_no - 1].tile.tile
+
+                state.process_event()
+                info.call(player, meld, called_tile)
+
+                if call_type in (tenhou_decoder.CallTypes.ANKAN, tenhou_decoder.CallTypes.SHOUMINKAN):
+                    # Chankan, only kokushi can rob an ankan
+                    kan_tile = meld.tiles[0].tile
+                    action = _next_action(events, state.event_no - 1)
+                    for i in range(1, 4):
+                        other = (player + i) % 4
+                        hand = hand_masks(r.hand_key(other))
+                        if call_type == tenhou_decoder.CallTypes.ANKAN:
+                            wait_mask = hand.kokushi_wait_mask
+                        else:
+                            wait_mask = hand.wait_mask
+                        if not wait_mask >> kan_tile & 1:
+                            continue
+
+                        won = type(action) is tenhou_decoder.RonEvent and other in action.winning_players
+                        if not info.is_furiten(other, wait_mask):
+                            mask[:] = False
+                            mask[SLOT_AGARI] = mask[SLOT_PASS] = True
+                            yield state, other, DECISION_CHANKAN, mask, SLOT_AGARI if won else SLOT_PASS
+                        if not won:
+                            info.pass_tile(r, other)
+
             else:
-                game_data.process_event()
+                state.process_event()
+
+        state.next_round()
+
+
+def max_decisions(game_data: tenhou_decoder.GameData) -> int:
+    """
+    :param game_data: Decoded game
+    :return: Upper bound of the number of decisions of a game, at most 4 (one per player) per event
+    """
+    return 4 * sum(len(r.events) for r in game_data.rounds)
+
+
+def extract_game(game_data: tenhou_decoder.GameData, out: dict[str, np.ndarray] = None) -> dict[str, np.ndarray]:
+    """
+    Extracts every decision of a game into arrays, see DECISION_COLUMNS
+    Picklable, so it can be given to tenhou_decoder.decode_many as the transform
+    :param game_data: Decoded game
+    :param out: Arrays to write into, each of at least max_decisions rows, defaults to new arrays
+    :return: The decisions, views of the first rows of the arrays
+    """
+    if out is None:
+        num_rows = max_decisions(game_data)
+        out = {name: np.empty((num_rows,) + shape, dtype=dtype) for name, (dtype, shape) in DECISION_COLUMNS.items()}
+
+    states = out["state"]
+    masks = out["mask"]
+    labels = out["label"]
+    kinds = out["kind"]
+    positions = out["position"]
+
+    n = 0
+    for state, pov, kind, mask, label in extract_events(game_data):
+        state.dump_compressed(pov, states[n])
+        masks[n] = mask
+        labels[n] = label
+        kinds[n] = kind
+        positions[n] = (state.round_no, state.event_no, pov)
+        n += 1
+
+    return {name: arr[:n] for name, arr in out.items()}
+
+
+class DecisionWriter:
+    """
+    Writes decisions into shards of shard_size rows, filled in preallocated arrays and saved as soon as they are full,
+    so memory stays bounded whatever the number of games
+    """
+
+    def __init__(self, out_dir: str, shard_size: int = 1 << 18):
+        if os.path.exists(os.path.join(out_dir, "meta.json")):
+            raise Exception(f"Decisions already extracted to {out_dir}")
+        os.makedirs(out_dir, exist_ok=True)
+
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.log_ids = []
+        self.shard_rows = []
+
+        self._buffers = {name: np.empty((shard_size,) + shape, dtype=dtype)
+                         for name, (dtype, shape) in SHARD_COLUMNS.items()}
+        self._rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+    def add(self, log_id: str, columns: dict[str, np.ndarray]) -> int:
+        """
+        Adds the decisions of a game
+        :param log_id: Id of the log
+        :param columns: Decisions of the game, see extract_game
+        :return: Number of decisions added
+        """
+        game = len(self.log_ids)
+        self.log_ids.append(log_id)
+
+        num_rows = len(columns["label"])
+        start = 0
+        while start < num_rows:
+            count = min(num_rows - start, self.shard_size - self._rows)
+            for name in DECISION_COLUMNS:
+                self._buffers[name][self._rows:self._rows + count] = columns[name][start:start + count]
+            self._buffers["game"][self._rows:self._rows + count] = game
+
+            self._rows += count
+            start += count
+            if self._rows == self.shard_size:
+                self._flush()
+        return num_rows
+
+    def _flush(self):
+        shard = len(self.shard_rows)
+        for name, buffer in self._buffers.items():
+            np.save(os.path.join(self.out_dir, f"{shard:05d}_{name}.npy"), buffer[:self._rows])
+        self.shard_rows.append(self._rows)
+        self._rows = 0
+
+    def close(self):
+        """
+        Writes the last shard and meta.json
+        :return: N/A
+        """
+        if self._rows:
+            self._flush()
+
+        # meta.json is written last, a directory without it is incomplete
+        with open(os.path.join(self.out_dir, "meta.json"), "w") as f:
+            json.dump({"version": VERSION, "shard_rows": self.shard_rows, "log_ids": self.log_ids}, f)
+
+
+def iter_shards(out_dir: str, mmap_mode: str | None = "r") -> Iterator[dict[str, np.ndarray]]:
+    """
+    Reads the shards written by DecisionWriter
+    :param out_dir: Directory of the shards
+    :param mmap_mode: Passed to np.load, None to read the shards into memory
+    :return: {column: array} per shard, see SHARD_COLUMNS
+    """
+    with open(os.path.join(out_dir, "meta.json")) as f:
+        meta = json.load(f)
+    if meta["version"] != VERSION:
+        raise Exception(f"Decisions at {out_dir} are version {meta['version']}, expected {VERSION}")
+
+    for shard in range(len(meta["shard_rows"])):
+        yield {name: np.load(os.path.join(out_dir, f"{shard:05d}_{name}.npy"), mmap_mode=mmap_mode)
+               for name in SHARD_COLUMNS}
+
+
+def extract_from_db(games_loc: str, out_dir: str, query: str = None, workers: int = None,
+                    shard_size: int = 1 << 18) -> tuple[int, int]:
+    """
+    Extracts the decisions of every log of a games db, logs that fail to decode or extract are skipped
+    Games are decoded and extracted on a process pool, only their arrays come back to be written
+    :param games_loc: Path to the games db (logs table with log_id and bz2 compressed log_content)
+    :param out_dir: Directory of the shards
+    :param query: Query returning (log_id, log_content), defaults to every 4 player hanchan like the extractors
+    :param workers: Number of processes, see tenhou_decoder.decode_many
+    :param shard_size: Number of decisions per shard
+    :return: Number of games and of decisions written
+    """
+    query = query or "SELECT log_id, log_content FROM logs WHERE NOT is_sanma AND NOT is_tonpuu"
+
+    # Results come back in order, so the ids of the logs in flight are kept on the side
+    log_ids = collections.deque()
+
+    def contents():
+        for log_id, content in conn.execute(query):
+            log_ids.append(log_id)
+            yield content
+
+    num_games = num_decisions = 0
+    with sqlite3.connect(games_loc) as conn, DecisionWriter(out_dir, shard_size) as writer:
+        for columns, error in tenhou_decoder.decode_many(contents(), workers, transform=extract_game):
+            log_id = log_ids.popleft()
+            if error is not None:
+                print(f"Skipping {log_id}: {error}", file=sys.stderr)
+                continue
+            num_decisions += writer.add(log_id, columns)
+            num_games += 1
+    return num_games, num_decisions
+
 
-        game_data.next_round()
+if __name__ == "__main__":
+    num_workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    print("Wrote %d games, %d decisions" % extract_from_db(sys.argv[1], sys.argv[2], workers=num_workers))
@@ -2,27 +2,128 @@
 #
 # Source:
 #  * https://github.com/ApplySci/tenhou-log/blob/master/TenhouDecoder.py
+import collections
+import concurrent.futures
 import enum
+import functools
+import json
+import os
 import urllib.parse as urllib_parse
-from typing import TextIO
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, TextIO
 import xml.etree.ElementTree as XMLElementTree
 import bz2
 
 
+# Exact types that serialize to themselves, subclasses go through JsonSerializable._serialize
+_PRIMITIVE_TYPES = frozenset((bool, str, int, float, type(None)))
+
+
 class JsonSerializable:
+    __slots__ = ()
+
     PRIMITIVES = (bool, str, int, float, type(None))
 
-    def serialize(self, *args, **kwargs):
-        serialization = {}
-        for (k, v) in self.__dict__.items():
-            if k.startswith("_"):
+    # Slot names of each class, in definition order starting from the base classes
+    _SLOTS: dict[type, tuple[str, ...]] = {}
+
+    # Generated serializers, keyed by class for classes with only slots, and by (class, instance dict keys) otherwise
+    _SERIALIZERS: dict = {}
+
+    @classmethod
+    def _slot_names(cls) -> tuple[str, ...]:
+        names = JsonSerializable._SLOTS.get(cls)
+        if names is None:
+            names = []
+            for klass in reversed(cls.__mro__):
+                slots = klass.__dict__.get("__slots__", ())
+                names += [slots] if isinstance(slots, str) else [i for i in slots if i not in names]
+            names = JsonSerializable._SLOTS[cls] = tuple(i for i in names if i not in ("__dict__", "__weakref__"))
+        return names
+
+    @classmethod
+    def _compile_serializer(cls, dict_keys: tuple[str, ...] | None):
+        """
+        Generates the serializer of a class, the fields are read directly instead of being looked up on every call
+        :param dict_keys: Keys of the instance dict, None if the class only has slots
+        :return: Function taking (obj, args, kwargs) and returning the serialized dict
+        """
+        lines = ["def serialize(self, args, kwargs):", "    ret = {}"]
+
+        def add(name: str, source: str):
+            lines.append(f"    v = {source}")
+            lines.append(f"    ret[{name!r}] = v if type(v) in _PRIMITIVE_TYPES else _value(v, args, kwargs)")
+
+        for name in cls._slot_names():
+            if name.startswith("_"):
                 continue
-            elif isinstance(v, JsonSerializable):
-                serialization[k] = v.serialize(*args, **kwargs)
-            else:
-                serialization[k] = JsonSerializable._serialize(v, *args, **kwargs)
+            # Slots that were never set are left out, same as a missing dict key
+            lines.append("    try:")
+            lines.append(f"        v = self.{name}")
+            lines.append("    except AttributeError:")
+            lines.append("        pass")
+            lines.append("    else:")
+            lines.append(f"        ret[{name!r}] = v if type(v) in _PRIMITIVE_TYPES else _value(v, args, kwargs)")
+
+        if dict_keys is not None:
+            lines.append("    d = self.__dict__")
+            for name in dict_keys:
+                if not name.startswith("_"):
+                    add(name, f"d[{name!r}]")
+
+        lines.append("    return ret")
+
+        namespace = {"_PRIMITIVE_TYPES": _PRIMITIVE_TYPES, "_value": JsonSerializable._serialize_value}
+        exec("\n".join(lines), namespace)
+        return namespace["serialize"]
+
+    def serialize(self, *args, **kwargs):
+        return JsonSerializable._serialize_fields(self, args, kwargs)
 
-        return serialization
+    @staticmethod
+    def _serialize_fields(obj, args: tuple, kwargs: dict):
+        d = getattr(obj, "__dict__", None)
+        key = type(obj) if d is None else (type(obj), tuple(d))
+
+        serializer = JsonSerializable._SERIALIZERS.get(key)
+        if serializer is None:
+            serializer = JsonSerializable._SERIALIZERS[key] = type(obj)._compile_serializer(
+                None if d is None else key[1])
+        return serializer(obj, args, kwargs)
+
+    @classmethod
+    def _value_serializer(cls):
+        """
+        Override to serialize instances of a class that overrides serialize without going through serialize
+        :return: Function taking (obj, args, kwargs)
+        """
+        if cls.serialize is not JsonSerializable.serialize:
+            return lambda obj, args, kwargs: obj.serialize(*args, **kwargs)
+        elif cls.__dictoffset__ == 0:
+            # Only slots, the generated serializer is always the same
+            return JsonSerializable._SERIALIZERS.get(cls) or cls._compile_serializer(None)
+        return JsonSerializable._serialize_fields
+
+    @staticmethod
+    def _serialize_value(obj, args: tuple, kwargs: dict):
+        serializer = _VALUE_SERIALIZERS.get(type(obj))
+        if serializer is None:
+            serializer = _VALUE_SERIALIZERS[type(obj)] = JsonSerializable._resolve_value_serializer(type(obj))
+        return serializer(obj, args, kwargs)
+
+    @staticmethod
+    def _resolve_value_serializer(t: type):
+        # Same order as _serialize
+        if issubclass(t, JsonSerializable):
+            return t._value_serializer()
+        elif issubclass(t, JsonSerializable.PRIMITIVES):
+            return lambda obj, args, kwargs: obj
+        elif issubclass(t, enum.Enum):
+            return lambda obj, args, kwargs: obj.value
+        elif issubclass(t, (list, tuple)):
+            value = JsonSerializable._serialize_value
+            return lambda obj, args, kwargs: [i if type(i) in _PRIMITIVE_TYPES else value(i, args, kwargs)
+                                              for i in obj]
+        raise Exception(f"Serialization not supported for: {t}")
 
     @staticmethod
     def _serialize(obj, *args, **kwargs):
@@ -44,8 +145,51 @@ class JsonSerializable:
         return [i.serialize(*args, **kwargs) if isinstance(i, JsonSerializable)
                 else JsonSerializable._serialize(i, *args, **kwargs) for i in obj]
 
+    def to_json_bytes(self, *args, **kwargs) -> bytes:
+        """
+        Serializes straight to compact UTF-8 JSON, for bulk exports
+        :return: JSON
+        """
+        return _JSON_ENCODER.encode(self.serialize(*args, **kwargs)).encode()
+
+
+# Serializer of every type seen as a field value, see JsonSerializable._serialize_value
+_VALUE_SERIALIZERS: dict[type, object] = {}
+
+_JSON_ENCODER = json.JSONEncoder(ensure_ascii=False, check_circular=False, separators=(",", ":"))
+
+
+def write_json_lines(fp: BinaryIO, objs: Iterable[JsonSerializable], *args, **kwargs) -> int:
+    """
+    Writes objects as JSON lines to a binary file, ex: every state of a game timeline
+    :param fp: Binary file
+    :param objs: Objects to write, extra args are passed to serialize
+    :return: Number of bytes written
+    """
+    encode = _JSON_ENCODER.encode
+    written = 0
+    buffer = []
+    buffered = 0
+    for obj in objs:
+        line = (encode(obj.serialize(*args, **kwargs)) + "\n").encode()
+        buffer.append(line)
+        buffered += len(line)
+        if buffered >= 1 << 20:
+            written += fp.write(b"".join(buffer))
+            buffer = []
+            buffered = 0
+    if buffer:
+        written += fp.write(b"".join(buffer))
+    return written
+
 
 class Tile(JsonSerializable):
+    """
+    One of the 136 tiles
+    Tiles are immutable and interned, Tile(i) always returns the same instance for the same i
+    """
+    __slots__ = ("i", "tile", "tile_num", "_is_aka", "_t37_idx", "_readable")
+
     _TILES = """
         1m 2m 3m 4m 5m 6m 7m 8m 9m
         1p 2p 3p 4p 5p 6p 7p 8p 9p
@@ -54,20 +198,39 @@ class Tile(JsonSerializable):
         wd gd rd
     """.split()
 
-    def __init__(self, i):
-        if isinstance(i, str):
-            i = int(i)
+    _INSTANCES: list['Tile'] = []
+
+    def __new__(cls, i):
+        i = int(i)
+        if not 0 <= i < 136:
+            raise ValueError(f"Invalid tile id: {i}, must be in [0, 136)")
+        return Tile._INSTANCES[i]
 
+    @classmethod
+    def _create(cls, i: int) -> 'Tile':
+        self = object.__new__(cls)
         self.i = i
         self.tile = i >> 2
         self.tile_num = i & 0x3
+        self._is_aka = (self.tile == 4 or self.tile == 13 or self.tile == 22) and self.tile_num == 0
+        self._t37_idx = self.tile + self._is_aka + (self.tile > 4) + (self.tile > 13) + (self.tile > 22)
+        self._readable = Tile._TILES[self.tile] + str(self.tile_num)
+        return self
+
+    def __reduce__(self):
+        # Unpickling goes through Tile(i), so it gets the interned instance
+        return Tile, (self.i,)
+
+    @classmethod
+    def _value_serializer(cls):
+        return lambda tile, args, kwargs: tile._readable if kwargs.get("readable") else tile.i
 
     def __repr__(self):
         return self.serialize(readable=True)
 
     def serialize(self, *args, **kwargs):
         if kwargs.get("readable"):
-            return Tile._TILES[self.tile] + str(self.tile_num)
+            return self._readable
         else:
             return self.i
 
@@ -78,10 +241,13 @@ class Tile(JsonSerializable):
         return isinstance(other, Tile) and self.tile < other.tile
 
     def is_aka(self):
-        return (self.tile == 4 or self.tile == 13 or self.tile == 22) and self.tile_num == 0
+        return self._is_aka
 
     def get_t37_idx(self):
-        return self.tile + self.is_aka() + (self.tile > 4) + (self.tile > 13) + (self.tile > 22)
+        return self._t37_idx
+
+
+Tile._INSTANCES = [Tile._create(i) for i in range(136)]
 
 
 class Player(JsonSerializable):
@@ -111,6 +277,9 @@ class RoundNo(JsonSerializable):
 
 
 class Round(JsonSerializable):
+    __slots__ = ("oya", "starting_hands", "round_no", "honba_count", "rii_sticks", "agari", "events", "ryuukyoku",
+                 "ryuukyoku_players", "riichi_players", "riichi_turns", "turns", "score_changes", "ryuukyoku_tenpai")
+
     def __init__(self, oya: int, starting_hands: list, round_no: int, honba: int, rii_sticks: int):
         self.oya = oya  # Round dealer
         self.starting_hands = starting_hands  # List of hands
@@ -146,6 +315,8 @@ class CallTypes(enum.Enum):
 
 
 class ChiiMeld(JsonSerializable):
+    __slots__ = ("relative_player", "call_type", "chii_type", "tiles")
+
     def __init__(self, data: int):
         self.relative_player = data & 0x3
         self.call_type = CallTypes.CHII
@@ -158,6 +329,8 @@ class ChiiMeld(JsonSerializable):
 
 
 class PonMeld(JsonSerializable):
+    __slots__ = ("relative_player", "calling_player", "call_type", "tiles")
+
     def __init__(self, data: int):
         self.relative_player = data & 0x3
 
@@ -177,6 +350,8 @@ class PonMeld(JsonSerializable):
 
 
 class KanMeld(JsonSerializable):
+    __slots__ = ("relative_player", "calling_player", "call_type", "tiles")
+
     def __init__(self, data: int):
         self.relative_player = data & 0x3
 
@@ -195,6 +370,8 @@ class KanMeld(JsonSerializable):
 
 # Is this just Pei? Seems like it
 class NukiMeld(JsonSerializable):
+    __slots__ = ("from_player", "call_type", "tiles")
+
     def __init__(self, data: int):
         self.from_player = data & 0x3
         self.call_type = CallTypes.NUKI
@@ -202,14 +379,19 @@ class NukiMeld(JsonSerializable):
 
 
 class Event(JsonSerializable):
+    __slots__ = ("event_name",)
+
     def __init__(self, event_name):
         self.event_name = event_name
 
 
 class CallTileEvent(Event):
+    __slots__ = ("player", "meld", "_call_data")
+
     def __init__(self, player: int, call_data: int):
         super().__init__("call")
         self.player = player
+        self._call_data = call_data  # The meld bits from the log, kept for game_cache
         if call_data & 0x4:
             self.meld = ChiiMeld(call_data)
         elif call_data & 0x18:
@@ -221,12 +403,16 @@ class CallTileEvent(Event):
 
 
 class DoraIndicatorEvent(Event):
+    __slots__ = ("tile",)
+
     def __init__(self, tile: Tile):
         super().__init__("dora")
         self.tile = tile
 
 
 class DrawTileEvent(Event):
+    __slots__ = ("player", "tile")
+
     def __init__(self, player: int, tile: Tile):
         super().__init__("draw_tile")
         self.player = player
@@ -234,6 +420,8 @@ class DrawTileEvent(Event):
 
 
 class DiscardTileEvent(Event):
+    __slots__ = ("player", "tile")
+
     def __init__(self, player: int, tile: Tile):
         super().__init__("discard_tile")
         self.player = player
@@ -241,12 +429,16 @@ class DiscardTileEvent(Event):
 
 
 class RiichiEvent(Event):
+    __slots__ = ("player",)
+
     def __init__(self, player):
         super().__init__("riichi")
         self.player = player
 
 
 class RonEvent(Event):
+    __slots__ = ("winning_players", "from_player")
+
     def __init__(self, winning_players: list[int], from_player: int):
         super().__init__("ron")
         self.winning_players = winning_players
@@ -254,12 +446,16 @@ class RonEvent(Event):
 
 
 class TsumoEvent(Event):
+    __slots__ = ("player",)
+
     def __init__(self, player: int):
         super().__init__("tsumo")
         self.player = player
 
 
 class RyuuyokuEvent(Event):
+    __slots__ = ("rk_type",)
+
     def __init__(self, rk_type):
         super().__init__("ryuuyoku")
         self.rk_type = "s" if isinstance(rk_type, bool) else rk_type
@@ -267,6 +463,8 @@ class RyuuyokuEvent(Event):
 
 class Agari(JsonSerializable):
     # There is more data but this was not needed for my usecase, so this is just here for posterity sake
+    __slots__ = ("win_type", "winning_player", "points", "from_player")
+
     def __init__(self, win_type: str, winning_player: int, points: int, from_player: int):
         self.win_type = win_type
         self.winning_player = winning_player
@@ -278,14 +476,53 @@ class GameData(JsonSerializable):
     PLAYERS = ["n0", "n1", "n2", "n3"]
     HANDS = ["hai0", "hai1", "hai2", "hai3"]
 
-    def __init__(self, log: str | TextIO):
+    # Size of the chunks fed to the xml parser
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, log: str | bytes | TextIO | BinaryIO | None):
         self.game_type = ""
         self.lobby = ""
         self.players: list[Player] = []
         self.rounds: list[Round] = []
         self.results: list[tuple[int, float]] = []  # Tuple of (final_score / 100, uma)
 
-        self.decode(log)
+        if log is not None:
+            self.decode(log)
+
+    @classmethod
+    def from_bz2(cls, compressed: bytes | BinaryIO):
+        """
+        Decodes a bz2 compressed log without ever holding the whole decompressed log in memory
+        :param compressed: Compressed log, or a binary file of it
+        :return: GameData
+        """
+        game_data = cls(None)
+        game_data.decode_chunks(GameData._bz2_chunks(compressed))
+        return game_data
+
+    @staticmethod
+    def _bz2_chunks(compressed: bytes | BinaryIO) -> Iterator[bytes]:
+        decompressor = bz2.BZ2Decompressor()
+
+        if isinstance(compressed, (bytes, bytearray, memoryview)):
+            view = memoryview(compressed)
+            compressed_chunks = (view[i:i + GameData.CHUNK_SIZE] for i in range(0, len(view), GameData.CHUNK_SIZE))
+        else:
+            compressed_chunks = iter(lambda: compressed.read(GameData.CHUNK_SIZE), b"")
+
+        for chunk in compressed_chunks:
+            # Bounds the decompressed chunks too, a highly compressed chunk could otherwise expand to the whole log
+            data = decompressor.decompress(chunk, GameData.CHUNK_SIZE)
+            while data:
+                yield data
+                if decompressor.eof or decompressor.needs_input:
+                    break
+                data = decompressor.decompress(b"", GameData.CHUNK_SIZE)
+            if decompressor.eof:
+                break
+
+        if not decompressor.eof:
+            raise EOFError("Compressed log ended before the end of the bz2 stream")
 
     def reset(self):
         self.game_type = ""
@@ -397,31 +634,84 @@ class GameData(JsonSerializable):
             current_round.events.insert(-1, RiichiEvent(player))
 
     def default(self, tag, _):
-        if tag[0] in "DEFG":
-            current_round = self.rounds[-1]
-            current_round.events.append(DiscardTileEvent(ord(tag[0]) - ord("D"), Tile(tag[1:])))
-        elif tag[0] in "TUVW":
-            current_round = self.rounds[-1]
+        draw_discard = GameData._DRAW_DISCARD_TAGS.get(tag)
+        if draw_discard is not None:
+            self._draw_discard(*draw_discard)
 
-            player = ord(tag[0]) - ord("T")
-            current_round.events.append(DrawTileEvent(player, Tile(tag[1:])))
+    def _draw_discard(self, is_draw: bool, player: int, tile: Tile):
+        current_round = self.rounds[-1]
+        if is_draw:
+            current_round.events.append(DrawTileEvent(player, tile))
             current_round.turns[player] += 1
+        else:
+            current_round.events.append(DiscardTileEvent(player, tile))
 
     @staticmethod
     def decode_list(thislist, dtype: type = int):
         return tuple(dtype(i) for i in thislist.split(","))
 
-    def decode(self, log: str | TextIO):
-        try:
-            events = XMLElementTree.parse(log).getroot()
-        except OSError:
-            events = XMLElementTree.fromstring(log)
-
-        tags = {key[4:]: getattr(GameData, key) for key in GameData.__dict__ if key.startswith("tag_")}
+    def decode(self, log: str | bytes | TextIO | BinaryIO):
+        """
+        Decodes a log
+        :param log: The log's xml, a path to it or a file of it
+        :return: N/A
+        """
+        if isinstance(log, (bytes, bytearray)):
+            chunks = (log[i:i + GameData.CHUNK_SIZE] for i in range(0, len(log), GameData.CHUNK_SIZE))
+        elif isinstance(log, str):
+            if not log.lstrip().startswith("<"):
+                with open(log, "rb") as f:
+                    self.decode(f)
+                return
+            chunks = (log[i:i + GameData.CHUNK_SIZE] for i in range(0, len(log), GameData.CHUNK_SIZE))
+        else:
+            chunks = iter(lambda: log.read(GameData.CHUNK_SIZE), log.read(0))
+
+        self.decode_chunks(chunks)
+
+    def decode_chunks(self, chunks: Iterable[str | bytes]):
+        """
+        Decodes a log from consecutive pieces of its xml
+        Each tag is handled as soon as it is parsed and then thrown away, so the element tree is never built
+        :param chunks: Pieces of the xml
+        :return: N/A
+        """
+        tags = GameData._TAG_HANDLERS
+        draw_discard_tags = GameData._DRAW_DISCARD_TAGS
+        draw_discard_handler = self._draw_discard
+        default = GameData.default
 
         self.reset()
-        for event in events:
-            tags.get(event.tag, GameData.default)(self, event.tag, event.attrib)
+
+        parser = XMLElementTree.XMLPullParser(("start", "end"))
+        root = None
+        depth = 0
+
+        def handle_events():
+            nonlocal root, depth
+            for event, element in parser.read_events():
+                if event == "start":
+                    if root is None:
+                        root = element
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 1:
+                        # Direct child of the root, same as iterating over the root
+                        tag = element.tag
+                        draw_discard = draw_discard_tags.get(tag)
+                        if draw_discard is not None:
+                            # Most of the tags, skips the handler lookup
+                            draw_discard_handler(*draw_discard)
+                        else:
+                            tags.get(tag, default)(self, tag, element.attrib)
+                        root.clear()
+
+        for chunk in chunks:
+            parser.feed(chunk)
+            handle_events()
+        parser.close()
+        handle_events()
 
         self._finish_round()
 
@@ -440,6 +730,16 @@ class GameData(JsonSerializable):
             current_round.events.append(TsumoEvent(current_round.agari[0].winning_player))
 
 
+# Tag name: handler, built once instead of on every decode
+GameData._TAG_HANDLERS = {key[4:]: value for key, value in GameData.__dict__.items() if key.startswith("tag_")}
+
+# Every draw (T-W) and discard (D-G) tag: (is draw, player, tile), ex: "U12" -> (True, 1, Tile(12))
+GameData._DRAW_DISCARD_TAGS = {
+    f"{chr(ord(first) + player)}{i}": (first == "T", player, Tile(i))
+    for first in "TD" for player in range(4) for i in range(136)
+}
+
+
 def test(old_log, new_log):
     import json
 
@@ -481,14 +781,100 @@ def test(old_log, new_log):
         assert j == len(old_round["events"]) and k == len(new_round["events"])
 
 
+class DecodeError(Exception):
+    """
+    A log that decode_many could not decode
+    Holds the original error as text, since it may have been raised in another process
+    """
+
+
+def _decode_batch(compressed_logs: list[bytes], transform: Callable[[GameData], Any] | None) -> list[tuple]:
+    """
+    Decodes a batch of logs, run in the worker processes of decode_many
+    :param compressed_logs: bz2 compressed logs
+    :param transform: Applied to every decoded game
+    :return: (GameData or transformed game, None) or (None, DecodeError) per log
+    """
+    ret = []
+    for compressed in compressed_logs:
+        try:
+            game_data = GameData.from_bz2(compressed)
+            ret.append((game_data if transform is None else transform(game_data), None))
+        except Exception as e:
+            ret.append((None, DecodeError(f"{type(e).__name__}: {e}")))
+    return ret
+
+
+def map_ordered(items: Iterable, batch_fn: Callable[[list], list], workers: int = None, batch_size: int = 16,
+                max_in_flight: int = None, initializer: Callable = None, initargs: tuple = ()) -> Iterator:
+    """
+    Runs batch_fn over batches of items on a process pool, in order
+    Only max_in_flight batches are read ahead of the consumer, so items can be a lazy db cursor
+    :param items: Items, ex: bz2 compressed logs
+    :param batch_fn: Called with a list of items in a worker, returns one result per item, must be picklable
+    :param workers: Number of processes, defaults to the number of cpus, 0 or 1 runs in this process
+    :param batch_size: Number of items sent to a worker at once
+    :param max_in_flight: Maximum number of batches submitted but not consumed yet, defaults to 2 per worker
+    :param initializer: Called with initargs once in every worker (or in this process when it runs in this process)
+    :param initargs: Arguments of initializer
+    :return: Results of every item
+    """
+    def batches() -> Iterator[list]:
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for batch in batches():
+            yield from batch_fn(batch)
+        return
+
+    max_in_flight = max_in_flight or 2 * workers
+    pool = concurrent.futures.ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs)
+    try:
+        in_flight = collections.deque()
+        for batch in batches():
+            if len(in_flight) >= max_in_flight:
+                yield from in_flight.popleft().result()
+            in_flight.append(pool.submit(batch_fn, batch))
+
+        while in_flight:
+            yield from in_flight.popleft().result()
+    finally:
+        # Also reached when the consumer stops early, the batches not started yet are dropped
+        pool.shutdown(cancel_futures=True)
+
+
+def decode_many(compressed_logs: Iterable[bytes], workers: int = None, batch_size: int = 16,
+                max_in_flight: int = None, transform: Callable[[GameData], Any] = None) -> Iterator[tuple]:
+    """
+    Decodes many bz2 compressed logs on a process pool, in order, see map_ordered
+    :param compressed_logs: bz2 compressed logs
+    :param workers: Number of processes, defaults to the number of cpus, 0 or 1 decodes in this process
+    :param batch_size: Number of logs sent to a worker at once
+    :param max_in_flight: Maximum number of batches submitted but not consumed yet, defaults to 2 per worker
+    :param transform: Applied to every decoded game in the worker, must be picklable (a module level function)
+        Ex: game_cache.game_columns, whose result is a lot cheaper to send back than the GameData
+    :return: (GameData or transformed game, None) per log, (None, DecodeError) for logs that failed to decode
+    """
+    return map_ordered(compressed_logs, functools.partial(_decode_batch, transform=transform), workers, batch_size,
+                       max_in_flight)
+
+
 def extract_bz2(hex_str: str):
     if hex_str.startswith("0x"):
         hex_str = hex_str[2:]
 
-    compressed = bytes.fromhex(hex_str)
-    decompressed = bz2.decompress(compressed).decode()
-
-    return GameData(decompressed)
+    return GameData.from_bz2(bytes.fromhex(hex_str))
 
 
 if __name__ == '__main__':
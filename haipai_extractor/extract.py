@@ -1,104 +1,99 @@
+import functools
 import itertools
 import os.path
-import bz2
+import sys
+from typing import Iterable, Iterator
 import numpy as np
-from event_extractor import tenhou_decoder
+from event_extractor import db_writer, game_cache, tenhou_decoder
 import gzip
-import sqlite3
-import time
 
 
-def get_hand_permutations(hand: list[tenhou_decoder.Tile]):
+@functools.lru_cache(maxsize=None)
+def get_relabel_maps(suits_present: int, dragons_present: int) -> np.ndarray:
     """
-    Changes tiles around
+    Every relabeling of a hand as t37 lookup arrays: the suits present are mapped onto every ordered choice of
+    suits, and the dragons present onto every ordered choice of dragons, suit permutations outer and dragon
+    permutations inner (both in itertools.permutations order). Winds are never relabeled
+    Suited tiles are at suit * 10 + offset in t37 (an aka keeps its offset), winds at 30-33 and dragons at 34-36
+    :param suits_present: Bitmask of the suits (man, pin, sou) in the hand
+    :param dragons_present: Bitmask of the dragons (white, green, red) in the hand
+    :return: Read only (k, 37) array, row j maps a t37 index to its index in the j-th permuted hand
     """
-    mps_present = [0, 0, 0]  # Man, Pin, Sou
-    dragon_present = [0, 0, 0]  # White, Green, Red
-
-    for i in hand:
-        if i.tile < 9:
-            mps_present[0] = 1
-        elif i.tile < 18:
-            mps_present[1] = 1
-        elif i.tile < 27:
-            mps_present[2] = 1
-        elif i.tile > 30:
-            dragon_present[i.tile - 31] = 1
-
-    # Converts tile type -> pos in the actual mapping
-    cum = 0
-    mps_mapping_map = []
-    for i in mps_present:
-        mps_mapping_map.append(cum)
-        cum += i
-
-    cum = 0
-    dragon_mapping_map = []
-    for i in dragon_present:
-        dragon_mapping_map.append(cum)
-        cum += i
-
-    for mps_mapping in itertools.permutations([0, 1, 2], sum(mps_present)):
-        temp_hand = []
-
-        idx = 0
-        while idx < 13 and hand[idx].tile < 27:
-            temp_hand.append(tenhou_decoder.Tile(
-                ((mps_mapping[mps_mapping_map[hand[idx].tile // 9]] * 9 + hand[idx].tile % 9) << 2) + hand[
-                    idx].tile_num))
-
-            idx += 1
-
-        while idx < 13 and hand[idx].tile < 31:
-            temp_hand.append(hand[idx])
-            idx += 1
-
-        for dragon_mapping in itertools.permutations([0, 1, 2], sum(dragon_present)):
-            temp_hand_1 = []
-            idx1 = idx
-
-            while idx1 < 13:
-                # Don't care about tile num since no akas in dragons
-                temp_hand_1.append(
-                    tenhou_decoder.Tile(dragon_mapping[dragon_mapping_map[hand[idx1].tile - 31]] + 31 << 2))
-                idx1 += 1
-
-            yield temp_hand + temp_hand_1
+    suits = [i for i in range(3) if suits_present >> i & 1]
+    dragons = [i for i in range(3) if dragons_present >> i & 1]
+
+    maps = []
+    for mps_mapping in itertools.permutations([0, 1, 2], len(suits)):
+        for dragon_mapping in itertools.permutations([0, 1, 2], len(dragons)):
+            tile_map = np.arange(37, dtype=np.intp)
+            for src, dst in zip(suits, mps_mapping):
+                tile_map[src * 10:src * 10 + 10] = np.arange(dst * 10, dst * 10 + 10)
+            for src, dst in zip(dragons, dragon_mapping):
+                tile_map[34 + src] = 34 + dst
+            maps.append(tile_map)
+
+    ret = np.stack(maps)
+    ret.flags.writeable = False
+    return ret
+
+
+def get_round_haipais_v1(round_data: tenhou_decoder.Round, player_scores: list[int], score_scaling=0.01) -> np.ndarray:
+    """
+    Same rows as extract_round_haipais_v1, built as one array
+    Every permuted hand is gathered at once through the maps of get_relabel_maps
+    :param round_data: Round
+    :param player_scores: [p0, p1, p2, p3]
+    :param score_scaling: Scaling of the scores and score changes
+    :return: (k, 23) float32 array, the rows of each player in turn
+    """
+    hands = np.empty((4, 13), dtype=np.intp)
+    metadata = np.empty((4, 9))
+    maps = []
+
+    for i, hand in enumerate(round_data.starting_hands):
+        hands[i] = [tile.get_t37_idx() for tile in sorted(hand)]
+
+        suits_present = 0
+        dragons_present = 0
+        for tile in hands[i].tolist():
+            if tile < 30:
+                suits_present |= 1 << tile // 10
+            elif tile > 33:
+                dragons_present |= 1 << tile - 34
+        maps.append(get_relabel_maps(suits_present, dragons_present))
+
+        metadata[i] = (
+            round_data.round_no.round_no // 4,  # Round Wind
+            round_data.rii_sticks,  # Rii Sticks
+            round_data.honba_count,  # Honba Count
+            (round_data.round_no.round_no % 4 - i + 4) % 4,  # Relative Dealer Position
+            player_scores[i] * score_scaling,  # Your Score
+            player_scores[(i + 1) % 4] * score_scaling,  # Shimo Score
+            player_scores[(i + 2) % 4] * score_scaling,  # Toimen Score
+            player_scores[(i + 3) % 4] * score_scaling,  # Kami Score
+            round_data.events[0].tile.get_t37_idx(),  # Dora Tile, not permuted
+        )
+
+    player = np.repeat(np.arange(4), [len(i) for i in maps])
+    maps = np.concatenate(maps)
+
+    ret = np.empty((len(maps), 23), dtype=np.float32)
+    ret[:, :9] = metadata[player]
+    ret[:, 9:22] = maps[np.arange(len(maps))[:, None], hands[player]]
+    ret[:, 22] = (np.array(round_data.score_changes, dtype=np.float64) * score_scaling)[player]
+    return ret
 
 
 def extract_round_haipais_v1(round_data: tenhou_decoder.Round, player_scores: list[int], score_scaling=0.01):
     """
     Player Scores: [p0, p1, p2, p3]
 
-    Metadata: Round Wind, Seat Wind, Riichi sticks, Honba Count, p0 score, p1 score, p2 score, p3 score, seat, dora
-    Returns metadata + hand with tiles encoded in t37 style
+    Metadata: Round Wind, Rii sticks, Honba Count, Relative Dealer Position, your score, shimo score, toimen score,
+    kami score, dora
+    Yields metadata + hand with tiles encoded in t37 style + score change, once per permutation of the hand
+    See get_round_haipais_v1 for the whole round as one array
     """
-
-    metadata = [
-        round_data.round_no.round_no // 4,  # Round Wind
-        round_data.rii_sticks,  # Rii Sticks
-        round_data.honba_count,  # Honba Count
-        0,  # Relative Dealer Position (0 = you, 1 = shimo, 2 = toimen, 3 = kami)
-        0,  # Your Score
-        0,  # Kami Score
-        0,  # Toimen Score
-        0,  # Kami Score
-        0,  # Dora Tile
-    ]
-
-    for i, j in enumerate(round_data.starting_hands):
-        metadata_c = metadata[:]
-
-        metadata_c[3] = (round_data.round_no.round_no % 4 - i + 4) % 4
-        metadata_c[4] = player_scores[i] * score_scaling
-        metadata_c[5] = player_scores[(i + 1) % 4] * score_scaling
-        metadata_c[6] = player_scores[(i + 2) % 4] * score_scaling
-        metadata_c[7] = player_scores[(i + 3) % 4] * score_scaling
-        metadata_c[8] = round_data.events[0].tile.get_t37_idx()
-
-        for hand in get_hand_permutations(sorted(round_data.starting_hands[i])):
-            yield np.array(metadata_c + [i.get_t37_idx() for i in hand] + [round_data.score_changes[i] * score_scaling],
-                           dtype=np.float32)
+    yield from get_round_haipais_v1(round_data, player_scores, score_scaling)
 
 
 def compress_arr(arr):
@@ -114,16 +109,60 @@ def extract_game_haipais_v1(game_state: tenhou_decoder.GameData):
         scores = [r.score_changes[i] + j for i, j in enumerate(scores)]
 
 
-def main(games_loc: str, haipai_loc: str = None):
-    haipai_loc = haipai_loc or os.path.abspath(__file__ + "/../../db/haipai.db")
-    games_loc = os.path.abspath(games_loc).replace("'", "''")
+# Game cache of the worker processes of extract_many, opened once per process
+_worker_cache: game_cache.GameCache | None = None
+
+
+def _init_worker(cache_loc: str | None):
+    global _worker_cache
+    _worker_cache = game_cache.GameCache(cache_loc) if cache_loc else None
+
+
+def _extract_batch(logs: list[tuple[str, bytes | None]]) -> list[tuple]:
+    """
+    Extracts the compressed haipai rows of a batch of logs, run in the worker processes of extract_many
+    :param logs: (log_id, bz2 compressed log, None when the game is in the cache of the worker)
+    :return: (log_id, rows, None) or (log_id, None, DecodeError) per log
+    """
+    ret = []
+    for log_id, content in logs:
+        try:
+            game = _worker_cache.get(log_id) if content is None else tenhou_decoder.GameData.from_bz2(content)
+            ret.append((log_id, [compress_arr(i) for i in extract_game_haipais_v1(game)], None))
+        except Exception as e:
+            ret.append((log_id, None, tenhou_decoder.DecodeError(f"{type(e).__name__}: {e}")))
+    return ret
+
+
+def extract_many(logs: Iterable[tuple[str, bytes | None]], workers: int = None, cache_loc: str = None,
+                 batch_size: int = 16, max_in_flight: int = None) -> Iterator[tuple]:
+    """
+    Extracts the compressed haipai rows of many logs on a process pool, in order, see tenhou_decoder.map_ordered
+    :param logs: (log_id, bz2 compressed log), the log can be None when the game is in the cache
+    :param workers: Number of processes, defaults to the number of cpus, 0 or 1 extracts in this process
+    :param cache_loc: Game cache opened by every worker, see event_extractor.game_cache
+    :param batch_size: Number of logs sent to a worker at once
+    :param max_in_flight: Maximum number of batches submitted but not consumed yet, defaults to 2 per worker
+    :return: (log_id, rows, None) per log, (log_id, None, DecodeError) for logs that failed to decode or extract
+    """
+    return tenhou_decoder.map_ordered(logs, _extract_batch, workers, batch_size, max_in_flight,
+                                      initializer=_init_worker, initargs=(cache_loc,))
 
-    if not os.path.exists(haipai_loc):
-        with sqlite3.connect(haipai_loc) as conn:
-            cur_read = conn.cursor()
 
-            cur_read.execute("CREATE TABLE indexed(log_id TEXT primary key)")
-            cur_read.execute("CREATE TABLE haipai(log_id INT, board_state BLOB)")
+def main(games_loc: str, haipai_loc: str = None, cache_loc: str = None, workers: int = None):
+    """
+    Extracts the haipai of every game not indexed yet
+    One reader streams the logs to the workers of extract_many, and their rows are written back in order by this
+    process, so the db is the same as a serial run. Logs that fail are skipped and not indexed, so they are retried
+    on the next run. Memory is bounded by the batches in flight and the batch of the writer
+    :param games_loc: Path to the games db
+    :param haipai_loc: Path to the haipai db, created when it does not exist
+    :param cache_loc: Game cache, the games in it are not decoded
+    :param workers: Number of processes, see extract_many
+    :return: N/A
+    """
+    haipai_loc = haipai_loc or os.path.abspath(__file__ + "/../../db/haipai.db")
+    games_loc = os.path.abspath(games_loc).replace("'", "''")
 
     # Sanitize String
     if not os.path.exists(games_loc):
@@ -132,29 +171,32 @@ def main(games_loc: str, haipai_loc: str = None):
     if ";" in games_loc or "--" in games_loc:
         raise Exception("Invalid chars in db path")
 
-    last_seen = time.time()
+    # Games are read from the cache when one is given, see event_extractor.game_cache
+    cache = game_cache.GameCache(cache_loc) if cache_loc else None
+    content_col = "NULL" if cache is not None else "gamedb.logs.log_content"
 
-    with sqlite3.connect(haipai_loc) as conn:
-        cur_read = conn.cursor()
-        cur_write = conn.cursor()
+    with db_writer.BatchWriter(haipai_loc, {"haipai": "log_id INT, board_state BLOB"}) as writer:
+        cur_read = writer.conn.cursor()
 
         # Good Luck All
         cur_read.execute(f"ATTACH DATABASE '{games_loc}' AS gamedb")
         cur_read.execute(
-            "SELECT gamedb.logs.log_id, gamedb.logs.log_content FROM gamedb.logs LEFT JOIN indexed ON gamedb.logs.log_id = indexed.log_id WHERE indexed.log_id IS NULL AND NOT gamedb.logs.is_sanma AND NOT gamedb.logs.is_tonpuu")
-
-        for i, (game_id, content) in enumerate(cur_read):
-            if i % 500 == 0:
-                print(f"Row: {i}, Time Taken: {time.time() - last_seen}")
-                last_seen = time.time()
-                conn.commit()
-
-            cur_write.execute("INSERT INTO indexed VALUES(?)", (game_id,))
-            row_id = cur_write.lastrowid
-
-            decompressed = bz2.decompress(content).decode()
-            for haipai in extract_game_haipais_v1(tenhou_decoder.GameData(decompressed)):
-                cur_write.execute("INSERT INTO haipai VALUES(?, ?)", (row_id, compress_arr(haipai)))
+            f"SELECT gamedb.logs.log_id, {content_col} FROM gamedb.logs LEFT JOIN indexed ON gamedb.logs.log_id = indexed.log_id WHERE indexed.log_id IS NULL AND NOT gamedb.logs.is_sanma AND NOT gamedb.logs.is_tonpuu")
+
+        def logs() -> Iterator[tuple[str, bytes | None]]:
+            for log_id, content in cur_read:
+                if content is None and cache is not None and log_id not in cache:
+                    content = writer.conn.execute("SELECT log_content FROM gamedb.logs WHERE log_id = ?",
+                                                  (log_id,)).fetchone()[0]
+                yield log_id, content
+
+        for game_id, rows, error in extract_many(logs(), workers, cache_loc):
+            if error is not None:
+                print(f"Skipping {game_id}: {error}", file=sys.stderr)
+                continue
+
+            row_id = writer.add_game(game_id)
+            writer.add_rows("haipai", [(row_id, i) for i in rows])
 
 
 if __name__ == "__main__":
@@ -764,7 +764,15 @@ pub fn ensure_init() {
     assert_eq!(AGARI_TABLE.len(), AGARI_TABLE_SIZE);
 }
 
-fn get_tile14_and_key(tiles: &[u8; 34]) -> ([u8; 14], u32) {
+/// Returns `true` if `key` (see [`get_tile14_and_key`]) is a complete hand.
+#[must_use]
+pub fn is_agari_key(key: u32) -> bool {
+    AGARI_TABLE.get(&key).is_some()
+}
+
+/// `tiles` must not hold more than 14 kinds of tiles.
+#[must_use]
+pub fn get_tile14_and_key(tiles: &[u8; 34]) -> ([u8; 14], u32) {
     let mut tile14 = [0; 14];
     let mut tile14_iter = tile14.iter_mut();
     let mut key = 0;
@@ -0,0 +1,251 @@
+//! Batched shanten, waits and agari key calculation over numpy arrays, used by
+//! the Python package `shanten_calcs` when this extension is importable.
+//!
+//! All functions take an `(N, 34)` array of tile counts, release the GIL and
+//! spread the hands over the rayon thread pool. Results are the same as the
+//! pure Python backend of `shanten_calcs`.
+
+use super::{agari, shanten};
+use crate::py_helper::add_submodule;
+
+use anyhow::{Result, ensure};
+use ndarray::prelude::*;
+use numpy::{PyArray1, PyArray2, PyReadonlyArray1, PyReadonlyArray2};
+use pyo3::prelude::*;
+use rayon::prelude::*;
+
+fn to_hands(tiles: &ArrayView2<'_, u8>) -> Result<Vec<[u8; 34]>> {
+    ensure!(
+        tiles.ncols() == 34,
+        "expected an (N, 34) array of tiles, got {:?}",
+        tiles.shape(),
+    );
+
+    tiles
+        .outer_iter()
+        .map(|row| {
+            let mut hand = [0; 34];
+            for (h, &c) in hand.iter_mut().zip(row.iter()) {
+                ensure!(c <= 4, "invalid tile count {c}");
+                *h = c;
+            }
+            Ok(hand)
+        })
+        .collect()
+}
+
+fn to_len_div3(len_div3: &ArrayView1<'_, u8>, n: usize) -> Result<Vec<u8>> {
+    ensure!(
+        len_div3.len() == n,
+        "expected {n} len_div3 values, got {}",
+        len_div3.len(),
+    );
+    ensure!(
+        len_div3.iter().all(|&l| l <= 4),
+        "len_div3 must be within [0, 4]",
+    );
+    Ok(len_div3.to_vec())
+}
+
+/// Same as `shanten_calcs.calc_all_batch`.
+///
+/// Returns an `(N,)` int8 array.
+#[pyfunction]
+pub fn calc_all_batch<'py>(
+    py: Python<'py>,
+    tiles: PyReadonlyArray2<'py, u8>,
+    len_div3: PyReadonlyArray1<'py, u8>,
+) -> Result<Bound<'py, PyArray1<i8>>> {
+    let tiles = tiles.as_array();
+    let len_div3 = len_div3.as_array();
+
+    let ret = py.allow_threads(move || {
+        let hands = to_hands(&tiles)?;
+        let len_div3 = to_len_div3(&len_div3, hands.len())?;
+        let ret: Vec<_> = hands
+            .par_iter()
+            .zip(len_div3.par_iter())
+            .map(|(hand, &l)| shanten::calc_all(hand, l))
+            .collect();
+        anyhow::Ok(ret)
+    })?;
+
+    Ok(PyArray1::from_vec(py, ret))
+}
+
+/// Same as calling `shanten_calcs.get_hand_waits` on every hand, which only
+/// knows normal hands and chitoi (no kokushi).
+///
+/// Returns an `(N, 34)` bool array, `true` where the tile completes the hand.
+#[pyfunction]
+pub fn waits_batch<'py>(
+    py: Python<'py>,
+    tiles: PyReadonlyArray2<'py, u8>,
+    len_div3: PyReadonlyArray1<'py, u8>,
+) -> Result<Bound<'py, PyArray2<bool>>> {
+    let tiles = tiles.as_array();
+    let len_div3 = len_div3.as_array();
+
+    let ret = py.allow_threads(move || {
+        let hands = to_hands(&tiles)?;
+        let len_div3 = to_len_div3(&len_div3, hands.len())?;
+        let rows: Vec<[bool; 34]> = hands
+            .par_iter()
+            .zip(len_div3.par_iter())
+            .map(|(hand, &l)| {
+                let mut waits = [false; 34];
+                let mut tmp = *hand;
+                for (t, w) in waits.iter_mut().enumerate() {
+                    if hand[t] >= 4 {
+                        continue;
+                    }
+                    tmp[t] += 1;
+                    *w = shanten::calc_normal(&tmp, l) == -1
+                        || (l == 4 && shanten::calc_chitoi(&tmp) == -1);
+                    tmp[t] -= 1;
+                }
+                waits
+            })
+            .collect();
+
+        let mut ret = Array2::from_elem((rows.len(), 34), false);
+        for (mut dst, src) in ret.outer_iter_mut().zip(&rows) {
+            dst.assign(&ArrayView1::from(src));
+        }
+        anyhow::Ok(ret)
+    })?;
+
+    Ok(PyArray2::from_owned_array(py, ret))
+}
+
+/// Same as `shanten_calcs.get_tile14_and_key_batch`, plus whether each key is
+/// in the agari table.
+///
+/// Returns an `(N, 14)` uint8 array of tile14, an `(N,)` uint32 array of keys
+/// and an `(N,)` bool array.
+#[pyfunction]
+#[allow(clippy::type_complexity)]
+pub fn agari_key_batch<'py>(
+    py: Python<'py>,
+    tiles: PyReadonlyArray2<'py, u8>,
+) -> Result<(
+    Bound<'py, PyArray2<u8>>,
+    Bound<'py, PyArray1<u32>>,
+    Bound<'py, PyArray1<bool>>,
+)> {
+    let tiles = tiles.as_array();
+
+    let (tile14, keys, is_agari) = py.allow_threads(move || {
+        let hands = to_hands(&tiles)?;
+        ensure!(
+            hands.iter().all(|h| h.iter().filter(|&&c| c > 0).count() <= 14),
+            "hands must not hold more than 14 kinds of tiles",
+        );
+
+        let rows: Vec<_> = hands
+            .par_iter()
+            .map(|hand| {
+                let (tile14, key) = agari::get_tile14_and_key(hand);
+                (tile14, key, agari::is_agari_key(key))
+            })
+            .collect();
+
+        let mut tile14 = Array2::zeros((rows.len(), 14));
+        for (mut dst, (src, _, _)) in tile14.outer_iter_mut().zip(&rows) {
+            dst.assign(&ArrayView1::from(src));
+        }
+        let keys = rows.iter().map(|&(_, key, _)| key).collect::<Vec<_>>();
+        let is_agari = rows.iter().map(|&(_, _, a)| a).collect::<Vec<_>>();
+        anyhow::Ok((tile14, keys, is_agari))
+    })?;
+
+    Ok((
+        PyArray2::from_owned_array(py, tile14),
+        PyArray1::from_vec(py, keys),
+        PyArray1::from_vec(py, is_agari),
+    ))
+}
+
+pub(crate) fn register_module(
+    py: Python<'_>,
+    prefix: &str,
+    super_mod: &Bound<'_, PyModule>,
+) -> PyResult<()> {
+    let m = PyModule::new(py, "algo")?;
+    m.add_function(wrap_pyfunction!(calc_all_batch, &m)?)?;
+    m.add_function(wrap_pyfunction!(waits_batch, &m)?)?;
+    m.add_function(wrap_pyfunction!(agari_key_batch, &m)?)?;
+    add_submodule(py, prefix, super_mod, &m)
+}
+
+#[cfg(test)]
+mod test {
+    use super::*;
+    use crate::hand::hand;
+
+    // The same vectors as `shanten::test`, the batch must agree with the
+    // scalar functions on every one of them.
+    const HANDS: &[(&str, u8)] = &[
+        ("1111m 333p 222s 444z", 4),
+        ("147m 258p 369s 1234z", 4),
+        ("468m 33346p 7s", 3),
+        ("147m 258p 3s", 2),
+        ("4455s", 1),
+        ("15559m 19p 19s 1234z", 4),
+        ("9999m 6677p 88s 355z", 4),
+        ("19m 19p 159s 123456z", 4),
+        ("2344456m 14p 127s 2z 7p", 4),
+        ("344455667p 1139s 9p", 4),
+        ("122334m 678p 37s 22z 5s", 4),
+        ("12223456m 78889p 2m", 4),
+        ("1133557799m 113p", 4),
+        ("34778p", 1),
+    ];
+
+    fn hands() -> (Vec<[u8; 34]>, Vec<u8>) {
+        HANDS
+            .iter()
+            .map(|&(s, l)| (hand(s).unwrap(), l))
+            .unzip()
+    }
+
+    #[test]
+    fn batch_matches_scalar() {
+        let (hands, len_div3) = hands();
+        let tiles = Array2::from_shape_fn((hands.len(), 34), |(i, t)| hands[i][t]);
+        let len_div3 = Array1::from(len_div3);
+
+        Python::with_gil(|py| {
+            let tiles = numpy::PyArray2::from_owned_array(py, tiles);
+            let len_div3 = numpy::PyArray1::from_owned_array(py, len_div3.clone());
+
+            let shantens = calc_all_batch(py, tiles.readonly(), len_div3.readonly()).unwrap();
+            let waits = waits_batch(py, tiles.readonly(), len_div3.readonly()).unwrap();
+            let (_, keys, is_agari) = agari_key_batch(py, tiles.readonly()).unwrap();
+
+            let shantens = shantens.readonly();
+            let waits = waits.readonly();
+            let keys = keys.readonly();
+            let is_agari = is_agari.readonly();
+            let len_div3 = len_div3.readonly();
+
+            for (i, hand) in hands.iter().enumerate() {
+                let l = len_div3.as_array()[i];
+                assert_eq!(shantens.as_array()[i], shanten::calc_all(hand, l));
+
+                let (_, key) = agari::get_tile14_and_key(hand);
+                assert_eq!(keys.as_array()[i], key);
+                assert_eq!(is_agari.as_array()[i], agari::is_agari_key(key));
+
+                for t in 0..34 {
+                    let mut tmp = *hand;
+                    tmp[t] += 1;
+                    let expected = hand[t] < 4
+                        && (shanten::calc_normal(&tmp, l) == -1
+                            || (l == 4 && shanten::calc_chitoi(&tmp) == -1));
+                    assert_eq!(waits.as_array()[[i, t]], expected);
+                }
+            }
+        });
+    }
+}
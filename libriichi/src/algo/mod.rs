@@ -2,6 +2,9 @@
 //! single-player calculators and score lookups.
 
 pub mod agari;
+mod batch;
 pub mod point;
 pub mod shanten;
 pub mod sp;
+
+pub(crate) use batch::register_module;
@@ -132,6 +132,7 @@ static GLOBAL: mimalloc::MiMalloc = mimalloc::MiMalloc;
 /// - Definitions of observation and action space for Mortal (via `consts`).
 /// - Statistical works on mjai logs (via `stat.Stat`).
 /// - mjai interface (via `mjai.Bot`).
+/// - Batched shanten, waits and agari keys over numpy arrays (via `algo`).
 #[pymodule]
 fn riichi(py: Python<'_>, m: &Bound<'_, PyModule>) -> PyResult<()> {
     pyo3_log::init();
@@ -154,6 +155,7 @@ fn riichi(py: Python<'_>, m: &Bound<'_, PyModule>) -> PyResult<()> {
     arena::register_module(py, name, m)?;
     stat::register_module(py, name, m)?;
     mjai::register_module(py, name, m)?;
+    algo::register_module(py, name, m)?;
 
     Ok(())
 }
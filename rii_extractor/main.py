@@ -1,10 +1,7 @@
-from event_extractor import tenhou_decoder, tenhou_game_state
+from event_extractor import db_writer, game_cache, tenhou_decoder, tenhou_game_state
 import shanten_calcs
 import os
-import sqlite3
 import json
-import time
-import bz2
 
 
 def extract_riis(game_data: tenhou_decoder.GameData):
@@ -39,17 +36,10 @@ def extract_riis(game_data: tenhou_decoder.GameData):
     return riis
 
 
-def main(games_loc: str, rii_loc: str = None):
+def main(games_loc: str, rii_loc: str = None, cache_loc: str = None):
     rii_loc = rii_loc or os.path.abspath(__file__ + "/../../db/rii.db")
     games_loc = os.path.abspath(games_loc).replace("'", "''")
 
-    if not os.path.exists(rii_loc):
-        with sqlite3.connect(rii_loc) as conn:
-            cur_read = conn.cursor()
-
-            cur_read.execute("CREATE TABLE indexed(log_id TEXT primary key)")
-            cur_read.execute("CREATE TABLE riichi(log_id INT, num_discards INT, tile INT, winning_tiles STR)")
-
     # Sanitize String
     if not os.path.exists(games_loc):
         raise Exception("Game DB does not exist")
@@ -57,30 +47,23 @@ def main(games_loc: str, rii_loc: str = None):
     if ";" in games_loc or "--" in games_loc:
         raise Exception("Invalid chars in db path")
 
-    last_seen = time.time()
+    # Games are read from the cache when one is given, see event_extractor.game_cache
+    cache = game_cache.GameCache(cache_loc) if cache_loc else None
+    content_col = "NULL" if cache is not None else "gamedb.logs.log_content"
 
-    with sqlite3.connect(rii_loc) as conn:
-        cur_read = conn.cursor()
-        cur_write = conn.cursor()
+    tables = {"riichi": "log_id INT, num_discards INT, tile INT, winning_tiles STR"}
+    with db_writer.BatchWriter(rii_loc, tables) as writer:
+        cur_read = writer.conn.cursor()
 
         # Good Luck All
         cur_read.execute(f"ATTACH DATABASE '{games_loc}' AS gamedb")
         cur_read.execute(
-            "SELECT gamedb.logs.log_id, gamedb.logs.log_content FROM gamedb.logs LEFT JOIN indexed ON gamedb.logs.log_id = indexed.log_id WHERE indexed.log_id IS NULL AND NOT gamedb.logs.is_sanma AND NOT gamedb.logs.is_tonpuu")
-
-        for i, (game_id, content) in enumerate(cur_read):
-            if i % 500 == 0:
-                print(f"Row: {i}, Time Taken: {time.time() - last_seen}")
-                last_seen = time.time()
-                conn.commit()
-
-            cur_write.execute("INSERT INTO indexed VALUES(?)", (game_id,))
-            row_id = cur_write.lastrowid
+            f"SELECT gamedb.logs.log_id, {content_col} FROM gamedb.logs LEFT JOIN indexed ON gamedb.logs.log_id = indexed.log_id WHERE indexed.log_id IS NULL AND NOT gamedb.logs.is_sanma AND NOT gamedb.logs.is_tonpuu")
 
-            decompressed = bz2.decompress(content).decode()
-            for rii in extract_riis(tenhou_decoder.GameData(decompressed)):
-                cur_write.execute("INSERT INTO riichi VALUES (?, ?, ?, ?)",
-                                  (row_id, rii[0], rii[1], json.dumps(rii[2])))
+        for game_id, content in cur_read:
+            row_id = writer.add_game(game_id)
+            game = game_cache.get_game(cache, writer.conn, game_id, content)
+            writer.add_rows("riichi", [(row_id, rii[0], rii[1], json.dumps(rii[2])) for rii in extract_riis(game)])
 
 
 if __name__ == "__main__":
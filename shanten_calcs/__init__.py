@@ -1,5 +1,20 @@
-from .shanten_calc import calc_all
-from .agari import get_tile14_and_key, get_hand_waits, get_agari_data
+from .backend import get_backend, set_backend
+from .shanten_calc import build_tables, calc_all, calc_all_batch, load_tables, IncrementalShanten
+from .agari import (get_tile14_and_key, get_tile14_and_key_batch, get_agari_data, get_agari_table,
+                    is_agari_batch)
+from .waits import (get_hand_waits, get_hand_waits_batch, get_hand_waits_from_key, get_hand_wait_mask_from_key,
+                    hand_key, hand_key_add, hand_from_key, wait_cache_info, wait_cache_clear)
+from .efficiency import (ukeire, ukeire_batch, ukeire_cache_info, discard_shanten, tenpai_discards,
+                         discard_cache_info)
+
+
+def preload():
+    """
+    Loads the shanten and agari tables ahead of time, they are otherwise loaded on first use
+    :return: N/A
+    """
+    load_tables()
+    get_agari_table()
 
 
 def convert_t14_to_full(tiles: list[int]):
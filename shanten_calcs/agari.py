@@ -8,32 +8,71 @@
 # * Algorithm: <http://hp.vector.co.jp/authors/VA046927/mjscore/mjalgorism.html>
 
 import gzip
+import os
 import struct
 
+import numpy as np
+
+from . import backend
+
+# get_hand_waits used to live here, it is now calculated from the shanten tables
+from .waits import get_hand_waits  # noqa: F401
+
 
 # TL Note: Agari means Win
 class AgariData:
     """
     A class used to deserialize data from the agari table
+    Only the raw flags are stored, the fields are decoded when accessed
     """
+    __slots__ = ("flags",)
+
+    def __init__(self, flags: int):
+        self.flags = flags
+
+    @property
+    def pair_idx(self) -> int:
+        return (self.flags >> 6) & 0b1111
+
+    # Triplet
+    @property
+    def kotsu_count(self) -> int:
+        return self.flags & 0b111
+
+    @property
+    def kotsu_idxs(self) -> list[int]:
+        return [((self.flags >> (10 + i * 4)) & 0b1111) for i in range(self.kotsu_count)]
+
+    # Sequence
+    @property
+    def shuntsu_count(self) -> int:
+        return (self.flags >> 3) & 0b111
+
+    @property
+    def shuntsu_idxs(self) -> list[int]:
+        kotsu_count = self.kotsu_count
+        return [((self.flags >> (10 + i * 4)) & 0b1111) for i in
+                range(kotsu_count, kotsu_count + self.shuntsu_count)]
 
-    def __init__(self, flags):
-        self.pair_idx = (flags >> 6) & 0b1111
+    @property
+    def has_chitoi(self) -> bool:
+        return ((self.flags >> 26) & 1) == 1
 
-        # Triplet
-        self.kotsu_count = flags & 0b111
-        self.kotsu_idxs = [((flags >> (10 + i * 4)) & 0b1111) for i in range(self.kotsu_count)]
+    @property
+    def has_chuuren(self) -> bool:
+        return ((self.flags >> 27) & 1) == 1
 
-        # Sequence
-        self.shuntsu_count = (flags >> 3) & 0b111
-        self.shuntsu_idxs = [((flags >> (10 + i * 4)) & 0b1111) for i in
-                             range(self.kotsu_count, self.kotsu_count + self.shuntsu_count)]
+    @property
+    def has_ittsuu(self) -> bool:
+        return ((self.flags >> 28) & 1) == 1
 
-        self.has_chitoi = ((flags >> 26) & 1) == 1
-        self.has_chuuren = ((flags >> 27) & 1) == 1
-        self.has_ittsuu = ((flags >> 28) & 1) == 1
-        self.has_ryanpeikou = ((flags >> 29) & 1) == 1
-        self.has_ipeikou = ((flags >> 30) & 1) == 1
+    @property
+    def has_ryanpeikou(self) -> bool:
+        return ((self.flags >> 29) & 1) == 1
+
+    @property
+    def has_ipeikou(self) -> bool:
+        return ((self.flags >> 30) & 1) == 1
 
     def __repr__(self):
         return (f"AgariData(pair_idx={self.pair_idx}, kotsu_idxs={self.kotsu_idxs}, "
@@ -42,7 +81,62 @@ class AgariData:
                 f"has_ryanpeikou={self.has_ryanpeikou}, has_ipeikou={self.has_ipeikou})")
 
 
-def load_table_from_gzip(file_loc: str = "data/agari.bin.gz", table_size: int = 9362) -> dict[int, list[AgariData]]:
+class AgariTable:
+    """
+    The Agari Table stored as arrays
+    keys is sorted, the flags of keys[i] are flags[offsets[i]:offsets[i + 1]]
+    """
+
+    def __init__(self, keys: np.ndarray, offsets: np.ndarray, flags: np.ndarray):
+        self.keys = keys
+        self.offsets = offsets
+        self.flags = flags
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _find(self, key: int) -> int:
+        idx = int(np.searchsorted(self.keys, key))
+        if idx < len(self.keys) and self.keys[idx] == key:
+            return idx
+        return -1
+
+    def __contains__(self, key: int) -> bool:
+        return self._find(key) != -1
+
+    def __getitem__(self, key: int) -> list[AgariData]:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: int, default=None) -> list[AgariData] | None:
+        idx = self._find(key)
+        if idx == -1:
+            return default
+        return [AgariData(i) for i in self.flags[self.offsets[idx]:self.offsets[idx + 1]].tolist()]
+
+    def lookup_batch(self, keys: np.ndarray) -> np.ndarray:
+        """
+        Looks up many keys at once
+        :param keys: (N,) array of keys
+        :return: (N,) array of row indexes into the table, -1 for keys that are not in the table
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        idx = np.searchsorted(self.keys, keys)
+        found = idx < len(self.keys)
+        found[found] = self.keys[idx[found]] == keys[found]
+        return np.where(found, idx, -1)
+
+    def contains_batch(self, keys: np.ndarray) -> np.ndarray:
+        """
+        :param keys: (N,) array of keys
+        :return: (N,) bool array, whether each key is in the table
+        """
+        return self.lookup_batch(keys) != -1
+
+
+def load_table_from_gzip(file_loc: str = "data/agari.bin.gz", table_size: int = 9362) -> AgariTable:
     """
     Load the Agari Table from a GZIP file
     The file used in the repository was taken from:
@@ -52,14 +146,32 @@ def load_table_from_gzip(file_loc: str = "data/agari.bin.gz", table_size: int =
     :param table_size: Size of the actual table
     :return: Table populated with values
     """
-    table = {}
     with gzip.open(file_loc, "rb") as f:
-        for _ in range(table_size):
-            key = struct.unpack('<I', f.read(4))[0]  # Little-endian u32
-            v_size = struct.unpack('<B', f.read(1))[0]  # u8
-            value = [AgariData(struct.unpack('<I', f.read(4))[0]) for _ in range(v_size)]
-            table[key] = value
-    return table
+        raw = f.read()
+
+    keys = np.empty(table_size, dtype=np.int64)
+    sizes = np.empty(table_size, dtype=np.int64)
+    flags = []
+
+    pos = 0
+    for i in range(table_size):
+        keys[i], sizes[i] = struct.unpack_from('<IB', raw, pos)  # Little-endian u32, u8
+        pos += 5
+        flags.extend(struct.unpack_from(f'<{sizes[i]}I', raw, pos))  # Little-endian u32s
+        pos += 4 * sizes[i]
+
+    flags = np.array(flags, dtype=np.uint32)
+    offsets = np.zeros(table_size + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+
+    # Sort by key, keeping each key's flags together
+    order = np.argsort(keys, kind="stable")
+    sorted_sizes = sizes[order]
+    sorted_offsets = np.zeros(table_size + 1, dtype=np.int64)
+    np.cumsum(sorted_sizes, out=sorted_offsets[1:])
+    flag_idx = np.repeat(offsets[:-1][order] - sorted_offsets[:-1], sorted_sizes) + np.arange(len(flags))
+
+    return AgariTable(keys[order], sorted_offsets, flags[flag_idx])
 
 
 def get_tile14_and_key(tiles: list[int]) -> tuple[list[int], int]:
@@ -136,28 +248,98 @@ def get_tile14_and_key(tiles: list[int]) -> tuple[list[int], int]:
     return tile14, key
 
 
-def get_hand_waits(tehai: list[int]):
-    tehai = tehai[:]
+# Bits added to the key for each tile count, and how far they move the bit index, see get_tile14_and_key
+_KEY_BITS = np.array([0, 0, 0b11, 0b1111, 0b11_1111], dtype=np.uint64)
+_KEY_SHIFT = np.array([0, 0, 2, 4, 6], dtype=np.int64)
+
+
+def get_tile14_and_key_batch(tiles: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Batched version of get_tile14_and_key, for hands of up to 14 tiles
+    :param tiles: (N, 34) array of tile counts
+    :return: (N, 14) array of tile14 (padded with 0 like get_tile14_and_key), (N,) array of keys
+    """
+    native = backend.get_native()
+    if native is not None:
+        tile14, key, _ = native.agari_key_batch(np.ascontiguousarray(tiles, dtype=np.uint8))
+        return tile14.astype(np.int64), key.astype(np.uint64)
 
-    waits = []
+    tiles = np.asarray(tiles, dtype=np.int64)
+    n = tiles.shape[0]
+
+    key = np.zeros(n, dtype=np.uint64)
+    bit_idx = np.full(n, -1, dtype=np.int64)
+    prev_in_hand = np.zeros(n, dtype=bool)
+
+    def add_bits(mask, bits):
+        nonlocal key
+        shift = np.maximum(bit_idx, 0).astype(np.uint64)
+        key |= np.where(mask, bits << shift, np.uint64(0))
 
     for i in range(34):
-        if tehai[i] >= 4:
-            continue
+        c = tiles[:, i]
+        in_hand = c > 0
+
+        bit_idx += in_hand
+        add_bits(in_hand, _KEY_BITS[c])
+        bit_idx += _KEY_SHIFT[c]
+
+        if i < 27:
+            # Closes a run of tiles, either at a gap or at the end of the suit
+            close = prev_in_hand & ~in_hand if i % 9 != 8 else prev_in_hand | in_hand
+            add_bits(close, np.uint64(1))
+            bit_idx += close
+            prev_in_hand = in_hand & (i % 9 != 8)
+        else:
+            add_bits(in_hand, np.uint64(1))
+            bit_idx += in_hand
+
+    # Tile ids of the held tiles, in order
+    tile14 = np.zeros((n, 14), dtype=np.int64)
+    rows, cols = np.nonzero(tiles)
+    pos = np.cumsum(tiles > 0, axis=1)[rows, cols] - 1
+    keep = pos < 14
+    tile14[rows[keep], pos[keep]] = cols[keep]
 
-        tehai[i] += 1
+    return tile14, key
 
-        t14, key = get_tile14_and_key(tehai)
-        if key in AGARI_TABLE:
-            waits.append(i)
 
-        tehai[i] -= 1
+def is_agari_batch(tiles: np.ndarray) -> np.ndarray:
+    """
+    Checks whether many hands are complete at once
+    :param tiles: (N, 34) array of tile counts, each hand having up to 14 tiles
+    :return: (N,) bool array
+    """
+    native = backend.get_native()
+    if native is not None:
+        return native.agari_key_batch(np.ascontiguousarray(tiles, dtype=np.uint8))[2]
+
+    _, keys = get_tile14_and_key_batch(tiles)
+    return get_agari_table().contains_batch(keys.astype(np.int64))
+
+
+_AGARI_TABLE: AgariTable | None = None
+
+
+def get_agari_table() -> AgariTable:
+    """
+    Gets the Agari Table, loading it on first use
+    :return: Agari Table
+    """
+    global _AGARI_TABLE
 
-    return waits
+    if _AGARI_TABLE is None:
+        file_loc = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "agari.bin.gz")
+        _AGARI_TABLE = load_table_from_gzip(file_loc)
+    return _AGARI_TABLE
 
 
-AGARI_TABLE: dict[int, list['AgariData']] = load_table_from_gzip(__file__ + "/../data/agari.bin.gz")
+def __getattr__(name: str):
+    # Keeps agari.AGARI_TABLE working without loading the table at import
+    if name == "AGARI_TABLE":
+        return get_agari_table()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_agari_data(key: int):
-    return AGARI_TABLE.get(key)
+    return get_agari_table().get(key)
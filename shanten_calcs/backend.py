@@ -0,0 +1,49 @@
+# Optional native backend
+#
+# The riichi extension built from libriichi has batched versions of calc_all_batch, get_hand_waits and
+# get_tile14_and_key_batch that release the GIL. They are used when the extension can be imported,
+# the pure Python versions are used otherwise.
+# Setting SHANTEN_CALCS_BACKEND=python in the environment forces the pure Python versions.
+
+import os
+
+try:
+    from riichi import algo as _native
+except ImportError:
+    _native = None
+
+_use_native = _native is not None and os.environ.get("SHANTEN_CALCS_BACKEND", "").lower() != "python"
+
+
+def get_native():
+    """
+    :return: The riichi.algo module if the native backend is in use, None otherwise
+    """
+    return _native if _use_native else None
+
+
+def get_backend() -> str:
+    """
+    :return: "libriichi" or "python"
+    """
+    return "libriichi" if _use_native else "python"
+
+
+def set_backend(name: str) -> str:
+    """
+    Switches between the native and pure Python backends
+    :param name: "libriichi" or "python"
+    :return: The backend that was in use before
+    """
+    global _use_native
+
+    previous = get_backend()
+    if name == "libriichi":
+        if _native is None:
+            raise ValueError("The riichi extension is not installed")
+        _use_native = True
+    elif name == "python":
+        _use_native = False
+    else:
+        raise ValueError(f"Unknown backend {name}")
+    return previous
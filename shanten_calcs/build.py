@@ -0,0 +1,13 @@
+# Build step of shanten_calcs, unpacks the GZipped shanten tables into flat files that are memory mapped at runtime
+#
+# Without it, the tables are built on first use into the user cache directory, see shanten_calc._open_table.
+#
+# The tables go into the package data directory, or into the cache directory ($SHANTEN_CALCS_CACHE, default:
+# ~/.cache/shanten_calcs) when SHANTEN_CALCS_CACHE is set or the package is read-only, the same directories the
+# runtime looks in.
+#
+# Usage: python -m shanten_calcs.build
+from .shanten_calc import build_tables
+
+if __name__ == "__main__":
+    print(build_tables())
@@ -0,0 +1,146 @@
+# Checks that the native and pure Python backends give the same results
+#
+# Runs the test vectors of libriichi's algo::batch tests and a set of random hands through every batched
+# function with both backends, and through the scalar functions.
+#
+# Usage: python -m shanten_calcs.check_backends [--hands N] [--seed S]
+import argparse
+import sys
+
+import numpy as np
+
+from . import backend
+from .agari import get_tile14_and_key, get_tile14_and_key_batch, get_agari_data, is_agari_batch
+from .shanten_calc import calc_all, calc_all_batch
+from .waits import get_hand_waits, get_hand_waits_batch
+
+# Same as HANDS in libriichi/src/algo/batch.rs
+TEST_VECTORS = [
+    ("1111m 333p 222s 444z", 4),
+    ("147m 258p 369s 1234z", 4),
+    ("468m 33346p 7s", 3),
+    ("147m 258p 3s", 2),
+    ("4455s", 1),
+    ("15559m 19p 19s 1234z", 4),
+    ("9999m 6677p 88s 355z", 4),
+    ("19m 19p 159s 123456z", 4),
+    ("2344456m 14p 127s 2z 7p", 4),
+    ("344455667p 1139s 9p", 4),
+    ("122334m 678p 37s 22z 5s", 4),
+    ("12223456m 78889p 2m", 4),
+    ("1133557799m 113p", 4),
+    ("34778p", 1),
+]
+
+
+def parse_hand(hand: str) -> list[int]:
+    """
+    Parses a hand written like "123m 456p 789s 11z"
+    :param hand: Hand
+    :return: Full Array of tiles
+    """
+    tiles = [0 for _ in range(34)]
+    for group in hand.split():
+        base = "mpsz".index(group[-1]) * 9
+        for num in group[:-1]:
+            tiles[base + int(num) - 1] += 1
+    return tiles
+
+
+def random_hands(n: int, seed: int) -> np.ndarray:
+    """
+    :param n: Number of hands
+    :param seed: Random seed
+    :return: (n, 34) array of hands with 13 or 14 tiles
+    """
+    rng = np.random.default_rng(seed)
+    wall = np.repeat(np.arange(34), 4)
+
+    ret = np.zeros((n, 34), dtype=np.uint8)
+    for i in range(n):
+        np.add.at(ret[i], rng.choice(wall, 13 + i % 2, replace=False), 1)
+    return ret
+
+
+def run_batch(tiles: np.ndarray, len_div3: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Runs every batched function with the current backend
+    """
+    tile14, keys = get_tile14_and_key_batch(tiles)
+    return {
+        "calc_all_batch": calc_all_batch(tiles, len_div3),
+        "get_hand_waits_batch": get_hand_waits_batch(tiles),
+        "get_tile14_and_key_batch (tile14)": tile14,
+        "get_tile14_and_key_batch (key)": keys,
+        "is_agari_batch": is_agari_batch(tiles),
+    }
+
+
+def run_scalar(tiles: np.ndarray, len_div3: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Runs the scalar functions on every hand, in the same layout as run_batch
+    """
+    shanten = []
+    waits = np.zeros(tiles.shape, dtype=bool)
+    tile14s = []
+    keys = []
+    for i, row in enumerate(tiles.tolist()):
+        shanten.append(calc_all(row, int(len_div3[i])))
+        waits[i, get_hand_waits(row)] = True
+        tile14, key = get_tile14_and_key(row)
+        tile14s.append(tile14)
+        keys.append(key)
+
+    return {
+        "calc_all_batch": np.array(shanten, dtype=np.int8),
+        "get_hand_waits_batch": waits,
+        "get_tile14_and_key_batch (tile14)": np.array(tile14s, dtype=np.int64),
+        "get_tile14_and_key_batch (key)": np.array(keys, dtype=np.uint64),
+        "is_agari_batch": np.array([get_agari_data(k) is not None for k in keys], dtype=bool),
+    }
+
+
+def compare(name: str, expected: dict[str, np.ndarray], got: dict[str, np.ndarray]) -> bool:
+    """
+    Prints the functions whose results differ
+    :return: Whether every result is the same
+    """
+    ok = True
+    for func, value in expected.items():
+        bad = np.flatnonzero((value != got[func]).reshape(len(value), -1).any(axis=1))
+        if len(bad):
+            ok = False
+            print(f"{name}: {func} differs on {len(bad)} hands, first at row {bad[0]}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks that both shanten_calcs backends give the same results")
+    parser.add_argument("--hands", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tiles = np.concatenate([np.array([parse_hand(h) for h, _ in TEST_VECTORS], dtype=np.uint8),
+                            random_hands(args.hands, args.seed)])
+    len_div3 = np.concatenate([np.array([l for _, l in TEST_VECTORS], dtype=np.int64),
+                               tiles[len(TEST_VECTORS):].sum(axis=1, dtype=np.int64) // 3])
+
+    previous = backend.set_backend("python")
+    try:
+        scalar = run_scalar(tiles, len_div3)
+        ok = compare("python batch vs scalar", scalar, run_batch(tiles, len_div3))
+
+        if backend._native is None:
+            print("riichi extension not installed, only the python backend was checked")
+        else:
+            backend.set_backend("libriichi")
+            ok &= compare("libriichi batch vs scalar", scalar, run_batch(tiles, len_div3))
+    finally:
+        backend.set_backend(previous)
+
+    print(f"{len(tiles)} hands, {'ok' if ok else 'MISMATCH'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,562 @@
+# Tile efficiency (ukeire) built on the per-suit shanten tables
+#
+# The shanten of a hand is the min-plus combination of its four suit rows, and that combination can be done in
+# any order. So when a discard changes one suit and a draw changes one suit, the other suits only need to be
+# combined once per hand, and each (discard, draw) pair costs a single table row lookup and a final combine step.
+#
+# ukeire_batch keeps rows columns first, so each step of a combine is a few numpy calls over every hand at once, and
+# skips the final combine step of each draw: adding a tile lowers each column of a suit row by 0 or 1, so a draw lowers
+# the shanten exactly when it lowers a column of its suit that reaches the minimum of the final combine step.
+
+import functools
+
+import numpy as np
+
+from . import shanten_calc
+from .shanten_calc import _add_suhai, _suhai_row, _jihai_row, _TILE_WEIGHTS, _IS_YAOCHUU
+from .waits import hand_key, hand_from_key, get_hand_waits_from_key
+
+_SUIT_TILES = (range(0, 9), range(9, 18), range(18, 27), range(27, 34))
+
+_TILE_WEIGHTS_ARRAY = np.array(_TILE_WEIGHTS, dtype=np.int64)
+_IS_YAOCHUU_ARRAY = np.array(_IS_YAOCHUU, dtype=bool)
+
+# Batched layout: 4 blocks of 9 tiles, the honors padded with 2 tiles that are never held or drawn
+_BLOCK_WEIGHTS = np.append(_TILE_WEIGHTS_ARRAY, [0, 0]).reshape(4, 9)
+# Divisors to get the tile counts of a suit back from its Tile Hash, for number suits and honors
+_BLOCK_DIGITS = np.array([[5 ** (8 - i) for i in range(9)], [5 ** (6 - i) for i in range(7)] + [5 ** 7] * 2],
+                         dtype=np.int32)
+_SUIT_KEY = np.zeros((34, 4), dtype=np.int64)
+_SUIT_KEY[np.arange(34), np.minimum(np.arange(34) // 9, 3)] = _TILE_WEIGHTS_ARRAY
+# Tile Hashes are below 5 ** 9, so (suit, Tile Hash) fits in a single int
+_STATE_STRIDE = 5 ** 9
+_SUIT_OFFSETS = np.arange(4)[:, None] * _STATE_STRIDE
+
+# Columns of the last suit used by the final combine step for each m, and their bits
+_FINAL_COLUMNS = [np.array([*range(m + 1), *range(5, m + 6)]) for m in range(5)]
+_COLUMN_BITS = (1 << np.arange(10)).astype(np.uint16)
+
+# Pairs of suits combined: (0, 1), (2, 3), (0, 2), (1, 3), (0, 3), (1, 2)
+# _PAIR_OF[s, u] is the pair of the two suits other than s and u
+_PAIR_LHS = np.array([0, 2, 0, 1, 0, 1])
+_PAIR_TAB = np.array([1, 3, 2, 3, 3, 2])
+_PAIR_OF = np.array([[0, 1, 3, 5], [1, 0, 4, 2], [3, 4, 0, 0], [5, 2, 0, 0]])
+# Every suit other than s, for s = 0-3, from the suits (0-3) and the pairs (4-9): 1 + (2, 3), 0 + (2, 3), ...
+_OTHERS_LHS = np.array([1, 0, 4, 4])
+_OTHERS_TAB = np.array([5, 5, 3, 2])
+
+
+def _row(suit: int, index: int) -> bytes:
+    return _jihai_row(index) if suit == 3 else _suhai_row(index)
+
+
+def _final(lhs: list[int], tab: bytes, m: int) -> int:
+    """
+    Final combine step, same as _add_jihai but returns the normal hand shanten instead of modifying lhs
+    :param lhs: Combined rows of the other suits
+    :param tab: Table row of the last suit
+    :param m: ???
+    :return: Shanten to make a normal hand
+    """
+    j = m + 5
+    sht = min(lhs[j] + tab[0], lhs[0] + tab[j])
+    for k in range(5, j):
+        sht = min(sht, lhs[k] + tab[j - k], lhs[j - k] + tab[k])
+    return sht - 1
+
+
+def _combine(lhs: list[int] | bytes, tab: list[int] | bytes, m: int) -> list[int]:
+    """
+    Combines two rows (or already combined rows) without modifying either
+    :return: Combined rows
+    """
+    ret = list(lhs)
+    _add_suhai(ret, tab, m)
+    return ret
+
+
+class _HandRows:
+    """
+    Suit rows of a hand, and the combination of every set of suits that is needed to re-evaluate a single suit
+    """
+
+    def __init__(self, key: tuple[int, int, int, int], m: int):
+        self.key = key
+        self.m = m
+        self.rows = [_row(s, key[s]) for s in range(4)]
+
+        # pair_rows[s][u]: the two suits other than s and u combined
+        self.pair_rows = [[None for _ in range(4)] for _ in range(4)]
+        for s in range(4):
+            for u in range(s + 1, 4):
+                a, b = [v for v in range(4) if v != s and v != u]
+                self.pair_rows[s][u] = self.pair_rows[u][s] = _combine(self.rows[a], self.rows[b], m)
+
+        # others[s]: every suit other than s combined
+        self.others = [_combine(self.pair_rows[s][(s + 1) % 4], self.rows[(s + 1) % 4], m) for s in range(4)]
+
+
+def _special_shanten(normal: int, m: int, pairs: int, kinds: int, kokushi_pairs: int, kokushi_kinds: int) -> int:
+    """
+    Applies chiitoi and kokushi the same way calc_all does
+    """
+    if m >= 4:
+        if normal > 0:
+            normal = min(normal, 7 - pairs + max(7 - kinds, 0) - 1)
+        if normal > 0:
+            normal = min(normal, 14 - kokushi_kinds - (kokushi_pairs > 0) - 1)
+    return normal
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _ukeire_shape(key: tuple[int, int, int, int]) -> tuple[tuple[int, int, tuple[int, ...]], ...]:
+    """
+    Improving tiles of every discard of a hand, which only depend on the hand's shape
+    :param key: Hand key of a 3n+2 tile hand
+    :return: (discard, shanten after the discard, tiles that lower that shanten) for every tile in the hand
+    """
+    if shanten_calc._SUHAI_BUF is None:
+        shanten_calc.load_tables()
+
+    tiles = hand_from_key(key)
+    m = sum(tiles) // 3
+    hand = _HandRows(key, m)
+
+    pairs = sum(c >= 2 for c in tiles)
+    kinds = sum(c > 0 for c in tiles)
+    kokushi_pairs = sum(tiles[i] >= 2 for i in range(34) if _IS_YAOCHUU[i])
+    kokushi_kinds = sum(tiles[i] > 0 for i in range(34) if _IS_YAOCHUU[i])
+
+    ret = []
+    for discard in range(34):
+        c = tiles[discard]
+        if c == 0:
+            continue
+
+        # Chiitoi/kokushi counters after the discard
+        d_pairs = pairs - (c == 2)
+        d_kinds = kinds - (c == 1)
+        d_kokushi_pairs = kokushi_pairs - (c == 2 and _IS_YAOCHUU[discard])
+        d_kokushi_kinds = kokushi_kinds - (c == 1 and _IS_YAOCHUU[discard])
+
+        s = discard // 9 if discard < 27 else 3
+        discard_index = key[s] - _TILE_WEIGHTS[discard]
+        discard_row = _row(s, discard_index)
+
+        shanten = _special_shanten(_final(hand.others[s], discard_row, m), m,
+                                   d_pairs, d_kinds, d_kokushi_pairs, d_kokushi_kinds)
+
+        tiles[discard] -= 1
+        improving = []
+        for u in range(4):
+            if u == s:
+                lhs = hand.others[s]
+                base_index = discard_index
+            else:
+                lhs = _combine(discard_row, hand.pair_rows[s][u], m)
+                base_index = key[u]
+
+            for draw in _SUIT_TILES[u]:
+                dc = tiles[draw]
+                if dc >= 4:
+                    continue
+
+                draw_shanten = _final(lhs, _row(u, base_index + _TILE_WEIGHTS[draw]), m)
+                if draw_shanten < shanten:
+                    improving.append(draw)
+                elif m >= 4 and draw_shanten > 0:
+                    is_yaochuu = _IS_YAOCHUU[draw]
+                    draw_shanten = _special_shanten(draw_shanten, m,
+                                                    d_pairs + (dc == 1), d_kinds + (dc == 0),
+                                                    d_kokushi_pairs + (dc == 1 and is_yaochuu),
+                                                    d_kokushi_kinds + (dc == 0 and is_yaochuu))
+                    if draw_shanten < shanten:
+                        improving.append(draw)
+        tiles[discard] += 1
+
+        ret.append((discard, shanten, tuple(improving)))
+
+    return tuple(ret)
+
+
+def ukeire(tiles34: list[int], visible34: list[int] = None) -> dict[int, tuple[int, dict[int, int]]]:
+    """
+    Calculates, for every possible discard, which tiles lower the shanten and how many of them are left
+    A tile counts as improving when the hand after the discard and the draw has a lower shanten (calc_all) than the
+    hand after the discard
+    :param tiles34: Full Array of tiles of a 3n+2 tile hand (closed hand, before discarding)
+    :param visible34: Full Array of tiles visible outside of the hand (discards, melds, dora indicators...)
+    :return: {discard: (shanten after the discard, {improving tile: number of that tile left})}
+        The number left is 4 - copies in the hand (including the discard) - visible copies
+    """
+    if sum(tiles34) % 3 != 2:
+        raise ValueError(f"Expected a 3n+2 tile hand, got {sum(tiles34)} tiles")
+
+    ret = {}
+    for discard, shanten, improving in _ukeire_shape(hand_key(tiles34)):
+        if visible34 is None:
+            ret[discard] = (shanten, {t: max(4 - tiles34[t], 0) for t in improving})
+        else:
+            ret[discard] = (shanten, {t: max(4 - tiles34[t] - visible34[t], 0) for t in improving})
+    return ret
+
+
+def ukeire_cache_info():
+    """
+    :return: Hits, misses, max size and current size of the ukeire cache
+    """
+    return _ukeire_shape.cache_info()
+
+
+def _others_rows(rows: list[bytes], m: int) -> list[list[int]]:
+    """
+    Combines, for every suit, the rows of the three other suits
+    :param rows: Table rows of the four suits
+    :param m: ???
+    :return: others[s], every suit other than s combined
+    """
+    front = _combine(rows[0], rows[1], m)
+    back = _combine(rows[2], rows[3], m)
+    return [_combine(rows[1], back, m), _combine(rows[0], back, m), _combine(front, rows[3], m),
+            _combine(front, rows[2], m)]
+
+
+def _kokushi_waits(tiles: list[int]) -> list[int]:
+    """
+    :param tiles: Full Array of a 13 tile hand
+    :return: Tiles that complete kokushi, empty if the hand is not tenpai for it
+    """
+    kinds = [i for i in range(34) if _IS_YAOCHUU[i] and tiles[i]]
+    if sum(tiles[i] for i in kinds) != 13:
+        return []
+    elif len(kinds) == 13:
+        return [i for i in range(34) if _IS_YAOCHUU[i]]
+    elif len(kinds) == 12:
+        return [i for i in range(34) if _IS_YAOCHUU[i] and not tiles[i]]
+    return []
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _discard_shape(key: tuple[int, int, int, int]) -> tuple[tuple[int, int, tuple[int, ...] | None], ...]:
+    """
+    Shanten after every discard of a hand, and the waits of the discards that leave the hand tenpai
+    The suits the discard does not come from are combined once, so each discard costs one table row lookup
+    :param key: Hand key of a 3n+2 tile hand
+    :return: (discard, shanten after the discard, waits or None if not tenpai) for every tile in the hand
+    """
+    if shanten_calc._SUHAI_BUF is None:
+        shanten_calc.load_tables()
+
+    tiles = hand_from_key(key)
+    m = sum(tiles) // 3
+    others = _others_rows([_row(s, key[s]) for s in range(4)], m)
+
+    pairs = sum(c >= 2 for c in tiles)
+    kinds = sum(c > 0 for c in tiles)
+    kokushi_pairs = sum(tiles[i] >= 2 for i in range(34) if _IS_YAOCHUU[i])
+    kokushi_kinds = sum(tiles[i] > 0 for i in range(34) if _IS_YAOCHUU[i])
+
+    ret = []
+    for discard in range(34):
+        c = tiles[discard]
+        if c == 0:
+            continue
+
+        s = discard // 9 if discard < 27 else 3
+        discard_index = key[s] - _TILE_WEIGHTS[discard]
+        shanten = _special_shanten(_final(others[s], _row(s, discard_index), m), m,
+                                   pairs - (c == 2), kinds - (c == 1),
+                                   kokushi_pairs - (c == 2 and _IS_YAOCHUU[discard]),
+                                   kokushi_kinds - (c == 1 and _IS_YAOCHUU[discard]))
+
+        waits = None
+        if shanten <= 0:
+            discard_key = key[:s] + (discard_index,) + key[s + 1:]
+            waits = get_hand_waits_from_key(discard_key)
+            if m >= 4:
+                # The wait tables only know normal hands and chiitoi
+                tiles[discard] -= 1
+                waits = sorted(set(waits).union(_kokushi_waits(tiles)))
+                tiles[discard] += 1
+            waits = tuple(waits)
+
+        ret.append((discard, shanten, waits))
+
+    return tuple(ret)
+
+
+def discard_shanten(tiles34: list[int]) -> dict[int, tuple[int, list[int] | None]]:
+    """
+    Calculates the shanten (calc_all) after every possible discard in one pass, along with the waits of the discards
+    that leave the hand tenpai
+    :param tiles34: Full Array of tiles of a 3n+2 tile hand (closed hand, before discarding), left untouched
+    :return: {discard: (shanten after the discard, waits after the discard or None if the shanten is above 0)}
+    """
+    if sum(tiles34) % 3 != 2:
+        raise ValueError(f"Expected a 3n+2 tile hand, got {sum(tiles34)} tiles")
+
+    return {discard: (shanten, None if waits is None else list(waits))
+            for discard, shanten, waits in _discard_shape(hand_key(tiles34))}
+
+
+def tenpai_discards(tiles34: list[int]) -> dict[int, list[int]]:
+    """
+    Discards that leave the hand tenpai, ex: the tiles that can be discarded to riichi
+    :param tiles34: Full Array of tiles of a 3n+2 tile hand (closed hand, before discarding), left untouched
+    :return: {discard: waits after the discard}
+    """
+    if sum(tiles34) % 3 != 2:
+        raise ValueError(f"Expected a 3n+2 tile hand, got {sum(tiles34)} tiles")
+
+    return {discard: list(waits) for discard, shanten, waits in _discard_shape(hand_key(tiles34))
+            if waits is not None}
+
+
+def discard_cache_info():
+    """
+    :return: Hits, misses, max size and current size of the discard shanten cache
+    """
+    return _discard_shape.cache_info()
+
+
+def _columns(suit_table: np.ndarray, indexes: np.ndarray) -> np.ndarray:
+    """
+    Looks up table rows and puts their columns first, so each step of a combine works on contiguous arrays
+    :param suit_table: (N, 10) table or array of rows
+    :param indexes: Array of row indexes
+    :return: (10, *indexes.shape) array of rows
+    """
+    return np.ascontiguousarray(np.moveaxis(np.take(suit_table, indexes, axis=0), -1, 0))
+
+
+def _add_columns(lhs: np.ndarray, tab: np.ndarray) -> np.ndarray:
+    """
+    Same as _add_suhai_batch on rows kept columns first, broadcasting lhs against tab
+    Each column is the min over every split of the melds (and the pair) between lhs and tab, one shifted slice at a time
+    :param lhs: (10, ...) rows or already combined rows
+    :param tab: (10, ...) rows
+    :return: (10, ...) combined rows
+    """
+    ret = np.empty((10,) + np.broadcast_shapes(lhs.shape[1:], tab.shape[1:]), dtype=np.uint8)
+    tmp = np.empty((5,) + ret.shape[1:], dtype=np.uint8)
+
+    # Without the pair: ret[x] = min(lhs[a] + tab[x - a])
+    np.add(lhs[0], tab[0:5], out=ret[0:5])
+    for a in range(1, 5):
+        np.minimum(ret[a:5], np.add(lhs[a], tab[0:5 - a], out=tmp[a:]), out=ret[a:5])
+
+    # With the pair in either: ret[5 + x] = min(lhs[5 + a] + tab[x - a], lhs[a] + tab[5 + x - a])
+    np.add(lhs[5], tab[0:5], out=ret[5:10])
+    for a in range(1, 5):
+        np.minimum(ret[5 + a:10], np.add(lhs[5 + a], tab[0:5 - a], out=tmp[a:]), out=ret[5 + a:10])
+    for a in range(5):
+        np.minimum(ret[5 + a:10], np.add(lhs[a], tab[5:10 - a], out=tmp[a:]), out=ret[5 + a:10])
+    return ret
+
+
+def _final_columns(lhs: np.ndarray, tab: np.ndarray, m: int) -> np.ndarray:
+    """
+    Batched version of _final on rows kept columns first, without the - 1
+    :param lhs: (10, ...) combined rows of the other suits
+    :param tab: (10, ...) table rows of the last suit
+    :param m: ???
+    :return: Shanten to make a normal hand + 1, as uint8
+    """
+    j = m + 5
+    sht = lhs[j] + tab[0]
+    tmp = np.empty_like(sht)
+    np.minimum(sht, np.add(lhs[0], tab[j], out=tmp), out=sht)
+    for k in range(5, j):
+        np.minimum(sht, np.add(lhs[k], tab[j - k], out=tmp), out=sht)
+        np.minimum(sht, np.add(lhs[j - k], tab[k], out=tmp), out=sht)
+    return sht
+
+
+def _tight_columns(lhs: np.ndarray, tab: np.ndarray, sht: np.ndarray, m: int) -> np.ndarray:
+    """
+    Finds the columns of tab that reach the minimum of the final combine step
+    :param lhs: (10, ...) combined rows of the other suits
+    :param tab: (10, ...) table rows of the last suit
+    :param sht: Result of _final_columns on lhs and tab
+    :param m: ???
+    :return: uint16 bitmask, bit b set when lhs[m + 5 - b] + tab[b] == sht
+    """
+    cols = _FINAL_COLUMNS[m]
+    tight = (lhs[m + 5 - cols] + tab[cols] == sht).view(np.uint8)
+    return (tight * _COLUMN_BITS[cols].reshape((-1,) + (1,) * (tight.ndim - 1))).sum(axis=0, dtype=np.uint16)
+
+
+def _lowered_columns(base: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    Finds the columns of a row that go down after adding a tile, adding a tile lowers a column by 0 or 1
+    :param base: (..., 10) table rows
+    :param rows: (..., K, 10) table rows of base plus a tile
+    :return: (..., K) uint16 bitmask, bit b set when column b went down
+    """
+    delta = base[..., None, :] - rows
+    ret = delta[..., 0].astype(np.uint16)
+    for b in range(1, 10):
+        ret |= delta[..., b].astype(np.uint16) << b
+    return ret
+
+
+def _ukeire_batch_m(tiles: np.ndarray, m: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    ukeire_batch for hands that all have the same number of tiles (3m+2)
+    Arrays are laid out (..., 14, n): per discard slot, then per hand
+    """
+    n = tiles.shape[0]
+    hands = np.arange(n)
+
+    # Held kinds, in order, padded with -1
+    discards = np.sort(np.where(tiles > 0, np.arange(34), 34), axis=1)[:, :14]
+    discard = discards.T.copy()
+    valid = discard != 34
+    discard[~valid] = 0
+    discards[discards == 34] = -1
+    suit = np.minimum(discard // 9, 3)
+    suit_slot = suit * n + hands
+
+    # Tile Hash of each suit, and of the discarded suit after each discard
+    key = (tiles @ _SUIT_KEY).T
+    discard_key = key.ravel()[suit_slot] - _TILE_WEIGHTS_ARRAY[discard] * valid
+
+    # Suits repeat a lot within a batch, so rows are looked up once per distinct (suit, Tile Hash)
+    # Along with each suit row, the row after each draw from the suit (or the row itself when it can't be drawn)
+    states, inverse = np.unique(np.concatenate([(key + _SUIT_OFFSETS).ravel(),
+                                                (suit * _STATE_STRIDE + discard_key).ravel()]), return_inverse=True)
+    hand_state = inverse[:4 * n].reshape(4, n)
+    slot_state = inverse[4 * n:].reshape(discard.shape)
+    state_suit = states // _STATE_STRIDE
+    state_key = states - state_suit * _STATE_STRIDE
+    state_jihai = state_suit == 3
+
+    counts = state_key.astype(np.int32)[:, None] // _BLOCK_DIGITS[state_jihai.astype(np.int64)] % 5
+    state_idx = np.empty((len(states), 10), dtype=np.int64)
+    state_idx[:, 9] = state_key
+    np.add(state_key[:, None], np.where(counts < 4, _BLOCK_WEIGHTS[state_suit], 0), out=state_idx[:, :9])
+    state_rows = np.take(shanten_calc._SUHAI_ARRAY, np.where(state_jihai[:, None], 0, state_idx), axis=0)
+    state_rows[state_jihai] = np.take(shanten_calc._JIHAI_ARRAY, state_idx[state_jihai], axis=0)
+    state_base = np.ascontiguousarray(state_rows[:, 9])
+    state_lowered = np.ascontiguousarray(_lowered_columns(state_base, state_rows[:, :9]).T)
+
+    # Every combination of two and of three suits of each hand
+    rows = _columns(state_base, hand_state)
+    suit_pairs = _add_columns(rows[:, _PAIR_LHS], rows[:, _PAIR_TAB])
+    both = np.concatenate([rows, suit_pairs], axis=1)
+    others = _add_columns(both[:, _OTHERS_LHS], both[:, _OTHERS_TAB])
+
+    # For each suit s of each hand: every suit other than s, and for each suit u the two suits other than s and u
+    suit_tab = np.empty((50, 4, n), dtype=np.uint8)
+    suit_tab[:10] = others
+    suit_tab[10:].reshape(10, 4, 4, n)[:] = suit_pairs[:, _PAIR_OF].transpose(0, 2, 1, 3)
+    discard_tab = np.take(suit_tab.reshape(50, 4 * n), suit_slot, axis=1)
+    discard_lhs = discard_tab[:10]
+    discard_pairs = discard_tab[10:].reshape(10, 4, 14, n)
+
+    # Shanten after each discard
+    discard_rows = _columns(state_base, slot_state)
+    sht = _final_columns(discard_lhs, discard_rows, m)
+    shanten = sht.view(np.int8) - 1
+
+    # Which slots a lowered normal shanten counts for, and which draws count for chiitoi and kokushi
+    normal_ok = valid
+    special = None
+    if m >= 4:
+        # Same as _special_shanten, from the pairs and kinds after the discard
+        held = tiles > 0
+        count = tiles.T[discard, hands]
+        yaochuu = _IS_YAOCHUU_ARRAY[discard]
+        pairs = (tiles >= 2).sum(axis=1, dtype=np.int8) - (count == 2)
+        kinds = held.sum(axis=1, dtype=np.int8) - (count == 1)
+        kokushi_pairs = (tiles[:, _IS_YAOCHUU_ARRAY] >= 2).sum(axis=1, dtype=np.int8) - ((count == 2) & yaochuu)
+        kokushi_kinds = held[:, _IS_YAOCHUU_ARRAY].sum(axis=1, dtype=np.int8) - ((count == 1) & yaochuu)
+        chiitoi = 7 - pairs + np.maximum(7 - kinds, 0) - 1
+        kokushi = 14 - kokushi_kinds - (kokushi_pairs > 0) - 1
+        normal = shanten
+        shanten = np.where(normal > 0, np.minimum(normal, np.minimum(chiitoi, kokushi)), normal)
+
+        # A draw lowers chiitoi or kokushi by 1 when it makes a pair or a kind that is still needed,
+        # and only counts while the normal shanten after the draw is above 0, as _special_shanten leaves 0 alone
+        # When the normal shanten is 1 that depends on the draw, so those slots also keep the lowered normal shanten
+        low_normal = (normal == 1) & (shanten < normal)
+        normal_ok = valid & ((normal == shanten) | low_normal)
+        is_chiitoi = (chiitoi == shanten) & valid & (normal > 0)
+        is_kokushi = (kokushi == shanten) & valid & (normal > 0)
+        if is_chiitoi.any() or is_kokushi.any():
+            # Draw codes: bit 0 a new pair, bit 1 a new kind, shifted by 2 for yaochuu tiles
+            # Slot bits: which of those draws count
+            chiitoi_kind = is_chiitoi & (kinds < 7)
+            slot_bits = (is_chiitoi.astype(np.uint8) | chiitoi_kind.astype(np.uint8) << 1 |
+                         (is_chiitoi | (is_kokushi & (kokushi_pairs == 0))).astype(np.uint8) << 2 |
+                         (chiitoi_kind | is_kokushi).astype(np.uint8) << 3)
+            draw_bits = np.zeros((36, n), dtype=np.uint8)
+            draw_bits[:34] = ((tiles.T == 1) | (tiles.T == 0) << 1) << (2 * _IS_YAOCHUU_ARRAY[:, None])
+            special = (draw_bits[:, None] & slot_bits) != 0
+
+            # The discarded tile has one copy less than the rest of the hand
+            discard_bits = ((count == 2) | (count == 1) << 1) << (2 * yaochuu)
+            np.put(special, discard * (14 * n) + np.arange(14 * n).reshape(14, n), (discard_bits & slot_bits) != 0)
+            if not low_normal.any():
+                low_normal = None
+
+    # A draw lowers the normal shanten when it lowers a column of its suit that reaches the minimum of the final
+    # combine step
+    # Draws from the discarded suit: the other three suits are discard_lhs
+    # Draws from another suit u: the discarded suit after the discard combined with the two suits other than u
+    # Each of the two is 0 for the draws of the other kind, so they are merged with | (np.where is much slower here)
+    is_same = (suit == np.arange(4)[:, None, None]) & normal_ok
+    same_tight = _tight_columns(discard_lhs, discard_rows, sht, m) * is_same
+    draw_lhs = _add_columns(discard_rows[:, None], discard_pairs)
+    draw_tight = _tight_columns(draw_lhs, rows[:, :, None], sht, m)
+    draw_tight[~normal_ok | is_same] = 0
+    lowered = np.take(state_lowered, slot_state, axis=1) & same_tight[:, None]
+    lowered |= np.take(state_lowered, hand_state, axis=1).transpose(1, 0, 2)[:, :, None] & draw_tight[:, None]
+    improving = (lowered != 0).reshape(36, 14, n)
+
+    if special is not None:
+        if low_normal is None:
+            improving |= special
+        else:
+            # At a normal shanten of 1, only one of the two counts: the draws lowering it to 0 are not improving
+            improving = np.where(low_normal, special & ~improving, improving | special)
+
+    shanten = np.where(valid, shanten, 0).T.astype(np.int8)
+    return discards, shanten, np.ascontiguousarray(improving[:34].transpose(2, 1, 0))
+
+
+def ukeire_batch(tiles34: np.ndarray, visible34: np.ndarray = None) -> tuple[np.ndarray, ...]:
+    """
+    Batched version of ukeire, gives the same results for each row
+    :param tiles34: (N, 34) array of tile counts of 3n+2 tile hands
+    :param visible34: (N, 34) array of tiles visible outside of each hand
+    :return: (N, 14) discards (tile ids in ascending order, -1 for padding), (N, 14) shanten after each discard,
+        (N, 14, 34) bool array of improving tiles for each discard, (N, 34) number left of each tile
+    """
+    if shanten_calc._SUHAI_ARRAY is None:
+        shanten_calc.load_tables()
+
+    tiles34 = np.asarray(tiles34, dtype=np.int64)
+    num_tiles = tiles34.sum(axis=1)
+    if (num_tiles % 3 != 2).any():
+        raise ValueError("Expected 3n+2 tile hands")
+
+    n = tiles34.shape[0]
+    ms = np.unique(num_tiles // 3)
+    if len(ms) == 1:
+        # Usual case, every hand has the same number of tiles
+        discards, shanten, improving = _ukeire_batch_m(tiles34, int(ms[0]))
+    else:
+        discards = np.full((n, 14), -1, dtype=np.int64)
+        shanten = np.zeros((n, 14), dtype=np.int8)
+        improving = np.zeros((n, 14, 34), dtype=bool)
+
+        for m in ms:
+            rows = num_tiles // 3 == m
+            discards[rows], shanten[rows], improving[rows] = _ukeire_batch_m(tiles34[rows], int(m))
+
+    left = 4 - tiles34
+    if visible34 is not None:
+        left -= np.asarray(visible34, dtype=np.int64)
+
+    return discards, shanten, improving, np.maximum(left, 0).astype(np.int8)
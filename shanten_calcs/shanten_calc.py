@@ -5,49 +5,142 @@
 # * <https://github.com/tomohxx/shanten-number-calculator/>
 
 import gzip
-import pickle
+import mmap
+import os
 
+import numpy as np
 
-def _read_table(file_loc: str) -> list[list[int]]:
+from . import backend
+
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+_JIHAI_TABLE_SIZE = 78032
+_SUHAI_TABLE_SIZE = 1940777
+
+_TABLES = {"shanten_jihai": _JIHAI_TABLE_SIZE, "shanten_suhai": _SUHAI_TABLE_SIZE}
+
+
+def _unpack_table(gz_loc: str, length: int) -> np.ndarray:
     """
-    Reads a GZipped Table and parses it
-    :param file_loc: Location of the GZipped table
-    :return: Table
+    Unpacks a GZipped Table into a flat (rows * 10,) uint8 array
+    Each byte of the GZipped table holds two entries, low nibble first
+    :param gz_loc: Location of the GZipped table
+    :param length: Number of rows in the table
+    :return: Flat table
     """
-    ret = []
-    entry = [0 for _ in range(10)]
+    with gzip.open(gz_loc, "rb") as f:
+        packed = np.frombuffer(f.read(), dtype=np.uint8)
 
-    with gzip.open(file_loc, "rb") as f:
-        for i, b in enumerate(f.read()):
-            entry[(i * 2) % 10] = b & 0b1111
-            entry[(i * 2) % 10 + 1] = (b >> 4) & 0b1111
+    table = np.empty(packed.size * 2, dtype=np.uint8)
+    table[0::2] = packed & 0b1111
+    table[1::2] = packed >> 4
 
-            if (i + 1) % 5 == 0:
-                ret.append(entry.copy())
+    if table.size != length * 10:
+        raise RuntimeError(f"{gz_loc} has {table.size // 10} rows, expected {length}")
+    return table
 
-    return ret
 
+def _write_table(table: np.ndarray, bin_loc: str):
+    """
+    Writes a flat table, through a temp file so readers never see a partial file
+    :param table: Flat table, see _unpack_table
+    :param bin_loc: Location of the flat table
+    :return: N/A
+    """
+    tmp_loc = f"{bin_loc}.{os.getpid()}.tmp"
+    try:
+        table.tofile(tmp_loc)
+        os.replace(tmp_loc, bin_loc)
+    finally:
+        if os.path.exists(tmp_loc):
+            os.remove(tmp_loc)
+
+
+def _cache_dir() -> str:
+    """
+    :return: Directory the flat tables are built into when the package has none, SHANTEN_CALCS_CACHE if it is set
+    """
+    if os.environ.get("SHANTEN_CALCS_CACHE"):
+        return os.environ["SHANTEN_CALCS_CACHE"]
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "shanten_calcs")
+
+
+def build_tables() -> str:
+    """
+    Unpacks the shanten tables into flat files, meant to be run once as a build step (ex: before packaging)
+    The tables go into the data directory of the package, or into the cache directory (see _cache_dir) when
+    SHANTEN_CALCS_CACHE is set or the package is read-only, both are where _open_table looks for them
+    Usage: python -m shanten_calcs.build
+    :return: Directory of the flat tables
+    """
+    if os.environ.get("SHANTEN_CALCS_CACHE") or not os.access(_DATA_DIR, os.W_OK):
+        out_dir = _cache_dir()
+    else:
+        out_dir = _DATA_DIR
+    os.makedirs(out_dir, exist_ok=True)
+    for name, length in _TABLES.items():
+        _write_table(_unpack_table(os.path.join(_DATA_DIR, name + ".bin.gz"), length),
+                     os.path.join(out_dir, name + ".bin"))
+    return out_dir
+
+
+def _open_table(name: str, length: int) -> tuple[mmap.mmap | bytes, np.ndarray]:
+    """
+    Memory maps a flat table
+    The table built by build_tables is used when there is one, otherwise it is built once into the user cache
+    directory. Every process mapping the same file shares one copy of it in the page cache.
+    When the cache directory is not writable either, the table is unpacked in memory for this process only
+    :param name: Name of the table (ex: shanten_suhai)
+    :param length: Number of rows in the table
+    :return: Raw buffer of the table, (rows, 10) uint8 view of the same buffer
+    """
+    for bin_dir in (_DATA_DIR, _cache_dir()):
+        bin_loc = os.path.join(bin_dir, name + ".bin")
+        if os.path.exists(bin_loc) and os.path.getsize(bin_loc) == length * 10:
+            break
+    else:
+        table = _unpack_table(os.path.join(_DATA_DIR, name + ".bin.gz"), length)
+        try:
+            os.makedirs(os.path.dirname(bin_loc), exist_ok=True)
+            _write_table(table, bin_loc)
+        except OSError:
+            buf = table.tobytes()
+            return buf, np.frombuffer(buf, dtype=np.uint8).reshape(length, 10)
+
+    with open(bin_loc, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    return buf, np.frombuffer(buf, dtype=np.uint8).reshape(length, 10)
 
-# _JIHAI_TABLE = _read_table("data/shanten_jihai.bin.gz")  # Length: 78032
-# _SUHAI_TABLE = _read_table("data/shanten_suhai.bin.gz")  # Length: 1940777
 
-# with open(__file__ + "/../data/jihai_table.pkl", "rb") as f:
-#     _JIHAI_TABLE = pickle.load(f)
-with open(__file__ + "/../data/suhai_table.pkl", "rb") as f:
-    _SUHAI_TABLE = pickle.load(f)
+# Raw buffers are sliced by the scalar code (slicing gives bytes, which index to plain ints),
+# the arrays are used by the batched code. Opened on first use, see load_tables
+_JIHAI_BUF = _JIHAI_ARRAY = None
+_SUHAI_BUF = _SUHAI_ARRAY = None
 
 
-def _add_suhai(lhs: list[int], index: int, m: int):
+def load_tables():
+    """
+    Opens the shanten tables if they have not been opened yet
+    :return: N/A
+    """
+    global _JIHAI_BUF, _JIHAI_ARRAY, _SUHAI_BUF, _SUHAI_ARRAY
+
+    if _SUHAI_BUF is None:
+        _JIHAI_BUF, _JIHAI_ARRAY = _open_table("shanten_jihai", _JIHAI_TABLE_SIZE)
+        _SUHAI_BUF, _SUHAI_ARRAY = _open_table("shanten_suhai", _SUHAI_TABLE_SIZE)
+
+
+def _add_suhai(lhs: list[int], tab: bytes, m: int):
     """
     Adds Suhai (Non Honor Tiles) to be calc'd for shanten
     Modifies lhs in place
     :param lhs: ???
-    :param index: Tile Hash (?)
+    :param tab: Table row of the suit, see _suhai_row
     :param m: ???
     :return: N/A
     """
-    tab = _SUHAI_TABLE[index]
-
     for j in range(5 + m, 4, -1):
         sht = min(lhs[j] + tab[0], lhs[0] + tab[j])
         for k in range(5, j):
@@ -61,17 +154,15 @@ def _add_suhai(lhs: list[int], index: int, m: int):
         lhs[j] = sht
 
 
-def _add_jihai(lhs: list[int], index: int, m: int):
+def _add_jihai(lhs: list[int], tab: bytes, m: int):
     """
     Adds Jihai (Honor Tiles) to be calc'd for shanten
     Modifies lhs in place
     :param lhs: ???
-    :param index: Tile Hash (?)
+    :param tab: Table row of the honors, see _jihai_row
     :param m: ???
     :return: N/A
     """
-    tab = _SUHAI_TABLE[index]
-
     j = m + 5
     sht = min(lhs[j] + tab[0], lhs[0] + tab[j])
     for k in range(5, j):
@@ -79,6 +170,24 @@ def _add_jihai(lhs: list[int], index: int, m: int):
     lhs[j] = sht
 
 
+def _suhai_row(index: int) -> bytes:
+    """
+    Gets a row of the suhai table, load_tables must have been called
+    :param index: Tile Hash of the suit, see _sum_tiles
+    :return: Table row
+    """
+    return _SUHAI_BUF[index * 10:index * 10 + 10]
+
+
+def _jihai_row(index: int) -> bytes:
+    """
+    Gets a row of the jihai table, load_tables must have been called
+    :param index: Tile Hash of the honors, see _sum_tiles
+    :return: Table row
+    """
+    return _JIHAI_BUF[index * 10:index * 10 + 10]
+
+
 def _sum_tiles(tiles: list[int]) -> int:
     """
     Converts tiles to base 5 as a hash (of sorts)
@@ -98,10 +207,13 @@ def calc_normal(tiles: list[int], len_div3: int):
     :param len_div3: ???
     :return: Shanten to make a normal hand
     """
-    ret = _SUHAI_TABLE[_sum_tiles(tiles[0:9])].copy()
-    _add_suhai(ret, _sum_tiles(tiles[9:18]), len_div3)
-    _add_suhai(ret, _sum_tiles(tiles[18:27]), len_div3)
-    _add_jihai(ret, _sum_tiles(tiles[27:]), len_div3)
+    if _SUHAI_BUF is None:
+        load_tables()
+
+    ret = list(_suhai_row(_sum_tiles(tiles[0:9])))
+    _add_suhai(ret, _suhai_row(_sum_tiles(tiles[9:18])), len_div3)
+    _add_suhai(ret, _suhai_row(_sum_tiles(tiles[18:27])), len_div3)
+    _add_jihai(ret, _jihai_row(_sum_tiles(tiles[27:])), len_div3)
 
     return ret[5 + len_div3] - 1
 
@@ -161,3 +273,230 @@ def calc_all(tiles: list[int], len_div3: int = None):
             shanten = min(shanten, calc_kokushi(tiles))
 
     return shanten
+
+
+# Weight of each tile in its suit's base 5 index, see _sum_tiles
+_TILE_WEIGHTS = [5 ** (8 - i % 9) for i in range(27)] + [5 ** (33 - i) for i in range(27, 34)]
+_IS_YAOCHUU = [i in (0, 8, 9, 17, 18, 26) or i >= 27 for i in range(34)]
+_TILE_SUITS = [i // 9 if i < 27 else 3 for i in range(34)]
+
+
+class IncrementalShanten:
+    """
+    Keeps track of the shanten of a hand that changes one tile at a time
+    The base 5 index and table row of each suit are cached, so adding or removing a tile only updates the index of
+    its suit, and calculating the shanten only looks up the changed rows and redoes the final combine step
+    """
+
+    def __init__(self, tiles: list[int] = None):
+        """
+        :param tiles: Full Array of tiles to start with, defaults to an empty hand
+        """
+        if _SUHAI_BUF is None:
+            load_tables()
+
+        self.tiles = list(tiles) if tiles is not None else [0 for _ in range(34)]
+        self.num_tiles = sum(self.tiles)
+
+        self._indexes = [_sum_tiles(self.tiles[0:9]), _sum_tiles(self.tiles[9:18]),
+                         _sum_tiles(self.tiles[18:27]), _sum_tiles(self.tiles[27:])]
+        self._rows = [_suhai_row(self._indexes[0]), _suhai_row(self._indexes[1]),
+                      _suhai_row(self._indexes[2]), _jihai_row(self._indexes[3])]
+
+        self._shanten = None
+        self._shanten_len_div3 = None
+
+    def add(self, tile: int):
+        """
+        Adds a tile to the hand
+        :param tile: Tile id (0-33)
+        :return: N/A
+        """
+        self.tiles[tile] += 1
+        self.num_tiles += 1
+
+        suit = _TILE_SUITS[tile]
+        self._indexes[suit] += _TILE_WEIGHTS[tile]
+        self._rows[suit] = None  # Looked up again by shanten, hands often change many times between two calls
+        self._shanten = None
+
+    def remove(self, tile: int):
+        """
+        Removes a tile from the hand
+        :param tile: Tile id (0-33)
+        :return: N/A
+        """
+        if self.tiles[tile] == 0:
+            raise ValueError(f"Tile {tile} is not in the hand")
+
+        self.tiles[tile] -= 1
+        self.num_tiles -= 1
+
+        suit = _TILE_SUITS[tile]
+        self._indexes[suit] -= _TILE_WEIGHTS[tile]
+        self._rows[suit] = None
+        self._shanten = None
+
+    def copy(self) -> 'IncrementalShanten':
+        """
+        :return: Independent copy, the cached rows are shared since they are never modified
+        """
+        ret = object.__new__(IncrementalShanten)
+        ret.tiles = self.tiles[:]
+        ret.num_tiles = self.num_tiles
+        ret._indexes = self._indexes[:]
+        ret._rows = self._rows[:]
+        ret._shanten = self._shanten
+        ret._shanten_len_div3 = self._shanten_len_div3
+        return ret
+
+    def key(self) -> tuple[int, int, int, int]:
+        """
+        :return: Tile Hash of each suit, same as waits.hand_key on self.tiles
+        """
+        return self._indexes[0], self._indexes[1], self._indexes[2], self._indexes[3]
+
+    def shanten(self, len_div3: int = None) -> int:
+        """
+        Calculates the shanten of the hand, same as calc_all on self.tiles
+        :param len_div3: ???, defaults to the number of tiles // 3
+        :return: Hand Shanten
+        """
+        if len_div3 is None:
+            len_div3 = self.num_tiles // 3
+
+        if self._shanten is not None and self._shanten_len_div3 == len_div3:
+            return self._shanten
+
+        rows = self._rows
+        for suit in range(4):
+            if rows[suit] is None:
+                rows[suit] = _suhai_row(self._indexes[suit]) if suit < 3 else _jihai_row(self._indexes[suit])
+
+        ret = list(rows[0])
+        _add_suhai(ret, rows[1], len_div3)
+        _add_suhai(ret, rows[2], len_div3)
+        _add_jihai(ret, rows[3], len_div3)
+        shanten = ret[5 + len_div3] - 1
+
+        if len_div3 >= 4 and shanten > 0:
+            # Chiitoi and kokushi, counted here rather than on every add and remove
+            tiles = self.tiles
+            pairs = sum(i >= 2 for i in tiles)
+            kinds = sum(i > 0 for i in tiles)
+            shanten = min(shanten, 7 - pairs + max(7 - kinds, 0) - 1)
+            if shanten > 0:
+                kokushi = [tiles[i] for i in _KOKUSHI_TILES]
+                shanten = min(shanten, 14 - sum(i > 0 for i in kokushi) - any(i >= 2 for i in kokushi) - 1)
+
+        self._shanten = shanten
+        self._shanten_len_div3 = len_div3
+        return shanten
+
+
+_SUHAI_WEIGHTS = 5 ** np.arange(8, -1, -1, dtype=np.int64)
+_JIHAI_WEIGHTS = 5 ** np.arange(6, -1, -1, dtype=np.int64)
+_KOKUSHI_TILES = [0, 8, 9, 17, 18, 26, 27, 28, 29, 30, 31, 32, 33]
+
+
+def _add_suhai_batch(lhs: np.ndarray, tab: np.ndarray) -> np.ndarray:
+    """
+    Batched version of _add_suhai, computes every column as if m = 4
+    Each column only depends on the columns before the update, so the result for a smaller m is the same
+    :param lhs: (N, 10) partial results
+    :param tab: (N, 10) table rows to add
+    :return: (N, 10) new partial results
+    """
+    ret = np.empty_like(lhs)
+
+    for j in range(5, 10):
+        sht = np.minimum(lhs[:, j] + tab[:, 0], lhs[:, 0] + tab[:, j])
+        for k in range(5, j):
+            sht = np.minimum(sht, np.minimum(lhs[:, k] + tab[:, j - k], lhs[:, j - k] + tab[:, k]))
+        ret[:, j] = sht
+
+    for j in range(5):
+        sht = lhs[:, j] + tab[:, 0]
+        for k in range(0, j):
+            sht = np.minimum(sht, lhs[:, k] + tab[:, j - k])
+        ret[:, j] = sht
+
+    return ret
+
+
+def calc_normal_batch(tiles: np.ndarray, len_div3: np.ndarray) -> np.ndarray:
+    """
+    Batched version of calc_normal
+    :param tiles: (N, 34) array of tile counts
+    :param len_div3: (N,) array of len_div3 values
+    :return: (N,) array of shanten to make a normal hand
+    """
+    if _SUHAI_ARRAY is None:
+        load_tables()
+
+    tiles = tiles.astype(np.int64)
+
+    ret = _SUHAI_ARRAY[tiles[:, 0:9] @ _SUHAI_WEIGHTS]
+    ret = _add_suhai_batch(ret, _SUHAI_ARRAY[tiles[:, 9:18] @ _SUHAI_WEIGHTS])
+    ret = _add_suhai_batch(ret, _SUHAI_ARRAY[tiles[:, 18:27] @ _SUHAI_WEIGHTS])
+
+    # Jihai only needs the final column, which _add_suhai_batch computes the same way _add_jihai does
+    ret = _add_suhai_batch(ret, _JIHAI_ARRAY[tiles[:, 27:] @ _JIHAI_WEIGHTS])
+
+    return np.take_along_axis(ret, (5 + len_div3)[:, None], axis=1)[:, 0].astype(np.int8) - 1
+
+
+def calc_chiitoi_batch(tiles: np.ndarray) -> np.ndarray:
+    """
+    Batched version of calc_chiitoi
+    :param tiles: (N, 34) array of tile counts
+    :return: (N,) array of shanten to make a chiitoi hand
+    """
+    pairs = (tiles >= 2).sum(axis=1, dtype=np.int8)
+    kinds = (tiles > 0).sum(axis=1, dtype=np.int8)
+
+    return 7 - pairs + np.maximum(7 - kinds, 0) - 1
+
+
+def calc_kokushi_batch(tiles: np.ndarray) -> np.ndarray:
+    """
+    Batched version of calc_kokushi
+    :param tiles: (N, 34) array of tile counts
+    :return: (N,) array of shanten to make a kokushi hand
+    """
+    yaochuu = tiles[:, _KOKUSHI_TILES]
+    pairs = (yaochuu >= 2).any(axis=1).astype(np.int8)
+    kinds = (yaochuu > 0).sum(axis=1, dtype=np.int8)
+
+    return 14 - kinds - pairs - 1
+
+
+def calc_all_batch(tiles: np.ndarray, len_div3: np.ndarray | int = None) -> np.ndarray:
+    """
+    Calculates the shanten of many hands at once, giving the same results as calc_all on each row
+    :param tiles: (N, 34) uint8 array of tile counts
+    :param len_div3: (N,) array or a single value, defaults to the number of tiles in each hand // 3
+    :return: (N,) int8 array of hand shanten
+    """
+    tiles = np.asarray(tiles, dtype=np.uint8)
+    if tiles.ndim != 2 or tiles.shape[1] != 34:
+        raise ValueError(f"Expected an (N, 34) array of tiles, got {tiles.shape}")
+
+    if len_div3 is None:
+        len_div3 = tiles.sum(axis=1, dtype=np.int64) // 3
+    len_div3 = np.broadcast_to(np.asarray(len_div3, dtype=np.int64), (tiles.shape[0],))
+
+    native = backend.get_native()
+    if native is not None:
+        return native.calc_all_batch(np.ascontiguousarray(tiles), np.ascontiguousarray(len_div3, dtype=np.uint8))
+
+    shanten = calc_normal_batch(tiles, len_div3)
+
+    can_be_special = len_div3 >= 4
+    if can_be_special.any():
+        mask = can_be_special & (shanten > 0)
+        shanten = np.where(mask, np.minimum(shanten, calc_chiitoi_batch(tiles)), shanten)
+        mask = can_be_special & (shanten > 0)
+        shanten = np.where(mask, np.minimum(shanten, calc_kokushi_batch(tiles)), shanten)
+
+    return shanten
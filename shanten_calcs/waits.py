@@ -0,0 +1,235 @@
+# Wait calculation built on the per-suit shanten tables
+#
+# A hand is complete when every suit is complete on its own and exactly one suit holds the pair.
+# A suit with n tiles is complete without a pair when n % 3 == 0 and its table row needs 0 tiles for n // 3 melds,
+# and complete with a pair when n % 3 == 2 and its row needs 0 tiles for n // 3 melds and a pair.
+# So the waits of a hand only depend on which tiles complete each suit, which is cached per suit.
+
+import functools
+
+import numpy as np
+
+from . import backend, shanten_calc
+
+_SUIT_SIZES = (9, 9, 9, 7)
+
+# Suit state
+INCOMPLETE = 0
+COMPLETE = 1  # Complete without a pair
+COMPLETE_WITH_PAIR = 2
+
+
+def _suit_counts(index: int, size: int) -> list[int]:
+    """
+    Converts a suit's base 5 index back to its tile counts
+    :param index: Tile Hash of the suit
+    :param size: Number of tiles in the suit (9 or 7)
+    :return: Tile counts of the suit
+    """
+    counts = [0 for _ in range(size)]
+    for i in range(size - 1, -1, -1):
+        index, counts[i] = divmod(index, 5)
+    return counts
+
+
+def _suit_state(index: int, is_jihai: bool, num_tiles: int) -> int:
+    """
+    Checks if a suit is complete on its own
+    :param index: Tile Hash of the suit
+    :param is_jihai: Whether the suit is the honors
+    :param num_tiles: Number of tiles in the suit
+    :return: INCOMPLETE, COMPLETE or COMPLETE_WITH_PAIR
+    """
+    tab = shanten_calc._jihai_row(index) if is_jihai else shanten_calc._suhai_row(index)
+
+    if num_tiles % 3 == 0 and tab[num_tiles // 3] == 0:
+        return COMPLETE
+    elif num_tiles % 3 == 2 and tab[5 + num_tiles // 3] == 0:
+        return COMPLETE_WITH_PAIR
+    return INCOMPLETE
+
+
+@functools.lru_cache(maxsize=None)
+def suit_waits(suit: int, index: int) -> tuple[int, int, int, int, tuple[int, int]]:
+    """
+    Per-suit wait table, filled in as suits are seen
+    The number of distinct suits is bounded by the size of the shanten tables, so this is never evicted
+    :param suit: 0-2 for man/pin/sou, 3 for honors
+    :param index: Tile Hash of the suit
+    :return: State of the suit, bitmask of tiles (relative to the suit) that make the suit COMPLETE,
+        bitmask of tiles that make the suit COMPLETE_WITH_PAIR, number of tiles in the suit,
+        (number of kinds held exactly twice, number of kinds held once or three or more times) for chiitoi
+    """
+    if shanten_calc._SUHAI_BUF is None:
+        shanten_calc.load_tables()
+
+    is_jihai = suit == 3
+    size = _SUIT_SIZES[suit]
+    counts = _suit_counts(index, size)
+    num_tiles = sum(counts)
+
+    waits_complete = 0
+    waits_with_pair = 0
+    weight = 1
+    for i in range(size - 1, -1, -1):
+        if counts[i] < 4:
+            state = _suit_state(index + weight, is_jihai, num_tiles + 1)
+            if state == COMPLETE:
+                waits_complete |= 1 << i
+            elif state == COMPLETE_WITH_PAIR:
+                waits_with_pair |= 1 << i
+        weight *= 5
+
+    pairs = sum(c == 2 for c in counts)
+    others = sum(c != 0 and c != 2 for c in counts)
+
+    return (_suit_state(index, is_jihai, num_tiles), waits_complete, waits_with_pair, num_tiles,
+            (pairs, others))
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _hand_waits(key: tuple[int, int, int, int]) -> tuple[int, ...]:
+    """
+    Calculates the waits of a hand from the Tile Hashes of its suits
+    Cached, see wait_cache_info
+    :param key: Tile Hash of the man, pin, sou and honor tiles
+    :return: Tiles (0-33) that complete the hand
+    """
+    suits = [suit_waits(i, key[i]) for i in range(4)]
+
+    waits = []
+    for i in range(4):
+        # Every other suit must already be complete, with at most one of them holding the pair
+        others_pairs = 0
+        for j in range(4):
+            if j == i:
+                continue
+            elif suits[j][0] == INCOMPLETE:
+                break
+            others_pairs += suits[j][0] == COMPLETE_WITH_PAIR
+        else:
+            if others_pairs == 0:
+                mask = suits[i][2]
+            elif others_pairs == 1:
+                mask = suits[i][1]
+            else:
+                mask = 0
+
+            base = i * 9
+            while mask:
+                low = mask & -mask
+                waits.append(base + low.bit_length() - 1)
+                mask ^= low
+
+    # Chiitoi: six pairs and a single tile, waiting on the single
+    if sum(s[3] for s in suits) == 13 and sum(s[4][0] for s in suits) == 6 and sum(s[4][1] for s in suits) == 1:
+        for i in range(4):
+            counts = _suit_counts(key[i], _SUIT_SIZES[i])
+            if 1 in counts:
+                single = i * 9 + counts.index(1)
+                if single not in waits:
+                    waits.append(single)
+                    waits.sort()
+                break
+
+    return tuple(waits)
+
+
+def hand_key(tehai: list[int]) -> tuple[int, int, int, int]:
+    """
+    Canonical key of a hand, the Tile Hash of each of its suits
+    :param tehai: Full Array of tiles
+    :return: Key
+    """
+    return (shanten_calc._sum_tiles(tehai[0:9]), shanten_calc._sum_tiles(tehai[9:18]),
+            shanten_calc._sum_tiles(tehai[18:27]), shanten_calc._sum_tiles(tehai[27:]))
+
+
+def hand_key_add(key: tuple[int, int, int, int], tile: int, count: int = 1) -> tuple[int, int, int, int]:
+    """
+    Key of a hand after adding copies of a tile, without going back to the Full Array
+    :param key: Hand key, see hand_key
+    :param tile: Tile id (0-33)
+    :param count: Number of copies to add, negative to remove
+    :return: Same as hand_key on the changed hand
+    """
+    suit = shanten_calc._TILE_SUITS[tile]
+    ret = list(key)
+    ret[suit] += count * shanten_calc._TILE_WEIGHTS[tile]
+    return ret[0], ret[1], ret[2], ret[3]
+
+
+def hand_from_key(key: tuple[int, int, int, int]) -> list[int]:
+    """
+    Inverse of hand_key
+    :param key: Hand key
+    :return: Full Array of tiles
+    """
+    return (_suit_counts(key[0], 9) + _suit_counts(key[1], 9) + _suit_counts(key[2], 9) +
+            _suit_counts(key[3], 7))
+
+
+def get_hand_waits(tehai: list[int]) -> list[int]:
+    """
+    Gets the tiles that complete the hand
+    :param tehai: Full Array of tiles
+    :return: Tiles (0-33) that complete the hand, in ascending order
+    """
+    return list(_hand_waits(hand_key(tehai)))
+
+
+def get_hand_waits_from_key(key: tuple[int, int, int, int]) -> list[int]:
+    """
+    Same as get_hand_waits, for callers that already have the hand key (ex: IncrementalShanten)
+    :param key: Hand key, see hand_key
+    :return: Tiles (0-33) that complete the hand, in ascending order
+    """
+    return list(_hand_waits(key))
+
+
+def get_hand_wait_mask_from_key(key: tuple[int, int, int, int]) -> int:
+    """
+    Same as get_hand_waits_from_key, as a bitmask
+    :param key: Hand key, see hand_key
+    :return: Bit i set when tile i (0-33) completes the hand
+    """
+    mask = 0
+    for tile in _hand_waits(key):
+        mask |= 1 << tile
+    return mask
+
+
+def get_hand_waits_batch(tiles: np.ndarray) -> np.ndarray:
+    """
+    Gets the waits of many hands at once
+    :param tiles: (N, 34) array of tile counts
+    :return: (N, 34) bool array, True where the tile completes the hand
+    """
+    tiles = np.asarray(tiles, dtype=np.uint8)
+    if tiles.ndim != 2 or tiles.shape[1] != 34:
+        raise ValueError(f"Expected an (N, 34) array of tiles, got {tiles.shape}")
+
+    native = backend.get_native()
+    if native is not None:
+        len_div3 = (tiles.sum(axis=1, dtype=np.int64) // 3).astype(np.uint8)
+        return native.waits_batch(np.ascontiguousarray(tiles), len_div3)
+
+    ret = np.zeros(tiles.shape, dtype=bool)
+    for i, row in enumerate(tiles.tolist()):
+        ret[i, list(_hand_waits(hand_key(row)))] = True
+    return ret
+
+
+def wait_cache_info():
+    """
+    :return: Hits, misses, max size and current size of the wait cache
+    """
+    return _hand_waits.cache_info()
+
+
+def wait_cache_clear():
+    """
+    Empties the wait cache and resets its counters
+    :return: N/A
+    """
+    _hand_waits.cache_clear()